@@ -0,0 +1,59 @@
+"""Add a FULLTEXT-searchable text projection to permanent chat records."""
+
+import json
+
+from alembic import op
+
+revision = "0017_add_permanent_records_fulltext"
+down_revision = "0016_add_ai_schedule_daily_limit"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 200
+
+
+def _backfill_search_text() -> None:
+    from modules.core.chat_records import build_permanent_search_text
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.exec_driver_sql(
+            "SELECT id, conversation_snapshot FROM permanent_chat_records "
+            "WHERE id > %s ORDER BY id ASC LIMIT %s",
+            (last_id, BACKFILL_BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            break
+        for record_id, snapshot in rows:
+            if isinstance(snapshot, bytes):
+                snapshot = snapshot.decode("utf-8")
+            try:
+                messages = json.loads(snapshot) if isinstance(snapshot, str) else snapshot
+            except (TypeError, ValueError):
+                messages = []
+            bind.exec_driver_sql(
+                "UPDATE permanent_chat_records SET search_text = %s WHERE id = %s",
+                (build_permanent_search_text(messages), record_id),
+            )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE `permanent_chat_records` "
+        "ADD COLUMN `search_text` MEDIUMTEXT NULL DEFAULT NULL AFTER `summary`"
+    )
+    _backfill_search_text()
+    op.execute(
+        "ALTER TABLE `permanent_chat_records` "
+        "ADD FULLTEXT INDEX `ftx_permanent_search_text` (`search_text`) WITH PARSER ngram"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "ALTER TABLE `permanent_chat_records` "
+        "DROP INDEX `ftx_permanent_search_text`, "
+        "DROP COLUMN `search_text`"
+    )
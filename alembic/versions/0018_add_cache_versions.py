@@ -0,0 +1,23 @@
+"""Add per-key version counters for cross-process cache invalidation."""
+
+from alembic import op
+
+revision = "0018_add_cache_versions"
+down_revision = "0017_add_permanent_records_fulltext"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE TABLE IF NOT EXISTS `cache_versions` (
+  `topic` VARCHAR(64) NOT NULL,
+  `cache_key` VARCHAR(64) NOT NULL DEFAULT '',
+  `version` BIGINT UNSIGNED NOT NULL DEFAULT 1,
+  `updated_at` TIMESTAMP(3) NOT NULL DEFAULT CURRENT_TIMESTAMP(3) ON UPDATE CURRENT_TIMESTAMP(3),
+  PRIMARY KEY (`topic`, `cache_key`),
+  INDEX `idx_cache_versions_updated` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci""")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `cache_versions`")
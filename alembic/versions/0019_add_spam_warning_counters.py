@@ -0,0 +1,23 @@
+"""Add persisted sliding-window spam warning counters."""
+
+from alembic import op
+
+revision = "0019_add_spam_warning_counters"
+down_revision = "0018_add_cache_versions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE TABLE IF NOT EXISTS `spam_warning_counters` (
+  `group_id` BIGINT NOT NULL,
+  `user_id` BIGINT NOT NULL,
+  `buckets` VARCHAR(255) NOT NULL,
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`group_id`, `user_id`),
+  INDEX `idx_spam_warning_counters_updated` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci""")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `spam_warning_counters`")
@@ -0,0 +1,21 @@
+"""Add shared command cooldown state for multi-instance deployments."""
+
+from alembic import op
+
+revision = "0020_add_command_cooldowns"
+down_revision = "0019_add_spam_warning_counters"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE TABLE IF NOT EXISTS `command_cooldowns` (
+  `cooldown_key` VARCHAR(128) NOT NULL,
+  `expires_at` DOUBLE NOT NULL,
+  PRIMARY KEY (`cooldown_key`),
+  INDEX `idx_command_cooldowns_expires` (`expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci""")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `command_cooldowns`")
@@ -0,0 +1,46 @@
+"""Add resumable broadcast jobs, per-target delivery state and unreachable chats."""
+
+from alembic import op
+
+revision = "0021_add_broadcasts"
+down_revision = "0020_add_command_cooldowns"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE TABLE IF NOT EXISTS `broadcast_jobs` (
+  `id` BIGINT NOT NULL AUTO_INCREMENT,
+  `text` TEXT NOT NULL,
+  `status` VARCHAR(16) NOT NULL DEFAULT 'collecting',
+  `report_chat_id` BIGINT NOT NULL,
+  `report_message_id` BIGINT NULL,
+  `total` INT NOT NULL DEFAULT 0,
+  `sent` INT NOT NULL DEFAULT 0,
+  `failed` INT NOT NULL DEFAULT 0,
+  `blocked` INT NOT NULL DEFAULT 0,
+  `created_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`),
+  INDEX `idx_broadcast_jobs_status` (`status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci""")
+    op.execute("""CREATE TABLE IF NOT EXISTS `broadcast_targets` (
+  `job_id` BIGINT NOT NULL,
+  `chat_id` BIGINT NOT NULL,
+  `status` VARCHAR(16) NOT NULL DEFAULT 'pending',
+  `error` VARCHAR(255) NULL,
+  PRIMARY KEY (`job_id`, `chat_id`),
+  INDEX `idx_broadcast_targets_status` (`job_id`, `status`, `chat_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci""")
+    op.execute("""CREATE TABLE IF NOT EXISTS `broadcast_unreachable_chats` (
+  `chat_id` BIGINT NOT NULL,
+  `reason` VARCHAR(255) NULL,
+  `marked_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`chat_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci""")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `broadcast_unreachable_chats`")
+    op.execute("DROP TABLE IF EXISTS `broadcast_targets`")
+    op.execute("DROP TABLE IF EXISTS `broadcast_jobs`")
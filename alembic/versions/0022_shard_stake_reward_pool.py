@@ -0,0 +1,24 @@
+"""Split the stake reward pool balance across shard rows."""
+
+from alembic import op
+
+revision = "0022_shard_stake_reward_pool"
+down_revision = "0021_add_broadcasts"
+branch_labels = None
+depends_on = None
+
+POOL_SHARDS = 16
+
+
+def upgrade() -> None:
+    values = ", ".join(f"({shard_id}, 0)" for shard_id in range(1, POOL_SHARDS + 1))
+    op.execute(f"INSERT IGNORE INTO `stake_reward_pool` (`id`, `balance`) VALUES {values}")
+
+
+def downgrade() -> None:
+    op.execute(
+        "UPDATE `stake_reward_pool` AS p "
+        "JOIN (SELECT SUM(`balance`) AS total FROM `stake_reward_pool`) AS s "
+        "SET p.`balance` = s.total WHERE p.`id` = 1"
+    )
+    op.execute("DELETE FROM `stake_reward_pool` WHERE `id` <> 1")
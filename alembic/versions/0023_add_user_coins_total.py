@@ -0,0 +1,30 @@
+"""Add an indexed generated coins_total column for the /rich leaderboard.
+
+A STORED generated column cannot be added in place: MySQL rebuilds the whole
+``user`` table (ALGORITHM=COPY) and blocks writes to it for the duration. On a
+large table run this in a maintenance window, or apply it with an online schema
+change tool, before rolling out the code that reads ``coins_total``.
+"""
+
+from alembic import op
+
+revision = "0023_add_user_coins_total"
+down_revision = "0022_shard_stake_reward_pool"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE `user` "
+        "ADD COLUMN `coins_total` BIGINT AS (`coins` + `coins_paid`) STORED, "
+        "ADD INDEX `idx_user_coins_total` (`coins_total`, `id`)"
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        "ALTER TABLE `user` "
+        "DROP INDEX `idx_user_coins_total`, "
+        "DROP COLUMN `coins_total`"
+    )
@@ -0,0 +1,22 @@
+"""Add a single-row table holding precomputed staking totals."""
+
+from alembic import op
+
+revision = "0024_add_stake_aggregates"
+down_revision = "0023_add_user_coins_total"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE TABLE IF NOT EXISTS `stake_aggregates` (
+  `id` TINYINT NOT NULL,
+  `total_coins` BIGINT NOT NULL DEFAULT 0,
+  `total_staked` BIGINT NOT NULL DEFAULT 0,
+  `refreshed_at` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci""")
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `stake_aggregates`")
@@ -1,13 +1,16 @@
 import logging
 
+from telegram import Update
 from telegram.ext import ApplicationBuilder
 from telegram.request import HTTPXRequest
 
 from core import config
 from features.conversation.lifecycle import post_init
+from core.outbound_scheduler import OutboundScheduler
 from core.telegram_history import HistoryTrackingExtBot, flush_all_pending_events
 
 from .handler_registry import register_handlers
+from .webhook_ingress import run_webhook
 
 
 async def _flush_telegram_history_on_stop(application) -> None:
@@ -30,6 +33,7 @@ def create_application():
             write_timeout=config.TELEGRAM_GET_UPDATES_WRITE_TIMEOUT,
             pool_timeout=config.TELEGRAM_GET_UPDATES_POOL_TIMEOUT,
         ),
+        rate_limiter=OutboundScheduler() if config.TELEGRAM_OUTBOUND_PACING else None,
     )
     application = (
         ApplicationBuilder()
@@ -45,8 +49,15 @@ def create_application():
 
 
 def run() -> None:
+    if config.TELEGRAM_UPDATE_MODE == "webhook":
+        run_webhook(create_application)
+        return
     application = create_application()
     try:
-        application.run_polling(timeout=config.TELEGRAM_GET_UPDATES_TIMEOUT)
+        # chat_member 更新默认不下发，需显式订阅，管理员缓存靠它失效
+        application.run_polling(
+            timeout=config.TELEGRAM_GET_UPDATES_TIMEOUT,
+            allowed_updates=Update.ALL_TYPES,
+        )
     except KeyboardInterrupt:
         logging.info("Bot shutdown requested by keyboard interrupt.")
@@ -5,9 +5,10 @@
 交错的，而 `tests/test_handler_registry.py` 把最终顺序当作契约。
 """
 
-from telegram.ext import CommandHandler
+from telegram.ext import ChatMemberHandler, CommandHandler
 
-from features.admin import developer
+from core import cache_invalidation, command_cooldown, stake_reward_pool, telegram_utils
+from features.admin import broadcast, developer
 from features.admin.announce import admin_announce
 from features.ai import idle_followup, scheduler, translate_handlers
 from features.conversation import handlers as conversation
@@ -53,9 +54,11 @@ def register_core_command_handlers(application) -> None:
     application.add_handler(CommandHandler("github", profile.github_command))
     application.add_handler(CommandHandler("clear", clear_command))
     application.add_handler(CommandHandler("admin_announce", admin_announce))
+    broadcast.setup_broadcast_jobs(application)
     application.add_handler(CommandHandler("setmyinfo", profile.setmyinfo_command))
     application.add_handler(CommandHandler("give", give_command))
     bribe.setup_bribe_command(application)
+    command_cooldown.setup_cooldown_jobs(application)
 
 
 def register_monitoring_handlers(application) -> None:
@@ -79,6 +82,7 @@ def register_membership_handlers(application) -> None:
 
 def register_staking_and_crypto_handlers(application) -> None:
     stake_coin.setup_stake_handlers(application)
+    stake_reward_pool.setup_pool_jobs(application)
     crypto_predict.setup_crypto_predict_handlers(application)
     swap_fogmoe_solana_token.setup_swap_handler(application)
 
@@ -90,6 +94,15 @@ def register_translation_handlers(application) -> None:
 def register_moderation_handlers(application) -> None:
     keyword_handler.setup_keyword_handlers(application)
     spam_control.setup_spam_control_handlers(application)
+    cache_invalidation.setup_cache_invalidation_jobs(application)
+    # 管理员变动时丢掉共享的管理员名单缓存；单独分组，不挡住其他成员变动处理器
+    application.add_handler(
+        ChatMemberHandler(
+            telegram_utils.refresh_admin_cache_on_member_update,
+            chat_member_types=ChatMemberHandler.ANY_CHAT_MEMBER,
+        ),
+        group=-90,
+    )
 
 
 def register_game_and_recharge_handlers(application) -> None:
@@ -0,0 +1,204 @@
+"""Webhook 入口：主进程收 HTTP 更新，按会话分发给本机的多个工作进程。
+
+- 主进程只做 aiohttp 接收、校验 secret token、取路由键（见 core.update_routing），
+  不解析成 Update，也不跑任何 handler；
+- 每个工作进程各自构建完整的 Application（handler、job、缓存都在进程内），从自己的
+  队列按顺序取更新放进 ``application.update_queue``。同一会话只会进同一个进程，
+  入队顺序就是到达顺序，会话锁、私聊批处理窗口和待写历史缓冲照常工作；
+- 工作进程退出前走完 stop → post_stop → shutdown，待写历史照样落库。
+
+工作进程挂掉时，发给它的更新返回 503，Telegram 会稍后重投。
+"""
+
+import asyncio
+import hmac
+import logging
+import multiprocessing
+import signal
+import threading
+from urllib.parse import urlsplit
+
+from aiohttp import web
+from telegram import Bot, Update
+
+from core import config, update_routing
+from core.bot_logging import configure_logging
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+WORKER_QUEUE_SIZE = 10000  # 每个工作进程积压的更新上限，满了返回 503
+WORKER_STOP_TIMEOUT = 30  # 等工作进程收尾的秒数
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateRouter:
+    """把原始更新放进负责该会话的工作进程队列。"""
+
+    def __init__(self, queues, *, secret_token=None, is_alive=None):
+        self._queues = list(queues)
+        self._secret_token = secret_token or ""
+        self._is_alive = is_alive or (lambda index: True)
+
+    @property
+    def worker_count(self):
+        return len(self._queues)
+
+    def authorized(self, headers):
+        if not self._secret_token:
+            return True
+        return hmac.compare_digest(headers.get(SECRET_TOKEN_HEADER, ""), self._secret_token)
+
+    def dispatch(self, data):
+        """返回接收该更新的工作进程号；进程不可用或队列已满时返回 None。"""
+        index = update_routing.worker_for_key(
+            update_routing.routing_key(data), self.worker_count
+        )
+        if not self._is_alive(index):
+            return None
+        try:
+            # 同步入队，中间没有 await，到达顺序即入队顺序
+            self._queues[index].put_nowait(data)
+        except Exception as e:
+            logger.warning(f"更新 {data.get('update_id')} 入队失败: {e}")
+            return None
+        return index
+
+    async def handle(self, request):
+        if not self.authorized(request.headers):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(data, dict):
+            return web.Response(status=400)
+        if self.dispatch(data) is None:
+            return web.Response(status=503)
+        return web.Response()
+
+
+def _pump_updates(updates, loop, application, finished):
+    """读队列的线程：按顺序把更新交给事件循环，收到 None 时结束。
+
+    单条更新解析或投递失败只记日志跳过；线程无论怎样退出都会置位 ``finished``，
+    让工作进程走完正常的停止流程。
+    """
+    try:
+        while (data := updates.get()) is not None:
+            try:
+                loop.call_soon_threadsafe(
+                    application.update_queue.put_nowait,
+                    Update.de_json(data, application.bot),
+                )
+            except Exception:
+                logger.exception(f"跳过无法处理的更新 {data.get('update_id')}")
+    finally:
+        try:
+            loop.call_soon_threadsafe(finished.set)
+        except RuntimeError:
+            # 事件循环已经关闭，没有人在等
+            pass
+
+
+async def serve_updates(application, updates):
+    """按 run_polling 的生命周期运行 Application，更新改从 ``updates`` 队列读取。"""
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        finished = asyncio.Event()
+        threading.Thread(
+            target=_pump_updates,
+            args=(updates, asyncio.get_running_loop(), application, finished),
+            name="webhook-update-pump",
+            daemon=True,
+        ).start()
+        await finished.wait()
+    finally:
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+
+
+def _worker_main(index, count, updates, application_factory):
+    # 停止由主进程发送 None 触发，Ctrl+C 只交给主进程处理
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging()
+    update_routing.configure_worker(index, count)
+    asyncio.run(serve_updates(application_factory(), updates))
+
+
+async def _serve_ingress(router):
+    webhook_url = config.TELEGRAM_WEBHOOK_URL
+    async with Bot(config.TELEGRAM_BOT_TOKEN) as bot:
+        # chat_member 更新默认不下发，需显式订阅，管理员缓存靠它失效
+        await bot.set_webhook(
+            webhook_url,
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=config.TELEGRAM_WEBHOOK_SECRET_TOKEN,
+        )
+
+    app = web.Application()
+    app.router.add_post(urlsplit(webhook_url).path or "/", router.handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, config.TELEGRAM_WEBHOOK_LISTEN, config.TELEGRAM_WEBHOOK_PORT)
+    await site.start()
+    logger.info(
+        f"Webhook 入口已监听 {config.TELEGRAM_WEBHOOK_LISTEN}:{config.TELEGRAM_WEBHOOK_PORT}，"
+        f"工作进程 {router.worker_count} 个"
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+def run_webhook(application_factory):
+    """启动工作进程与 HTTP 入口，直到收到 SIGINT/SIGTERM。"""
+    if not config.TELEGRAM_WEBHOOK_URL:
+        raise RuntimeError("TELEGRAM_UPDATE_MODE=webhook 需要配置 TELEGRAM_WEBHOOK_URL")
+
+    count = config.TELEGRAM_WEBHOOK_WORKERS
+    # spawn：工作进程从头 import，不继承主进程的事件循环与连接池
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue(WORKER_QUEUE_SIZE) for _ in range(count)]
+    processes = [
+        context.Process(
+            target=_worker_main,
+            args=(index, count, queues[index], application_factory),
+            name=f"bot-worker-{index}",
+        )
+        for index in range(count)
+    ]
+    for process in processes:
+        process.start()
+
+    router = UpdateRouter(
+        queues,
+        secret_token=config.TELEGRAM_WEBHOOK_SECRET_TOKEN,
+        is_alive=lambda index: processes[index].is_alive(),
+    )
+    try:
+        asyncio.run(_serve_ingress(router))
+    finally:
+        for updates in queues:
+            updates.put(None)
+        for process in processes:
+            process.join(WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning(f"{process.name} 未按时退出，强制结束")
+                process.terminate()
+
+
+__all__ = ["UpdateRouter", "run_webhook", "serve_updates"]
@@ -1,8 +1,12 @@
 import json
+import tempfile
 import time
 from typing import Any
 
-from .telegram_utils import send_document_bytes
+from .telegram_utils import send_document_bytes, send_document_file
+
+# 超过这个大小的归档落到临时文件，内存里只留一个缓冲区
+ARCHIVE_SPOOL_MAX_MEMORY_BYTES = 1024 * 1024
 
 
 def build_jsonl_bytes(records: list[dict]) -> bytes:
@@ -14,23 +18,114 @@ def build_jsonl_bytes(records: list[dict]) -> bytes:
     return payload.encode("utf-8")
 
 
+def _raw_json_value(value: Any) -> str:
+    """快照本来就是 json.dumps 写进库的单行 JSON，校验能解析后原样嵌入，省掉重新序列化。
+
+    解析不了的（被截断或手工改坏的行）按字符串编码，不会弄坏整份 JSONL。
+    """
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    if isinstance(value, str):
+        text = value.strip()
+        if text[:1] in ("[", "{") and "\n" not in text:
+            try:
+                json.loads(text)
+            except ValueError:
+                pass
+            else:
+                return text
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class PermanentRecordsArchive:
+    """被裁剪的永久记录，逐行写进 SpooledTemporaryFile 的 JSONL 归档。
+
+    行格式与 build_jsonl_bytes 一致；空归档为假值，可以直接沿用
+    ``if archived_records:`` 的判断。
+    """
+
+    def __init__(self) -> None:
+        self._file = None
+        self.record_count = 0
+
+    def __bool__(self) -> bool:
+        return self.record_count > 0
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def add_row(
+        self,
+        record_id: int,
+        created_at: Any,
+        summary: Any,
+        conversation_snapshot: Any,
+    ) -> None:
+        if self._file is None:
+            self._file = tempfile.SpooledTemporaryFile(
+                max_size=ARCHIVE_SPOOL_MAX_MEMORY_BYTES,
+                mode="w+b",
+            )
+        if isinstance(summary, bytes):
+            summary = summary.decode("utf-8")
+        created_text = created_at.isoformat(sep=" ") if created_at else None
+        line = (
+            f'{{"record_id": {int(record_id)}, '
+            f'"created_at": {json.dumps(created_text)}, '
+            f'"summary": {json.dumps(summary, ensure_ascii=False)}, '
+            f'"conversation_snapshot": {_raw_json_value(conversation_snapshot)}}}\n'
+        )
+        self._file.write(line.encode("utf-8"))
+        self.record_count += 1
+
+    def open_for_read(self):
+        """返回倒回开头的文件对象；空归档返回 None。"""
+        if self._file is None:
+            return None
+        self._file.flush()
+        self._file.seek(0)
+        return self._file
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
 async def send_permanent_records_archive(
     bot: Any,
     user_id: int,
-    archived_records: list[dict],
+    archived_records: "list[dict] | PermanentRecordsArchive",
     *,
     logger=None,
 ) -> bool:
     if not archived_records:
         return False
 
+    timestamp = time.strftime("%Y%m%d_%H%M%S")
+    filename = f"permanent_records_archive_{user_id}_{timestamp}.jsonl"
+    caption = "你的永久记忆已超过上限，最旧的记录已打包成JSONL文件发给你。服务器存不下了，请自行保存处理。可以通过 /shop 购买更多永久记忆空间！"
+
+    if isinstance(archived_records, PermanentRecordsArchive):
+        try:
+            file_obj = archived_records.open_for_read()
+            if file_obj is None:
+                return False
+            return await send_document_file(
+                bot,
+                user_id,
+                file_obj,
+                filename,
+                caption=caption,
+                logger=logger,
+            )
+        finally:
+            archived_records.close()
+
     payload = build_jsonl_bytes(archived_records)
     if not payload:
         return False
 
-    timestamp = time.strftime("%Y%m%d_%H%M%S")
-    filename = f"permanent_records_archive_{user_id}_{timestamp}.jsonl"
-    caption = "你的永久记忆已超过上限，最旧的记录已打包成JSONL文件发给你。服务器存不下了，请自行保存处理。可以通过 /shop 购买更多永久记忆空间！"
     return await send_document_bytes(
         bot,
         user_id,
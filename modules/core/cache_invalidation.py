@@ -0,0 +1,159 @@
+"""进程内缓存失效总线。
+
+群管配置、图表代币绑定这类表只有 bot 自己写。缓存因此不设过期时间，由写入方在
+改完库之后发布一条失效消息，订阅者丢掉或替换对应条目即可。
+
+多实例部署时打开 `CACHE_INVALIDATION_POLL_SECONDS`：发布同时把 `cache_versions`
+表里对应 (topic, key) 的版本号加一，各实例定时轮询，发现别人改过的版本就在本地
+触发同样的失效。
+"""
+
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from typing import Any, Callable
+
+from . import config
+from .sql import execute, fetch_all
+
+InvalidationCallback = Callable[[str | None], None]
+
+# 空串表示整个 topic 失效
+_ALL_KEYS = ""
+
+# 增量轮询时从水位往回多读这么久：updated_at 在语句执行时取值，提交却可能更晚，
+# 晚提交的行时间戳会落在已推进的水位之前。回读的行靠版本号去重
+CACHE_INVALIDATION_WATERMARK_MARGIN_SECONDS = 30
+
+_subscribers: dict[str, list[InvalidationCallback]] = defaultdict(list)
+_remote_versions: dict[tuple[str, str], int] = {}
+_remote_watermark: Any = None
+_remote_baseline_loaded = False
+
+
+def _key_text(key: Any) -> str:
+    return _ALL_KEYS if key is None else str(key)
+
+
+def subscribe(topic: str, callback: InvalidationCallback) -> None:
+    """订阅 topic；callback 收到失效的 key（字符串），None 表示全部。"""
+    callbacks = _subscribers[topic]
+    if callback not in callbacks:
+        callbacks.append(callback)
+
+
+def unsubscribe(topic: str, callback: InvalidationCallback) -> None:
+    callbacks = _subscribers.get(topic)
+    if callbacks and callback in callbacks:
+        callbacks.remove(callback)
+
+
+def notify(topic: str, key: Any = None) -> None:
+    """只在本进程内触发失效。"""
+    key_text = _key_text(key)
+    for callback in list(_subscribers.get(topic, ())):
+        try:
+            callback(key_text or None)
+        except Exception:  # pragma: no cover - defensive logging
+            logging.exception("缓存失效回调出错: topic=%s key=%s", topic, key_text)
+
+
+def cross_process_enabled() -> bool:
+    return config.CACHE_INVALIDATION_POLL_SECONDS > 0
+
+
+async def publish(topic: str, key: Any = None, *, notify_local: bool = True) -> None:
+    """发布失效。
+
+    写入方已经在本地换好新值时传 ``notify_local=False``，只通知其他实例。
+    跨进程通道写失败只记日志：本进程的缓存已经是新的，其他实例最迟在
+    下一次成功发布后跟上。
+    """
+    if notify_local:
+        notify(topic, key)
+    if not cross_process_enabled():
+        return
+    try:
+        await execute(
+            "INSERT INTO cache_versions (topic, cache_key, version) VALUES (%s, %s, 1) "
+            "ON DUPLICATE KEY UPDATE version = version + 1",
+            (topic, _key_text(key)),
+        )
+    except Exception as exc:
+        logging.warning("发布跨进程缓存失效失败: topic=%s key=%s err=%s", topic, key, exc)
+
+
+async def poll_remote_invalidations() -> int:
+    """拉取其他实例发布的版本变化并在本地失效，返回触发的条数。
+
+    第一次轮询只记基线，不触发失效。按 updated_at 水位增量读取，并往回多读
+    ``CACHE_INVALIDATION_WATERMARK_MARGIN_SECONDS`` 秒，接住乱序提交的行；
+    重复读到的行版本号没变，不会再次触发。
+    """
+    global _remote_watermark, _remote_baseline_loaded
+    if _remote_watermark is None:
+        rows = await fetch_all(
+            "SELECT topic, cache_key, version, updated_at FROM cache_versions"
+        )
+    else:
+        rows = await fetch_all(
+            "SELECT topic, cache_key, version, updated_at FROM cache_versions "
+            "WHERE updated_at >= %s",
+            (
+                _remote_watermark
+                - timedelta(seconds=CACHE_INVALIDATION_WATERMARK_MARGIN_SECONDS),
+            ),
+        )
+
+    changed = 0
+    for topic, cache_key, version, updated_at in rows or []:
+        entry = (topic, cache_key or _ALL_KEYS)
+        known = _remote_versions.get(entry)
+        _remote_versions[entry] = int(version)
+        if updated_at is not None and (
+            _remote_watermark is None or updated_at > _remote_watermark
+        ):
+            _remote_watermark = updated_at
+        if not _remote_baseline_loaded or known == int(version):
+            continue
+        notify(topic, cache_key or None)
+        changed += 1
+    _remote_baseline_loaded = True
+    return changed
+
+
+async def _poll_remote_invalidations_job(context) -> None:
+    try:
+        await poll_remote_invalidations()
+    except Exception as exc:
+        logging.warning("轮询跨进程缓存失效失败: %s", exc)
+
+
+def setup_cache_invalidation_jobs(application) -> None:
+    """多实例时注册版本号轮询；单实例不注册任何任务。"""
+    if not cross_process_enabled():
+        return
+    application.job_queue.run_repeating(
+        _poll_remote_invalidations_job,
+        interval=config.CACHE_INVALIDATION_POLL_SECONDS,
+        first=0,
+    )
+
+
+def reset_remote_state() -> None:
+    global _remote_watermark, _remote_baseline_loaded
+    _remote_versions.clear()
+    _remote_watermark = None
+    _remote_baseline_loaded = False
+
+
+__all__ = [
+    "cross_process_enabled",
+    "notify",
+    "poll_remote_invalidations",
+    "publish",
+    "reset_remote_state",
+    "setup_cache_invalidation_jobs",
+    "subscribe",
+    "unsubscribe",
+]
@@ -5,19 +5,25 @@
 """
 
 import json
+import logging
 from datetime import datetime, timezone
 from typing import Any
 
 from . import config
+from .archive_utils import PermanentRecordsArchive
 from .litellm_models import litellm_model_name
-from .prompt_utils import format_metadata_attrs, xml_escape
-from .sql import execute, fetch_all, fetch_one, transaction
+from .prompt_utils import format_metadata_attrs, remove_xml_tags, xml_escape
+from .sql import after_commit, execute, fetch_all, fetch_one, transaction
 from .token_estimator import estimate_conversation_tokens
 
 PERMANENT_RECORDS_KEEP = 100
+PERMANENT_PRUNE_CHUNK_SIZE = 200
+PERMANENT_SEARCH_SKIPPED_ORIGINS = ("history_state", "idle_recap")
 COIN_SERVICE_STATE_SUSPENDED = "suspended"
 COIN_SERVICE_STATE_RESUMED = "resumed"
 
+logger = logging.getLogger(__name__)
+
 
 def _configured_chat_models_for_provider(provider: str) -> list[str]:
     provider_name = (provider or "").strip().lower()
@@ -68,6 +74,52 @@ def _is_coin_service_state_event(message: object) -> bool:
     return 'origin="coin_service"' in content and 'service_state="' in content
 
 
+def _unescape_xml_text(value: str) -> str:
+    return (
+        value.replace("&lt;", "<")
+        .replace("&gt;", ">")
+        .replace("&quot;", '"')
+        .replace("&apos;", "'")
+        .replace("&amp;", "&")
+    )
+
+
+def build_permanent_search_text(messages: Any) -> str:
+    """把快照投影成 FULLTEXT 检索用的纯文本：只留 user/assistant 正文，去掉 metadata 标签。"""
+    if not isinstance(messages, list):
+        return ""
+    lines: list[str] = []
+    for message in messages:
+        if not isinstance(message, dict):
+            continue
+        if message.get("role") not in ("user", "assistant"):
+            continue
+        content = message.get("content")
+        if not isinstance(content, str) or not content:
+            continue
+        if any(
+            f'origin="{origin}"' in content
+            for origin in PERMANENT_SEARCH_SKIPPED_ORIGINS
+        ):
+            continue
+        text = " ".join(_unescape_xml_text(remove_xml_tags(content)).split())
+        if text:
+            lines.append(text)
+    return "\n".join(lines)
+
+
+def permanent_search_boolean_query(query: str) -> str:
+    """把空白分隔的关键词拼成 BOOLEAN MODE 查询，任一关键词命中即可。
+
+    每个词按短语匹配：ngram 分词后短语要求 n-gram 连续出现，贴近字面包含语义。
+    """
+    terms: list[str] = []
+    for term in str(query or "").replace('"', " ").split():
+        if term not in terms:
+            terms.append(term)
+    return " ".join(f'"{term}"' for term in terms)
+
+
 def _assistant_tool_call_ids(message: dict) -> list[str]:
     if message.get("role") != "assistant":
         return []
@@ -247,65 +299,105 @@ async def _get_user_permanent_records_limit(
     return max(1, value)
 
 
-async def prune_permanent_records(
+async def _prune_permanent_chunk(
     user_id: int,
+    cutoff: tuple[Any, int],
+    chunk_size: int,
     *,
     connection,
-    keep: int | None = None,
-) -> list[dict]:
-    if keep is None:
-        keep = await _get_user_permanent_records_limit(user_id, connection=connection)
-    keep = max(1, int(keep))
-
+) -> list:
+    """删除分界之前最旧的一块，返回删掉的行；由调用方在提交后写进归档。"""
+    cutoff_created_at, cutoff_id = cutoff
     rows = await fetch_all(
         """
         SELECT id, created_at, summary, conversation_snapshot
         FROM permanent_chat_records
         WHERE user_id = %s
-        ORDER BY created_at DESC, id DESC
-        LIMIT %s OFFSET %s
+          AND (created_at < %s OR (created_at = %s AND id < %s))
+        ORDER BY created_at ASC, id ASC
+        LIMIT %s
+        FOR UPDATE
         """,
-        (user_id, keep, keep),
+        (user_id, cutoff_created_at, cutoff_created_at, cutoff_id, chunk_size),
         connection=connection,
     )
     if not rows:
         return []
 
-    record_ids: list[int] = []
-    records: list[dict] = []
-    for row in rows:
-        record_id, created_at, summary_text, snapshot_text = row
-        record_ids.append(record_id)
+    # 块内是当前最旧的一段，按键范围删到块尾即可，不用拼 IN 列表
+    last_id, last_created_at = rows[-1][0], rows[-1][1]
+    await connection.exec_driver_sql(
+        "DELETE FROM permanent_chat_records "
+        "WHERE user_id = %s AND (created_at < %s OR (created_at = %s AND id <= %s))",
+        (user_id, last_created_at, last_created_at, last_id),
+    )
+    return rows
 
-        if isinstance(summary_text, bytes):
-            summary_text = summary_text.decode("utf-8")
 
-        snapshot_value = snapshot_text
-        if isinstance(snapshot_value, bytes):
-            snapshot_value = snapshot_value.decode("utf-8")
-        if isinstance(snapshot_value, str):
-            try:
-                snapshot_value = json.loads(snapshot_value)
-            except (TypeError, ValueError, json.JSONDecodeError):
-                pass
-
-        records.append(
-            {
-                "record_id": record_id,
-                "created_at": created_at.isoformat(sep=" ") if created_at else None,
-                "summary": summary_text,
-                "conversation_snapshot": snapshot_value,
-            }
-        )
+def _archive_rows(archive: PermanentRecordsArchive, rows) -> None:
+    for record_id, created_at, summary_text, snapshot_text in rows:
+        archive.add_row(record_id, created_at, summary_text, snapshot_text)
 
-    placeholders = ", ".join(["%s"] * len(record_ids))
-    await connection.exec_driver_sql(
-        f"DELETE FROM permanent_chat_records WHERE user_id = %s AND id IN ({placeholders})",
-        (user_id, *record_ids),
-    )
 
-    records.reverse()
-    return records
+async def prune_permanent_records(
+    user_id: int,
+    *,
+    connection=None,
+    keep: int | None = None,
+    chunk_size: int = PERMANENT_PRUNE_CHUNK_SIZE,
+) -> PermanentRecordsArchive:
+    """删除超出上限的最旧永久记录，返回逐行写好的 JSONL 归档。
+
+    先用一次索引查找定位第 keep 新的 (created_at, id) 作为分界，再从最旧端
+    按块导出并按键范围删除，积压多少都能一次清完；快照按库里的原始 JSON
+    文本直接写进归档，不再解析成对象。
+
+    不传 ``connection`` 时每块各用一个短事务，行锁只持有到这一块删完；每块提交
+    之后才写进归档，中途出错就停下并返回已经提交删除的部分，剩下的留给下次裁剪。
+    写聊天记录的调用方在自己的事务提交后再调用。传入 ``transaction()`` 的连接时，
+    删掉的行等该事务提交后才写进归档，调用方须在提交后再读取归档。
+    """
+    if keep is None:
+        keep = await _get_user_permanent_records_limit(user_id, connection=connection)
+    keep = max(1, int(keep))
+    chunk_size = max(1, int(chunk_size))
+
+    archive = PermanentRecordsArchive()
+    cutoff = await fetch_one(
+        """
+        SELECT created_at, id
+        FROM permanent_chat_records
+        WHERE user_id = %s
+        ORDER BY created_at DESC, id DESC
+        LIMIT 1 OFFSET %s
+        """,
+        (user_id, keep - 1),
+        connection=connection,
+    )
+    if not cutoff:
+        return archive
+    cutoff = tuple(cutoff)
+
+    while True:
+        if connection is not None:
+            rows = await _prune_permanent_chunk(
+                user_id, cutoff, chunk_size, connection=connection
+            )
+            if not after_commit(connection, lambda rows=rows: _archive_rows(archive, rows)):
+                _archive_rows(archive, rows)
+        else:
+            try:
+                async with transaction() as chunk_connection:
+                    rows = await _prune_permanent_chunk(
+                        user_id, cutoff, chunk_size, connection=chunk_connection
+                    )
+            except Exception as e:
+                logger.warning(f"裁剪永久记录中断 user_id={user_id}: {e}")
+                break
+            _archive_rows(archive, rows)
+        if len(rows) < chunk_size:
+            break
+    return archive
 
 
 def _coerce_message_entry(role: str, content: Any) -> dict:
@@ -451,10 +543,11 @@ async def insert_chat_records(
     system_prompt_extra: str | None = None,
     allow_zero_balance: bool = False,
     suspend_if_zero: bool = False,
+    known_total_coins: int | None = None,
 ):
     snapshot_created = False
     warning_level = None
-    archived_records: list[dict] = []
+    archived_records: PermanentRecordsArchive | list[dict] = []
     near_limit_inserted = False
 
     message_entries = [
@@ -483,10 +576,14 @@ async def insert_chat_records(
         if not isinstance(messages, list):
             messages = []
 
-        total_coins = await _get_history_user_total_coins(
-            int(conversation_id),
-            connection=connection,
-        )
+        if known_total_coins is None:
+            total_coins = await _get_history_user_total_coins(
+                int(conversation_id),
+                connection=connection,
+            )
+        else:
+            # 调用方刚在扣费事务里拿到余额，不再回查 user 表
+            total_coins = known_total_coins
         coin_service_state = _last_coin_service_state(messages)
         zero_balance_transition = False
 
@@ -605,12 +702,13 @@ async def insert_chat_records(
             ]
             snapshot_value = json.dumps(archived_messages, ensure_ascii=False)
             await connection.exec_driver_sql(
-                "INSERT INTO permanent_chat_records (user_id, conversation_snapshot) VALUES (%s, %s)",
-                (conversation_id, snapshot_value),
-            )
-            archived_records = await prune_permanent_records(
-                conversation_id,
-                connection=connection,
+                "INSERT INTO permanent_chat_records "
+                "(user_id, conversation_snapshot, search_text) VALUES (%s, %s, %s)",
+                (
+                    conversation_id,
+                    snapshot_value,
+                    build_permanent_search_text(archived_messages),
+                ),
             )
             snapshot_created = True
 
@@ -646,13 +744,16 @@ async def insert_chat_records(
                     (conversation_id, json.dumps(messages, ensure_ascii=False)),
                 )
 
+    if snapshot_created:
+        # 新快照提交后再裁剪，裁剪的行锁不压在上面这个事务里
+        archived_records = await prune_permanent_records(conversation_id)
     return snapshot_created, warning_level, archived_records
 
 
 async def archive_chat_and_start_new_session(
     conversation_id: int,
     records: list[tuple[str, Any]],
-) -> tuple[int, list[dict]]:
+) -> tuple[int, PermanentRecordsArchive]:
     """把当前会话及收尾记录整体归档，并把活跃历史重置为 new_session。"""
     final_entries = [_coerce_message_entry(role, content) for role, content in records]
 
@@ -679,9 +780,9 @@ async def archive_chat_and_start_new_session(
         messages, _ = _sanitize_messages_with_tool_pairs(messages)
         snapshot_value = json.dumps(messages, ensure_ascii=False)
         insert_result = await connection.exec_driver_sql(
-            "INSERT INTO permanent_chat_records (user_id, conversation_snapshot) "
-            "VALUES (%s, %s)",
-            (conversation_id, snapshot_value),
+            "INSERT INTO permanent_chat_records "
+            "(user_id, conversation_snapshot, search_text) VALUES (%s, %s, %s)",
+            (conversation_id, snapshot_value, build_permanent_search_text(messages)),
         )
         record_id = getattr(insert_result, "lastrowid", None)
         if not record_id:
@@ -717,11 +818,7 @@ async def archive_chat_and_start_new_session(
                 (conversation_id, new_session_json),
             )
 
-        archived_records = await prune_permanent_records(
-            conversation_id,
-            connection=connection,
-        )
-
+    archived_records = await prune_permanent_records(conversation_id)
     return int(record_id), archived_records
 
 
@@ -761,8 +858,13 @@ async def append_permanent_chat_record(
         messages, _ = _sanitize_messages_with_tool_pairs(messages)
         await connection.exec_driver_sql(
             "UPDATE permanent_chat_records SET conversation_snapshot = %s, "
-            "summary = NULL WHERE id = %s AND user_id = %s",
-            (json.dumps(messages, ensure_ascii=False), record_id, user_id),
+            "search_text = %s, summary = NULL WHERE id = %s AND user_id = %s",
+            (
+                json.dumps(messages, ensure_ascii=False),
+                build_permanent_search_text(messages),
+                record_id,
+                user_id,
+            ),
         )
 
 
@@ -806,6 +908,7 @@ async def async_insert_chat_records(
     system_prompt_extra: str | None = None,
     allow_zero_balance: bool = False,
     suspend_if_zero: bool = False,
+    known_total_coins: int | None = None,
 ):
     return await insert_chat_records(
         conversation_id,
@@ -813,6 +916,7 @@ async def async_insert_chat_records(
         system_prompt_extra=system_prompt_extra,
         allow_zero_balance=allow_zero_balance,
         suspend_if_zero=suspend_if_zero,
+        known_total_coins=known_total_coins,
     )
 
 
@@ -1,84 +1,168 @@
-import time
-import logging
+"""命令与聊天冷却。
+
+冷却状态放在可替换的后端里，键是 ``cmd:{user_id}:{command}`` 或 ``chat:{user_id}``：
+
+- MemoryCooldownBackend（默认）：只在事件循环里读写，不加锁；检查和占用之间
+  没有 await，天然原子。过期条目挂在 core.expiry_wheel 的时间轮上，清理只碰
+  已经到期的桶，摊还 O(过期条目数)，不再每小时扫全表。
+- SqlCooldownBackend：多实例共享冷却，状态存 command_cooldowns 表（迁移 0020），
+  由 COMMAND_COOLDOWN_BACKEND=mysql 开启。
+"""
+
 import functools
-from threading import RLock
+import logging
+import time
+from abc import ABC, abstractmethod
+
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from . import config, update_routing
+from .expiry_wheel import ExpiryWheel
+from .sql import execute, fetch_one
+
 # 命令冷却时间（秒）
 COOLDOWN_TIME = 1.0
 # 聊天回复冷却时间（秒）
 CHAT_COOLDOWN_TIME = 1.0
+# 时间轮每个桶的宽度（秒）
+EXPIRY_WHEEL_TICK_SECONDS = 1.0
+# 共享后端清理过期行的间隔（秒）
+SQL_COOLDOWN_PRUNE_INTERVAL = 3600
+
+
+class CooldownBackend(ABC):
+    """冷却存储接口。"""
+
+    @abstractmethod
+    async def acquire(self, key: str, seconds: float) -> float:
+        """冷却已过则占用 ``seconds`` 秒并返回 0，否则返回剩余秒数。"""
+
+    async def prune(self) -> int:
+        """清理过期状态，返回清掉的条目数。"""
+        return 0
+
+
+class MemoryCooldownBackend(CooldownBackend):
+    def __init__(self, *, tick_seconds=EXPIRY_WHEEL_TICK_SECONDS, clock=time.monotonic):
+        self._wheel = ExpiryWheel(tick_seconds)
+        self._clock = clock
+
+    def __len__(self):
+        return len(self._wheel)
+
+    def try_acquire(self, key, seconds):
+        now = self._clock()
+        self._wheel.pop_due(now)
+        expires_at = self._wheel.get(key)
+        if expires_at is not None:
+            return expires_at - now
+        self._wheel.schedule(key, now + seconds)
+        return 0.0
+
+    async def acquire(self, key, seconds):
+        return self.try_acquire(key, seconds)
+
+    async def prune(self):
+        return len(self._wheel.pop_due(self._clock()))
+
+
+class SqlCooldownBackend(CooldownBackend):
+    """多实例共享的冷却：先条件更新，行不存在时再插入，两步都是原子的。"""
+
+    async def acquire(self, key, seconds):
+        now = time.time()
+        expires_at = now + seconds
+        updated = await execute(
+            "UPDATE command_cooldowns SET expires_at = %s "
+            "WHERE cooldown_key = %s AND expires_at <= %s",
+            (expires_at, key, now),
+        )
+        if updated:
+            return 0.0
+        inserted = await execute(
+            "INSERT IGNORE INTO command_cooldowns (cooldown_key, expires_at) VALUES (%s, %s)",
+            (key, expires_at),
+        )
+        if inserted:
+            return 0.0
+        row = await fetch_one(
+            "SELECT expires_at FROM command_cooldowns WHERE cooldown_key = %s",
+            (key,),
+        )
+        return max(0.0, float(row[0]) - now) if row else 0.0
+
+    async def prune(self):
+        return await execute(
+            "DELETE FROM command_cooldowns WHERE expires_at < %s LIMIT 10000",
+            (time.time(),),
+        )
+
+
+def _backend_from_config():
+    if config.COMMAND_COOLDOWN_BACKEND == "mysql":
+        return SqlCooldownBackend()
+    return MemoryCooldownBackend()
 
-# 使用线程安全的字典存储用户的命令使用时间
-# 格式: {user_id: {command_name: last_use_time}}
-command_cooldowns = {}
-# 新增: 聊天回复冷却时间字典
-# 格式: {user_id: last_chat_time}
-chat_cooldowns = {}
-cooldown_lock = RLock()  # 使用可重入锁以确保线程安全
 
-# 维护垃圾回收计时器
-last_cleanup_time = time.time()
-CLEANUP_INTERVAL = 3600  # 1小时清理一次过期数据
+_backend: CooldownBackend = _backend_from_config()
+
+
+def get_cooldown_backend() -> CooldownBackend:
+    return _backend
+
+
+def set_cooldown_backend(backend: CooldownBackend) -> None:
+    global _backend
+    _backend = backend
+
+
+async def _acquire_or_allow(key, seconds):
+    try:
+        return await _backend.acquire(key, seconds)
+    except Exception as e:
+        # 共享后端不可用时放行，冷却只是限流，不应挡住命令本身
+        logging.warning(f"冷却后端出错，本次放行: {e}")
+        return 0.0
+
 
 def cooldown(func):
     """
     命令冷却装饰器，为所有命令添加冷却时间
-    
+
     用法:
     @cooldown
     async def some_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         ...
     """
     command_name = func.__name__
-    
+
     @functools.wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         # 获取用户ID
         user_id = update.effective_user.id if update.effective_user else None
-        
+
         # 没有用户ID的情况（如系统消息）直接执行
         if not user_id:
             return await func(update, context, *args, **kwargs)
-        
-        # 检查是否需要清理过期数据
-        global last_cleanup_time
-        current_time = time.time()
-        if current_time - last_cleanup_time > CLEANUP_INTERVAL:
-            cleanup_expired_cooldowns()
-            last_cleanup_time = current_time
-        
-        # 检查用户是否在冷却期
-        with cooldown_lock:
-            user_cooldowns = command_cooldowns.get(user_id, {})
-            last_used = user_cooldowns.get(command_name, 0)
-            
-            if current_time - last_used < COOLDOWN_TIME:
-                # 用户在冷却期内
-                remaining = COOLDOWN_TIME - (current_time - last_used)
-                
-                # 避免频繁回复 - 只有冷却时间超过0.5秒时才提示
-                if remaining > 0.5:
-                    try:
-                        await update.message.reply_text(
-                            f"请稍等片刻再使用此命令 ({remaining:.1f}秒)。\n"
-                            f"Please wait a moment before using this command again ({remaining:.1f}s)."
-                        )
-                    except Exception as e:
-                        # 如果回复失败（例如消息已删除），则静默忽略
-                        logging.debug(f"无法发送冷却提示: {str(e)}")
-                        
-                return None  # 不执行命令
-            
-            # 更新用户的命令使用时间
-            if user_id not in command_cooldowns:
-                command_cooldowns[user_id] = {}
-            command_cooldowns[user_id][command_name] = current_time
-        
+
+        remaining = await _acquire_or_allow(f"cmd:{user_id}:{command_name}", COOLDOWN_TIME)
+        if remaining > 0:
+            # 避免频繁回复 - 只有冷却时间超过0.5秒时才提示
+            if remaining > 0.5:
+                try:
+                    await update.message.reply_text(
+                        f"请稍等片刻再使用此命令 ({remaining:.1f}秒)。\n"
+                        f"Please wait a moment before using this command again ({remaining:.1f}s)."
+                    )
+                except Exception as e:
+                    # 如果回复失败（例如消息已删除），则静默忽略
+                    logging.debug(f"无法发送冷却提示: {str(e)}")
+            return None  # 不执行命令
+
         # 执行原始命令
         return await func(update, context, *args, **kwargs)
-    
+
     return wrapper
 
 async def check_chat_cooldown(update: Update) -> bool:
@@ -87,81 +171,46 @@ async def check_chat_cooldown(update: Update) -> bool:
     返回True表示可以继续，False表示在冷却期内
     """
     user_id = update.effective_user.id if update.effective_user else None
-    
+
     # 没有用户ID的情况直接允许
     if not user_id:
         return True
-        
-    current_time = time.time()
-    
-    # 检查是否需要清理过期数据
-    global last_cleanup_time
-    if current_time - last_cleanup_time > CLEANUP_INTERVAL:
-        cleanup_expired_cooldowns()
-        last_cleanup_time = current_time
-    
-    # 检查用户是否在聊天冷却期
-    with cooldown_lock:
-        last_chat_time = chat_cooldowns.get(user_id, 0)
-        
-        if current_time - last_chat_time < CHAT_COOLDOWN_TIME:
-            # 用户在冷却期内
-            remaining = CHAT_COOLDOWN_TIME - (current_time - last_chat_time)
-            
-            # 避免频繁回复 - 只有冷却时间超过0.5秒时才提示
-            if remaining > 0.5:
-                try:
-                    effective_message = update.message or update.edited_message
-                    if effective_message:
-                        await effective_message.reply_text(
-                            f"请不要过于频繁地发送消息 ({remaining:.1f}秒)。\n"
-                            f"Please don't send messages too frequently ({remaining:.1f}s)."
-                        )
-                except Exception as e:
-                    # 如果回复失败，则静默忽略
-                    logging.debug(f"无法发送聊天冷却提示: {str(e)}")
-                    
-            return False  # 在冷却期内
-        
-        # 更新用户的最后聊天时间
-        chat_cooldowns[user_id] = current_time
-        
+
+    remaining = await _acquire_or_allow(f"chat:{user_id}", CHAT_COOLDOWN_TIME)
+    if remaining <= 0:
         return True  # 允许聊天
 
-def cleanup_expired_cooldowns():
-    """清理过期的冷却数据以避免内存泄漏"""
-    now = time.time()
-    expired_threshold = now - 3600  # 1小时前的数据视为过期
-    
-    with cooldown_lock:
-        # 清理命令冷却数据
-        users_to_remove = []
-        for user_id, commands in command_cooldowns.items():
-            # 检查该用户的所有命令是否都已过期
-            all_expired = True
-            for cmd, last_time in list(commands.items()):
-                if last_time > expired_threshold:
-                    all_expired = False
-                    break
-            
-            if all_expired:
-                users_to_remove.append(user_id)
-        
-        # 删除过期用户命令数据
-        for user_id in users_to_remove:
-            del command_cooldowns[user_id]
-        
-        # 清理聊天冷却数据
-        chat_users_to_remove = []
-        for user_id, last_time in chat_cooldowns.items():
-            if last_time < expired_threshold:
-                chat_users_to_remove.append(user_id)
-        
-        # 删除过期用户聊天数据
-        for user_id in chat_users_to_remove:
-            del chat_cooldowns[user_id]
-    
-    logging.debug(
-        f"冷却系统清理完成，移除了 {len(users_to_remove)} 个命令用户和 "
-        f"{len(chat_users_to_remove)} 个聊天用户的过期数据"
+    # 避免频繁回复 - 只有冷却时间超过0.5秒时才提示
+    if remaining > 0.5:
+        try:
+            effective_message = update.message or update.edited_message
+            if effective_message:
+                await effective_message.reply_text(
+                    f"请不要过于频繁地发送消息 ({remaining:.1f}秒)。\n"
+                    f"Please don't send messages too frequently ({remaining:.1f}s)."
+                )
+        except Exception as e:
+            # 如果回复失败，则静默忽略
+            logging.debug(f"无法发送聊天冷却提示: {str(e)}")
+    return False  # 在冷却期内
+
+async def _prune_cooldowns_job(context) -> None:
+    # 删的是共享表里的过期行，webhook 多进程时只由 0 号进程执行
+    if not update_routing.is_primary_worker():
+        return
+    try:
+        removed = await _backend.prune()
+    except Exception as e:
+        logging.warning(f"清理共享冷却数据失败: {e}")
+        return
+    logging.debug(f"冷却系统清理完成，移除了 {removed} 条过期数据")
+
+def setup_cooldown_jobs(application) -> None:
+    """共享后端需要定期删过期行；内存后端在读写时顺手清理，不注册任务。"""
+    if not isinstance(_backend, SqlCooldownBackend):
+        return
+    application.job_queue.run_repeating(
+        _prune_cooldowns_job,
+        interval=SQL_COOLDOWN_PRUNE_INTERVAL,
+        first=SQL_COOLDOWN_PRUNE_INTERVAL,
     )
@@ -51,6 +51,14 @@ class AppSettings(BaseSettings):
     TELEGRAM_GET_UPDATES_READ_TIMEOUT: float = 35.0
     TELEGRAM_GET_UPDATES_WRITE_TIMEOUT: float = 30.0
     TELEGRAM_GET_UPDATES_POOL_TIMEOUT: float = 10.0
+    TELEGRAM_UPDATE_MODE: str = "polling"
+    TELEGRAM_WEBHOOK_URL: str | None = None
+    TELEGRAM_WEBHOOK_LISTEN: str = "0.0.0.0"
+    TELEGRAM_WEBHOOK_PORT: int = Field(default=8443, ge=1, le=65535)
+    TELEGRAM_WEBHOOK_SECRET_TOKEN: str | None = None
+    TELEGRAM_WEBHOOK_WORKERS: int = Field(default=1, ge=1, le=64)
+    TELEGRAM_WEBHOOK_LOCK_CONNECTIONS: int = Field(default=8, ge=1, le=64)
+    TELEGRAM_OUTBOUND_PACING: bool = True
 
     OPENAI_API_KEY: str | None = None
     OPENAI_BASE_URL: str | None = None
@@ -134,6 +142,13 @@ class AppSettings(BaseSettings):
     CHAT_BATCH_WINDOW_SECONDS: float = 1.0
     TELEGRAM_HISTORY_RATE_WINDOW_SECONDS: float = Field(default=0.5, gt=0, le=60)
     TELEGRAM_HISTORY_RATE_MAX_EVENTS: int = Field(default=8, ge=1, le=100)
+    PERMANENT_RECORDS_SEARCH_MODE: str = "scan"
+    CACHE_INVALIDATION_POLL_SECONDS: float = Field(default=0.0, ge=0, le=3600)
+    SPAM_WARNING_RESTRICT_THRESHOLD: int = Field(default=0, ge=0, le=100)
+    SPAM_WARNING_RESTRICT_MINUTES: int = Field(default=60, ge=1, le=10080)
+    SPAM_WARNING_PERSIST: bool = False
+    COMMAND_COOLDOWN_BACKEND: str = "memory"
+    USER_PROFILE_CACHE_TTL_SECONDS: float = Field(default=300.0, ge=0, le=86400)
 
     JUDGE0_API_URL: str = "https://ce.judge0.com"
     JUDGE0_API_KEY: str | None = None
@@ -223,6 +238,17 @@ TELEGRAM_GET_UPDATES_CONNECT_TIMEOUT = SETTINGS.TELEGRAM_GET_UPDATES_CONNECT_TIM
 TELEGRAM_GET_UPDATES_READ_TIMEOUT = SETTINGS.TELEGRAM_GET_UPDATES_READ_TIMEOUT
 TELEGRAM_GET_UPDATES_WRITE_TIMEOUT = SETTINGS.TELEGRAM_GET_UPDATES_WRITE_TIMEOUT
 TELEGRAM_GET_UPDATES_POOL_TIMEOUT = SETTINGS.TELEGRAM_GET_UPDATES_POOL_TIMEOUT
+# polling：单进程长轮询；webhook：主进程收更新，按会话分给 TELEGRAM_WEBHOOK_WORKERS 个工作进程
+TELEGRAM_UPDATE_MODE = SETTINGS.TELEGRAM_UPDATE_MODE.strip().lower()
+TELEGRAM_WEBHOOK_URL = SETTINGS.TELEGRAM_WEBHOOK_URL
+TELEGRAM_WEBHOOK_LISTEN = SETTINGS.TELEGRAM_WEBHOOK_LISTEN
+TELEGRAM_WEBHOOK_PORT = SETTINGS.TELEGRAM_WEBHOOK_PORT
+TELEGRAM_WEBHOOK_SECRET_TOKEN = SETTINGS.TELEGRAM_WEBHOOK_SECRET_TOKEN
+TELEGRAM_WEBHOOK_WORKERS = SETTINGS.TELEGRAM_WEBHOOK_WORKERS
+# 多进程时每个工作进程为跨进程会话锁单独保留的数据库连接数，也是同时进行的 AI 对话上限
+TELEGRAM_WEBHOOK_LOCK_CONNECTIONS = SETTINGS.TELEGRAM_WEBHOOK_LOCK_CONNECTIONS
+# 出站请求按 Telegram 限额主动排队（全局约 30 条/秒，私聊 1 条/秒，群组 20 条/分钟）
+TELEGRAM_OUTBOUND_PACING = SETTINGS.TELEGRAM_OUTBOUND_PACING
 OPENAI_API_KEY = SETTINGS.OPENAI_API_KEY
 OPENAI_BASE_URL = SETTINGS.OPENAI_BASE_URL
 OPENAI_CHAT_MODEL = SETTINGS.OPENAI_CHAT_MODEL
@@ -308,6 +334,19 @@ CHAT_CONTEXT_SAFETY_TOKENS = SETTINGS.CHAT_CONTEXT_SAFETY_TOKENS
 CHAT_BATCH_WINDOW_SECONDS = SETTINGS.CHAT_BATCH_WINDOW_SECONDS
 TELEGRAM_HISTORY_RATE_WINDOW_SECONDS = SETTINGS.TELEGRAM_HISTORY_RATE_WINDOW_SECONDS
 TELEGRAM_HISTORY_RATE_MAX_EVENTS = SETTINGS.TELEGRAM_HISTORY_RATE_MAX_EVENTS
+# scan：在 Python 里逐条扫描快照；fulltext：关键词检索走 0017 迁移建立的 ngram FULLTEXT 索引
+PERMANENT_RECORDS_SEARCH_MODE = SETTINGS.PERMANENT_RECORDS_SEARCH_MODE.strip().lower()
+# 0 表示单实例，缓存失效只在进程内传播；多实例时按这个间隔轮询 cache_versions 表
+CACHE_INVALIDATION_POLL_SECONDS = SETTINGS.CACHE_INVALIDATION_POLL_SECONDS
+# 一小时窗口内被警告达到这个次数就自动禁言，0 表示只警告不处罚
+SPAM_WARNING_RESTRICT_THRESHOLD = SETTINGS.SPAM_WARNING_RESTRICT_THRESHOLD
+SPAM_WARNING_RESTRICT_MINUTES = SETTINGS.SPAM_WARNING_RESTRICT_MINUTES
+# 把警告计数定期写入 spam_warning_counters 表（迁移 0019），重启后不清零
+SPAM_WARNING_PERSIST = SETTINGS.SPAM_WARNING_PERSIST
+# memory：冷却只在本进程内；mysql：多实例共享，存 0020 迁移建立的 command_cooldowns 表
+COMMAND_COOLDOWN_BACKEND = SETTINGS.COMMAND_COOLDOWN_BACKEND.strip().lower()
+# 用户权限、好感度、印象等字段的进程内缓存有效期，0 表示不缓存
+USER_PROFILE_CACHE_TTL_SECONDS = SETTINGS.USER_PROFILE_CACHE_TTL_SECONDS
 
 JUDGE0_API_URL = SETTINGS.JUDGE0_API_URL
 JUDGE0_API_KEY = SETTINGS.JUDGE0_API_KEY
@@ -1,13 +1,19 @@
 import asyncio
+import logging
 from contextlib import asynccontextmanager
-from typing import Any, AsyncIterator, Iterable, Optional
+from typing import Any, AsyncIterator, Callable, Iterable, Optional
 
 from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
 
 from . import config
 
 _ENGINE: Optional[AsyncEngine] = None
+_LOCK_ENGINE: Optional[AsyncEngine] = None
 _MAIN_LOOP: Optional[asyncio.AbstractEventLoop] = None
+# {id(事务连接): [提交后回调]}，只在 transaction() 持有连接期间存在
+_AFTER_COMMIT: dict[int, list[Callable[[], None]]] = {}
+
+logger = logging.getLogger(__name__)
 
 
 def get_engine() -> AsyncEngine:
@@ -24,6 +30,21 @@ def get_engine() -> AsyncEngine:
     return _ENGINE
 
 
+def get_lock_engine() -> AsyncEngine:
+    """长时间持有命名锁用的独立小连接池，不和业务查询抢主连接池。"""
+    global _LOCK_ENGINE
+    if _LOCK_ENGINE is None:
+        _LOCK_ENGINE = create_async_engine(
+            config.SQLALCHEMY_DATABASE_URI,
+            pool_pre_ping=True,
+            pool_recycle=config.MYSQL_POOL_RECYCLE,
+            pool_size=config.TELEGRAM_WEBHOOK_LOCK_CONNECTIONS,
+            max_overflow=0,
+            connect_args={"connect_timeout": config.MYSQL_CONNECT_TIMEOUT},
+        )
+    return _LOCK_ENGINE
+
+
 def set_main_loop(loop: asyncio.AbstractEventLoop) -> None:
     global _MAIN_LOOP
     _MAIN_LOOP = loop
@@ -39,8 +60,32 @@ async def connect() -> AsyncIterator[AsyncConnection]:
 @asynccontextmanager
 async def transaction() -> AsyncIterator[AsyncConnection]:
     engine = get_engine()
+    callbacks: list[Callable[[], None]] = []
     async with engine.begin() as connection:
-        yield connection
+        _AFTER_COMMIT[id(connection)] = callbacks
+        try:
+            yield connection
+        finally:
+            _AFTER_COMMIT.pop(id(connection), None)
+    # 走到这里说明 COMMIT 已经返回；回滚或出错时不会执行
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            logger.exception("事务提交后的回调出错")
+
+
+def after_commit(connection, callback: Callable[[], None]) -> bool:
+    """在 ``transaction()`` 开出的事务真正提交后调用 callback。
+
+    connection 不是 ``transaction()`` 给出的（为 None、测试替身或已结束）时返回
+    False，由调用方自行决定立即执行还是放弃。
+    """
+    callbacks = _AFTER_COMMIT.get(id(connection)) if connection is not None else None
+    if callbacks is None:
+        return False
+    callbacks.append(callback)
+    return True
 
 
 def run_sync(coro):
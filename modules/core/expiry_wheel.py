@@ -0,0 +1,73 @@
+"""按到期时间分桶的时间轮。
+
+每个键只挂在一个桶里（重新安排会先从旧桶摘掉），桶号另存一个最小堆。
+``pop_due`` 只弹出已经到期的桶，摊还 O(到期条目数)，不用扫全部条目。
+不加锁，只在事件循环里使用。
+"""
+
+import heapq
+from typing import Any, Hashable
+
+
+class ExpiryWheel:
+    def __init__(self, tick_seconds: float = 1.0) -> None:
+        self._tick = tick_seconds
+        # {key: expires_at}
+        self._expires: dict[Hashable, float] = {}
+        # {桶号: {key, ...}}
+        self._slots: dict[int, set] = {}
+        self._heap: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._expires)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._expires
+
+    def _slot(self, expires_at: float) -> int:
+        return int(expires_at // self._tick)
+
+    def get(self, key: Hashable) -> float | None:
+        return self._expires.get(key)
+
+    def schedule(self, key: Hashable, expires_at: float) -> None:
+        self.discard(key)
+        self._expires[key] = expires_at
+        slot = self._slot(expires_at)
+        keys = self._slots.get(slot)
+        if keys is None:
+            keys = self._slots[slot] = set()
+            heapq.heappush(self._heap, slot)
+        keys.add(key)
+
+    def discard(self, key: Hashable) -> bool:
+        expires_at = self._expires.pop(key, None)
+        if expires_at is None:
+            return False
+        keys = self._slots.get(self._slot(expires_at))
+        if keys is not None:
+            keys.discard(key)
+        return True
+
+    def pop_due(self, now: float) -> list[Any]:
+        """摘下所有 ``expires_at <= now`` 的键，按桶的先后返回。"""
+        current = self._slot(now)
+        due = []
+        while self._heap and self._heap[0] <= current:
+            slot = self._heap[0]
+            keys = self._slots.get(slot, set())
+            ready = [key for key in keys if self._expires[key] <= now]
+            for key in ready:
+                keys.discard(key)
+                del self._expires[key]
+            due.extend(ready)
+            if keys:
+                break  # 当前桶里还有没到点的
+            heapq.heappop(self._heap)
+            self._slots.pop(slot, None)
+        return due
+
+    def clear(self) -> None:
+        self._expires.clear()
+        self._slots.clear()
+        self._heap.clear()
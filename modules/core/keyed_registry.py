@@ -0,0 +1,141 @@
+"""按键（通常是 user_id）分发的锁与状态，闲置即回收。
+
+- KeyedLocks：按键给出 asyncio.Lock，持有或排队的协程计数归零时删掉这个键，
+  锁表只包含正在使用的键；只在事件循环里使用。
+- KeyedState：按键保存任意状态，最近一次访问超过 idle_seconds 的条目在后续访问
+  时顺手丢掉，按访问先后排序，每次只检查最旧的几个，摊还 O(1)。不加锁，跨线程
+  使用时由调用方加锁。
+
+两者都用 ``len()`` 报告当前存活的键数。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class _LockEntry:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class _KeyedLockHandle:
+    __slots__ = ("_registry", "_key", "_entry")
+
+    def __init__(self, registry, key):
+        self._registry = registry
+        self._key = key
+        self._entry = None
+
+    async def __aenter__(self):
+        self._entry = self._registry._checkout(self._key)
+        try:
+            await self._entry.lock.acquire()
+        except BaseException:
+            self._registry._release(self._key, self._entry)
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._entry.lock.release()
+        self._registry._release(self._key, self._entry)
+
+
+class KeyedLocks:
+    def __init__(self) -> None:
+        self._entries: dict[Hashable, _LockEntry] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def hold(self, key: Hashable) -> _KeyedLockHandle:
+        """``async with locks.hold(key):`` 独占这个键。"""
+        return _KeyedLockHandle(self, key)
+
+    def locked(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry.lock.locked()
+
+    def _checkout(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _LockEntry()
+        entry.refs += 1
+        return entry
+
+    def _release(self, key, entry):
+        entry.refs -= 1
+        if entry.refs <= 0 and self._entries.get(key) is entry:
+            del self._entries[key]
+
+    def clear(self) -> None:
+        """只丢掉没人使用的键；正在持有的锁照常释放后自行回收。"""
+        for key in [key for key, entry in self._entries.items() if entry.refs <= 0]:
+            del self._entries[key]
+
+
+class KeyedState:
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        idle_seconds: float,
+        *,
+        clock: Callable[[], float] | None = None,
+    ) -> None:
+        self._factory = factory
+        self.idle_seconds = idle_seconds
+        self._clock = clock
+        # {key: (最近访问时间, 状态)}，按最近访问排序
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def _now(self) -> float:
+        return self._clock() if self._clock is not None else time.monotonic()
+
+    def evict_idle(self, now: float | None = None) -> int:
+        """丢掉闲置超时的条目，返回丢掉的个数。"""
+        now = self._now() if now is None else now
+        evicted = 0
+        while self._entries:
+            key, (last_used, _state) = next(iter(self._entries.items()))
+            if now - last_used < self.idle_seconds:
+                break
+            del self._entries[key]
+            evicted += 1
+        return evicted
+
+    def get(self, key: Hashable) -> Any:
+        """取出并刷新这个键的状态，不存在时用 factory 新建。"""
+        now = self._now()
+        self.evict_idle(now)
+        entry = self._entries.pop(key, None)
+        state = self._factory() if entry is None else entry[1]
+        self._entries[key] = (now, state)
+        return state
+
+    def set(self, key: Hashable, state: Any) -> None:
+        now = self._now()
+        self.evict_idle(now)
+        self._entries.pop(key, None)
+        self._entries[key] = (now, state)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+__all__ = ["KeyedLocks", "KeyedState"]
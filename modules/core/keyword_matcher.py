@@ -0,0 +1,97 @@
+"""多关键词单遍匹配（Aho-Corasick）。
+
+垃圾词、群关键词这类「一大批子串，谁先配置谁优先」的检测，逐个 `word in text`
+的代价随词表线性增长。这里在词表变更时编译一次自动机，之后每条消息只扫一遍，
+命中多个词时返回配置顺序最靠前的那个，和原来逐个检查的结果一致。
+"""
+
+from collections import deque
+from typing import Iterable
+
+_NO_MATCH = -1
+
+
+class KeywordMatcher:
+    """编译好的不可变子串匹配器，线程间可共享。
+
+    ``words`` 的顺序就是优先级；空串和重复词会被忽略。匹配区分大小写，
+    需要忽略大小写时调用方先统一转小写。
+    """
+
+    __slots__ = ("words", "_goto", "_fail", "_best")
+
+    def __init__(self, words: Iterable[str]) -> None:
+        ordered: list[str] = []
+        seen: set[str] = set()
+        for word in words:
+            if not word or word in seen:
+                continue
+            seen.add(word)
+            ordered.append(word)
+        self.words = tuple(ordered)
+
+        goto: list[dict[str, int]] = [{}]
+        best: list[int] = [_NO_MATCH]
+        for index, word in enumerate(self.words):
+            state = 0
+            for char in word:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    best.append(_NO_MATCH)
+                state = next_state
+            if best[state] == _NO_MATCH:
+                best[state] = index
+
+        # BFS 补失配指针，并把后缀链上优先级最高的词合并进每个状态
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(char, 0)
+                fail[next_state] = target if target != next_state else 0
+                inherited = best[fail[next_state]]
+                if inherited != _NO_MATCH and (
+                    best[next_state] == _NO_MATCH or inherited < best[next_state]
+                ):
+                    best[next_state] = inherited
+
+        self._goto = goto
+        self._fail = fail
+        self._best = best
+
+    def __bool__(self) -> bool:
+        return bool(self.words)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def search(self, text: str) -> str | None:
+        """返回文本里出现的、配置顺序最靠前的词；没有命中返回 None。"""
+        if not self.words or not text:
+            return None
+        goto = self._goto
+        fail = self._fail
+        best = self._best
+        state = 0
+        found = _NO_MATCH
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            candidate = best[state]
+            if candidate != _NO_MATCH and (found == _NO_MATCH or candidate < found):
+                found = candidate
+                if found == 0:
+                    break
+        return None if found == _NO_MATCH else self.words[found]
+
+
+__all__ = ["KeywordMatcher"]
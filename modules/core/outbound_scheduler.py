@@ -0,0 +1,206 @@
+"""出站 Telegram 请求的统一限速。
+
+作为 PTB 的 rate limiter 挂在 HistoryTrackingExtBot 上，所有 API 请求（getUpdates
+除外）都先在这里排队拿令牌，再真正发出：
+
+- 全局令牌桶：约 30 条/秒，webhook 多进程时按进程数平分；
+- 每个会话的令牌桶，只管发消息类请求：私聊 1 条/秒（允许短暂连发几条），
+  群组 20 条/分钟；
+- 两条优先级通道：交互回复默认走 INTERACTIVE；公告、定时任务、空闲跟进等在
+  ``background_sends()`` 里发出的走 BACKGROUND，有交互请求在等全局令牌时让路，并且
+  不动用全局桶里最后一部分令牌，交互回复总有余量。
+
+主动按节奏发送后 429 应当很少见；万一遇到，对应的桶在 retry_after 内暂停，异常
+照常抛给调用方（retry_telegram_send 会按 retry_after 重试，重试时同样排队）。
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+import telegram.error
+from telegram.ext import BaseRateLimiter
+
+from . import update_routing
+from .telegram_utils import _retry_after_delay_seconds
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+GLOBAL_MESSAGES_PER_SECOND = 30.0
+PRIVATE_CHAT_MESSAGES_PER_SECOND = 1.0
+PRIVATE_CHAT_BURST = 3  # 分段回复等短暂连发
+GROUP_CHAT_MESSAGES_PER_MINUTE = 20
+BACKGROUND_RESERVE_RATIO = 0.2  # 全局桶里留给交互回复的比例
+BACKGROUND_YIELD_SECONDS = 0.05
+MAX_TRACKED_CHATS = 4096
+
+# 按会话计数的请求；编辑、删除、回调应答等只占全局令牌
+CHAT_LIMITED_ENDPOINTS = frozenset(
+    {
+        "sendMessage",
+        "sendPhoto",
+        "sendAudio",
+        "sendDocument",
+        "sendVideo",
+        "sendAnimation",
+        "sendVoice",
+        "sendVideoNote",
+        "sendMediaGroup",
+        "sendLocation",
+        "sendVenue",
+        "sendContact",
+        "sendPoll",
+        "sendDice",
+        "sendSticker",
+        "sendInvoice",
+        "copyMessage",
+        "copyMessages",
+        "forwardMessage",
+        "forwardMessages",
+    }
+)
+
+logger = logging.getLogger(__name__)
+
+_priority: ContextVar[int] = ContextVar("outbound_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background_sends():
+    """其中发出的请求走低优先级通道。"""
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity, *, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now):
+        if now > self._updated:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def wait_time(self, now, reserve=0.0):
+        """拿到一个令牌（并保留 reserve 个不动）还要等多少秒。"""
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        self._refill(now)
+        missing = 1 + reserve - self._tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def take(self):
+        self._tokens -= 1
+
+    def block(self, until):
+        self._blocked_until = max(self._blocked_until, until)
+
+
+class OutboundScheduler(BaseRateLimiter):
+    def __init__(
+        self,
+        *,
+        global_rate=None,
+        clock=time.monotonic,
+        sleep=asyncio.sleep,
+    ):
+        if global_rate is None:
+            global_rate = GLOBAL_MESSAGES_PER_SECOND / update_routing.WORKER_COUNT
+        self._clock = clock
+        self._sleep = sleep
+        self._global = TokenBucket(global_rate, max(1.0, global_rate), clock=clock)
+        self._background_reserve = self._global.capacity * BACKGROUND_RESERVE_RATIO
+        self._chats: OrderedDict[Any, TokenBucket] = OrderedDict()
+        self._global_waiting = 0  # 正在等全局令牌的交互请求数
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+            return bucket
+        if isinstance(chat_id, int) and chat_id > 0:
+            bucket = TokenBucket(
+                PRIVATE_CHAT_MESSAGES_PER_SECOND, PRIVATE_CHAT_BURST, clock=self._clock
+            )
+        else:
+            # 负数 ID 与 @username 都是群组或频道
+            bucket = TokenBucket(
+                GROUP_CHAT_MESSAGES_PER_MINUTE / 60,
+                GROUP_CHAT_MESSAGES_PER_MINUTE,
+                clock=self._clock,
+            )
+        self._chats[chat_id] = bucket
+        while len(self._chats) > MAX_TRACKED_CHATS:
+            self._chats.popitem(last=False)
+        return bucket
+
+    async def acquire(self, chat_id=None, priority=INTERACTIVE):
+        """等到全局桶和会话桶都有令牌时各拿一个。"""
+        chat_bucket = self._chat_bucket(chat_id) if chat_id is not None else None
+        interactive = priority == INTERACTIVE
+        # 只统计卡在全局桶上的交互请求；只在等自己会话桶（比如 429 暂停）的不占用
+        # 全局令牌，后台请求不必给它让路
+        waiting_global = False
+        try:
+            while True:
+                now = self._clock()
+                if interactive:
+                    wait = self._global.wait_time(now)
+                elif self._global_waiting:
+                    wait = BACKGROUND_YIELD_SECONDS
+                else:
+                    wait = self._global.wait_time(now, self._background_reserve)
+                chat_wait = chat_bucket.wait_time(now) if chat_bucket is not None else 0.0
+                if interactive and waiting_global != (wait > 0 and wait >= chat_wait):
+                    waiting_global = not waiting_global
+                    self._global_waiting += 1 if waiting_global else -1
+                wait = max(wait, chat_wait)
+                if wait <= 0:
+                    self._global.take()
+                    if chat_bucket is not None:
+                        chat_bucket.take()
+                    return chat_bucket
+                await self._sleep(wait)
+        finally:
+            if waiting_global:
+                self._global_waiting -= 1
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = (rate_limit_args or {}).get("priority", _priority.get())
+        chat_id = data.get("chat_id") if endpoint in CHAT_LIMITED_ENDPOINTS else None
+        chat_bucket = await self.acquire(chat_id, priority)
+        try:
+            return await callback(*args, **kwargs)
+        except telegram.error.RetryAfter as exc:
+            until = self._clock() + _retry_after_delay_seconds(exc)
+            (chat_bucket or self._global).block(until)
+            logger.warning(f"{endpoint} 触发限流，chat={chat_id}，暂停至 {until:.1f}")
+            raise
+
+
+__all__ = [
+    "BACKGROUND",
+    "INTERACTIVE",
+    "OutboundScheduler",
+    "TokenBucket",
+    "background_sends",
+]
@@ -1,17 +1,17 @@
 import random
 from datetime import datetime, timedelta
 
-from . import config, mysql_connection
-
-USER_PLAN_FREE = "free"
-USER_PLAN_PAID = "paid"
-USER_PLAN_ADMIN = "admin"
-
-
-def resolve_user_plan(user_id: int, coins_paid: int) -> str:
-    if user_id == config.ADMIN_USER_ID:
-        return USER_PLAN_ADMIN
-    return USER_PLAN_PAID if coins_paid > 0 else USER_PLAN_FREE
+from . import mysql_connection
+from .user_profile_cache import (
+    FIELD_AFFECTION,
+    FIELD_COINS,
+    FIELD_EXISTS,
+    FIELD_IMPRESSION,
+    FIELD_PERMISSION,
+    invalidate_user_after_write,
+    user_profile_cache,
+)
+from .user_records import resolve_user_plan
 
 # 添加用户抽奖锁字典，防止同一用户并发抽奖
 lottery_locks = {}
@@ -33,7 +33,11 @@ async def update_user_lottery_date(user_id):
     )
 
 
-async def get_user_coin_balances(user_id, *, connection=None) -> tuple[int, int]:
+async def _invalidate_user_profile(user_id, *fields, connection=None) -> None:
+    await invalidate_user_after_write(user_id, *fields, connection=connection)
+
+
+async def _load_coin_balances(user_id, *, connection=None) -> tuple[int, int]:
     row = await mysql_connection.fetch_one(
         "SELECT coins, coins_paid FROM user WHERE id = %s",
         (user_id,),
@@ -46,6 +50,17 @@ async def get_user_coin_balances(user_id, *, connection=None) -> tuple[int, int]
     return coins_free, coins_paid
 
 
+async def get_user_coin_balances(user_id, *, connection=None) -> tuple[int, int]:
+    if connection is not None:
+        # 事务内的余额必须是库里的当前值
+        return await _load_coin_balances(user_id, connection=connection)
+    return await user_profile_cache.get_or_load(
+        user_id,
+        FIELD_COINS,
+        lambda: _load_coin_balances(user_id),
+    )
+
+
 async def get_user_total_coins(user_id, *, connection=None) -> int:
     coins_free, coins_paid = await get_user_coin_balances(
         user_id,
@@ -63,6 +78,7 @@ async def add_free_coins(user_id, coins, *, connection=None) -> int:
         (coins, user_id),
         connection=connection,
     )
+    await _invalidate_user_profile(user_id, FIELD_COINS, connection=connection)
     return coins
 
 
@@ -76,6 +92,7 @@ async def add_paid_coins(user_id, coins, *, connection=None) -> int:
         (coins, plan, user_id),
         connection=connection,
     )
+    await _invalidate_user_profile(user_id, FIELD_COINS, connection=connection)
     return coins
 
 
@@ -96,23 +113,46 @@ async def spend_user_coins(user_id, amount, *, connection=None) -> bool:
         return False
     coins_free = row[0] or 0
     coins_paid = row[1] or 0
-    total = coins_free + coins_paid
-    if total < amount:
+    if coins_free + coins_paid < amount:
         return False
+    await _write_coin_spend(user_id, coins_free, coins_paid, amount, connection=connection)
+    return True
+
 
+def _split_spend(coins_free: int, coins_paid: int, amount: int) -> tuple[int, int]:
+    """先扣免费硬币，不足部分再扣付费硬币。"""
     if coins_free >= amount:
-        new_free = coins_free - amount
-        new_paid = coins_paid
-    else:
-        remaining = amount - coins_free
-        new_free = 0
-        new_paid = coins_paid - remaining
+        return coins_free - amount, coins_paid
+    return 0, max(coins_paid - (amount - coins_free), 0)
+
+
+async def _write_coin_spend(user_id, coins_free, coins_paid, amount, *, connection):
+    new_free, new_paid = _split_spend(coins_free, coins_paid, amount)
     plan = resolve_user_plan(user_id, new_paid)
     await connection.exec_driver_sql(
         "UPDATE user SET coins = %s, coins_paid = %s, user_plan = %s WHERE id = %s",
         (new_free, new_paid, plan, user_id),
     )
-    return True
+    await _invalidate_user_profile(user_id, FIELD_COINS, connection=connection)
+    return new_free, new_paid, plan
+
+
+async def spend_coins_from_context(user_context, amount, *, connection):
+    """按 ``load_user_turn_context(for_update=True)`` 锁住的快照扣费，不再回查余额。
+
+    调用方须已确认余额足够；返回扣费后的快照。
+    """
+    amount = int(amount)
+    if amount <= 0:
+        return user_context
+    new_free, new_paid, _plan = await _write_coin_spend(
+        user_context.user_id,
+        user_context.coins_free,
+        user_context.coins_paid,
+        amount,
+        connection=connection,
+    )
+    return user_context.with_coins(new_free, new_paid)
 
 
 async def update_user_coins(user_id, coins, *, connection=None):
@@ -122,7 +162,7 @@ async def update_user_coins(user_id, coins, *, connection=None):
     return await spend_user_coins(user_id, -coins, connection=connection)
 
 
-async def user_exists(user_id):
+async def _load_user_exists(user_id):
     row = await mysql_connection.fetch_one(
         "SELECT id FROM user WHERE id = %s",
         (user_id,),
@@ -130,6 +170,15 @@ async def user_exists(user_id):
     return row is not None
 
 
+async def user_exists(user_id):
+    return await user_profile_cache.get_or_load(
+        user_id,
+        FIELD_EXISTS,
+        lambda: _load_user_exists(user_id),
+        cache_if=bool,
+    )
+
+
 async def async_user_exists(user_id):
     return await user_exists(user_id)
 
@@ -197,7 +246,7 @@ async def async_get_user_coins(user_id: int) -> int:
     return await get_user_coins(user_id)
 
 
-async def get_user_affection(user_id: int) -> int:
+async def _load_user_affection(user_id: int) -> int:
     row = await mysql_connection.fetch_one(
         "SELECT affection FROM ai_user_affection WHERE user_id = %s",
         (user_id,),
@@ -205,6 +254,14 @@ async def get_user_affection(user_id: int) -> int:
     return row[0] if row else 0
 
 
+async def get_user_affection(user_id: int) -> int:
+    return await user_profile_cache.get_or_load(
+        user_id,
+        FIELD_AFFECTION,
+        lambda: _load_user_affection(user_id),
+    )
+
+
 def get_user_affection_sync(user_id: int) -> int:
     return mysql_connection.run_sync(get_user_affection(user_id))
 
@@ -236,6 +293,7 @@ async def update_user_affection(user_id: int, delta: int) -> int:
                 (user_id, updated),
             )
 
+    await _invalidate_user_profile(user_id, FIELD_AFFECTION)
     return updated
 
 
@@ -251,7 +309,7 @@ async def async_update_user_affection(user_id: int, delta: int) -> int:
     return await update_user_affection(user_id, delta)
 
 
-async def get_user_permission(user_id: int) -> int:
+async def _load_user_permission(user_id: int) -> int:
     row = await mysql_connection.fetch_one(
         "SELECT permission FROM user WHERE id = %s",
         (user_id,),
@@ -259,6 +317,23 @@ async def get_user_permission(user_id: int) -> int:
     return row[0] if row else 0
 
 
+async def get_user_permission(user_id: int) -> int:
+    return await user_profile_cache.get_or_load(
+        user_id,
+        FIELD_PERMISSION,
+        lambda: _load_user_permission(user_id),
+    )
+
+
+async def set_user_permission(user_id: int, permission: int, *, connection=None) -> None:
+    await mysql_connection.execute(
+        "UPDATE user SET permission = %s WHERE id = %s",
+        (permission, user_id),
+        connection=connection,
+    )
+    await _invalidate_user_profile(user_id, FIELD_PERMISSION, connection=connection)
+
+
 async def async_get_user_permission(user_id: int) -> int:
     return await get_user_permission(user_id)
 
@@ -267,7 +342,7 @@ async def async_update_user_coins(user_id: int, amount: int) -> None:
     await update_user_coins(user_id, amount)
 
 
-async def get_user_impression(user_id: int) -> str:
+async def _load_user_impression(user_id: int) -> str:
     row = await mysql_connection.fetch_one(
         "SELECT impression FROM ai_user_affection WHERE user_id = %s",
         (user_id,),
@@ -277,6 +352,14 @@ async def get_user_impression(user_id: int) -> str:
     return ""
 
 
+async def get_user_impression(user_id: int) -> str:
+    return await user_profile_cache.get_or_load(
+        user_id,
+        FIELD_IMPRESSION,
+        lambda: _load_user_impression(user_id),
+    )
+
+
 async def update_user_impression(user_id: int, impression: str) -> str:
     text = (impression or "").strip()
     async with mysql_connection.transaction() as connection:
@@ -295,6 +378,7 @@ async def update_user_impression(user_id: int, impression: str) -> str:
                 "INSERT INTO ai_user_affection (user_id, affection, impression) VALUES (%s, %s, %s)",
                 (user_id, 0, text),
             )
+    await _invalidate_user_profile(user_id, FIELD_IMPRESSION)
     return text
 
 
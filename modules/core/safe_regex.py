@@ -0,0 +1,234 @@
+"""用户可影响的正则表达式的安全执行层。
+
+模型传入的检索 pattern、群管理员配置的垃圾词正则都可能出现灾难性回溯。
+这里统一做三件事：编译前静态检查复杂度、按时间预算执行匹配、缓存编译结果，
+并记录慢 pattern 供排查。装了 `regex` 模块时用它的 timeout 真正打断匹配；
+没装时退回标准库 `re`，只剩静态检查兜底。
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+try:  # pragma: no cover - Python 3.10 只有 sre_parse
+    from re import _parser as sre_parse
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+try:  # pragma: no cover - optional dependency
+    import regex
+except ImportError:  # pragma: no cover
+    regex = None
+
+SAFE_REGEX_MAX_PATTERN_LENGTH = 500
+SAFE_REGEX_MAX_BOUNDED_REPEAT = 1000
+SAFE_REGEX_DEFAULT_TIMEOUT_SECONDS = 0.05
+SAFE_REGEX_SLOW_SECONDS = 0.01
+SAFE_REGEX_CACHE_SIZE = 512
+
+_REPEAT_OPCODES = {
+    sre_parse.MAX_REPEAT,
+    sre_parse.MIN_REPEAT,
+    getattr(sre_parse, "POSSESSIVE_REPEAT", sre_parse.MAX_REPEAT),
+}
+_MAXREPEAT = sre_parse.MAXREPEAT
+
+
+class UnsafePatternError(ValueError):
+    """pattern 能编译，但结构上有回溯爆炸风险。"""
+
+
+class RegexTimeoutError(TimeoutError):
+    """匹配超出时间预算被中止。"""
+
+
+@dataclass
+class SlowPatternStats:
+    pattern: str
+    slow_count: int = 0
+    timeout_count: int = 0
+    max_seconds: float = 0.0
+
+
+_CACHE: "OrderedDict[tuple[str, int], SafePattern]" = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+_SLOW_PATTERNS: dict[str, SlowPatternStats] = {}
+_SLOW_LOCK = threading.Lock()
+
+
+def _is_repeat(op: Any, av: Any) -> bool:
+    return op in _REPEAT_OPCODES and isinstance(av, tuple) and len(av) == 3
+
+
+def _subpatterns(op: Any, av: Any) -> list:
+    if _is_repeat(op, av):
+        return [av[2]]
+    if op is sre_parse.SUBPATTERN:
+        return [av[-1]]
+    if op is sre_parse.BRANCH:
+        return list(av[1])
+    if op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+        return [av[1]]
+    if op is sre_parse.GROUPREF_EXISTS:
+        return [item for item in av[1:] if item is not None]
+    if op is getattr(sre_parse, "ATOMIC_GROUP", None):
+        return [av]
+    return []
+
+
+def _contains_variable_repeat(items) -> bool:
+    for op, av in items:
+        if _is_repeat(op, av) and av[0] != av[1]:
+            return True
+        if any(_contains_variable_repeat(sub) for sub in _subpatterns(op, av)):
+            return True
+    return False
+
+
+def _check_complexity(items) -> None:
+    for op, av in items:
+        if op in (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS):
+            raise UnsafePatternError("Backreferences are not allowed")
+        if _is_repeat(op, av):
+            _min_count, max_count, body = av
+            if max_count != _MAXREPEAT and max_count > SAFE_REGEX_MAX_BOUNDED_REPEAT:
+                raise UnsafePatternError(
+                    f"Repeat count exceeds {SAFE_REGEX_MAX_BOUNDED_REPEAT}"
+                )
+            if (
+                max_count == _MAXREPEAT or max_count > 1
+            ) and _contains_variable_repeat(body):
+                raise UnsafePatternError("Nested quantifiers are not allowed")
+            _check_complexity(body)
+            continue
+        for sub in _subpatterns(op, av):
+            _check_complexity(sub)
+
+
+def check_pattern_complexity(pattern: str, flags: int = 0) -> None:
+    """静态检查 pattern；语法错误抛 re.error，结构危险抛 UnsafePatternError。"""
+    if len(pattern) > SAFE_REGEX_MAX_PATTERN_LENGTH:
+        raise UnsafePatternError(
+            f"Pattern exceeds {SAFE_REGEX_MAX_PATTERN_LENGTH} characters"
+        )
+    parsed = sre_parse.parse(pattern, flags)
+    _check_complexity(parsed)
+
+
+def _record_duration(pattern: str, elapsed: float, *, timed_out: bool) -> None:
+    if not timed_out and elapsed < SAFE_REGEX_SLOW_SECONDS:
+        return
+    with _SLOW_LOCK:
+        stats = _SLOW_PATTERNS.get(pattern)
+        if stats is None:
+            if len(_SLOW_PATTERNS) >= SAFE_REGEX_CACHE_SIZE:
+                mildest = min(
+                    _SLOW_PATTERNS.values(),
+                    key=lambda item: (item.timeout_count, item.max_seconds),
+                )
+                _SLOW_PATTERNS.pop(mildest.pattern, None)
+            stats = SlowPatternStats(pattern=pattern)
+            _SLOW_PATTERNS[pattern] = stats
+        if timed_out:
+            stats.timeout_count += 1
+        else:
+            stats.slow_count += 1
+        stats.max_seconds = max(stats.max_seconds, elapsed)
+    if timed_out:
+        logging.warning("正则匹配超时已中止 (%.3fs): %r", elapsed, pattern[:100])
+    else:
+        logging.info("慢正则 (%.3fs): %r", elapsed, pattern[:100])
+
+
+class SafePattern:
+    """编译后的安全 pattern，接口对齐 re.Pattern 的常用部分。"""
+
+    def __init__(self, pattern: str, flags: int, compiled: Any) -> None:
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled = compiled
+
+    def _run(self, method: str, text: str, timeout: float | None):
+        budget = SAFE_REGEX_DEFAULT_TIMEOUT_SECONDS if timeout is None else timeout
+        started = time.perf_counter()
+        try:
+            if regex is not None:
+                result = getattr(self._compiled, method)(text, timeout=budget)
+            else:
+                result = getattr(self._compiled, method)(text)
+        except TimeoutError as exc:
+            _record_duration(
+                self.pattern,
+                time.perf_counter() - started,
+                timed_out=True,
+            )
+            raise RegexTimeoutError(f"Regex timed out after {budget}s") from exc
+        _record_duration(self.pattern, time.perf_counter() - started, timed_out=False)
+        return result
+
+    def search(self, text: str, *, timeout: float | None = None):
+        return self._run("search", text, timeout)
+
+    def fullmatch(self, text: str, *, timeout: float | None = None):
+        return self._run("fullmatch", text, timeout)
+
+
+def compile_safe(pattern: str, flags: int = 0) -> SafePattern:
+    """编译并缓存 pattern。
+
+    语法错误抛 re.error，结构危险抛 UnsafePatternError，调用方按原有的
+    「无效正则」路径处理即可。
+    """
+    key = (pattern, flags)
+    with _CACHE_LOCK:
+        cached = _CACHE.get(key)
+        if cached is not None:
+            _CACHE.move_to_end(key)
+            return cached
+
+    check_pattern_complexity(pattern, flags)
+    if regex is not None:
+        try:
+            compiled = regex.compile(pattern, flags)
+        except regex.error as exc:
+            raise re.error(str(exc)) from exc
+    else:
+        compiled = re.compile(pattern, flags)
+    safe_pattern = SafePattern(pattern, flags, compiled)
+
+    with _CACHE_LOCK:
+        _CACHE[key] = safe_pattern
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > SAFE_REGEX_CACHE_SIZE:
+            _CACHE.popitem(last=False)
+    return safe_pattern
+
+
+def slow_pattern_report() -> list[dict]:
+    """按超时次数、最长耗时排序的慢 pattern 列表。"""
+    with _SLOW_LOCK:
+        stats = list(_SLOW_PATTERNS.values())
+    stats.sort(key=lambda item: (item.timeout_count, item.max_seconds), reverse=True)
+    return [
+        {
+            "pattern": item.pattern,
+            "slow_count": item.slow_count,
+            "timeout_count": item.timeout_count,
+            "max_seconds": round(item.max_seconds, 4),
+        }
+        for item in stats
+    ]
+
+
+__all__ = [
+    "RegexTimeoutError",
+    "SafePattern",
+    "UnsafePatternError",
+    "check_pattern_complexity",
+    "compile_safe",
+    "slow_pattern_report",
+]
@@ -11,6 +11,7 @@ from . import db
 
 connect = db.connect
 transaction = db.transaction
+after_commit = db.after_commit
 run_sync = db.run_sync
 
 
@@ -1,11 +1,25 @@
+"""质押奖励池。
+
+池子余额分散在 stake_reward_pool 表的 POOL_SHARDS 行里（迁移 0022 补齐 1..N 号行）。
+每次付费对话都会往池里加钱，按用户把增量落到其中一行，不同用户的扣费事务不再
+排队等同一把行锁；余额是所有行之和。领取回报时锁住全部分片再扣，定时任务把
+分片余额归并回 1 号行。
+"""
+
+import logging
+import random
 from decimal import Decimal, ROUND_DOWN
 
-from . import mysql_connection
+from . import mysql_connection, update_routing
 
 POOL_ROW_ID = 1
+POOL_SHARDS = 16
+POOL_COMPACT_INTERVAL = 3600
 POOL_RATE = Decimal("0.2")
 POOL_QUANT = Decimal("0.01")
 
+logger = logging.getLogger(__name__)
+
 
 def _normalize_amount(amount) -> Decimal:
     if amount is None:
@@ -22,46 +36,59 @@ def calculate_pool_add(cost: int) -> Decimal:
     return _normalize_amount(Decimal(cost) * POOL_RATE)
 
 
-async def _ensure_pool_row(*, connection=None) -> None:
-    await mysql_connection.execute(
-        "INSERT INTO stake_reward_pool (id, balance) VALUES (%s, 0) "
-        "ON DUPLICATE KEY UPDATE balance = balance",
-        (POOL_ROW_ID,),
-        connection=connection,
-    )
+def shard_for(shard_key=None) -> int:
+    """同一用户总落在同一行；没有 key 时随机挑一行。"""
+    if shard_key is None:
+        return random.randrange(POOL_SHARDS) + POOL_ROW_ID
+    return int(shard_key) % POOL_SHARDS + POOL_ROW_ID
 
 
-async def get_pool_balance(*, connection=None, for_update: bool = False) -> Decimal:
-    await _ensure_pool_row(connection=connection)
-    sql = "SELECT balance FROM stake_reward_pool WHERE id = %s"
+async def _fetch_shards(*, connection=None, for_update: bool = False) -> list[tuple[int, Decimal]]:
+    sql = "SELECT id, balance FROM stake_reward_pool ORDER BY id"
     if for_update:
+        # 按主键顺序加锁，和归并任务的加锁顺序一致
         sql += " FOR UPDATE"
-    row = await mysql_connection.fetch_one(
-        sql,
-        (POOL_ROW_ID,),
-        connection=connection,
-    )
-    if not row or row[0] is None:
-        return Decimal("0")
-    return Decimal(str(row[0]))
+    rows = await mysql_connection.fetch_all(sql, connection=connection)
+    return [
+        (int(row[0]), Decimal("0") if row[1] is None else Decimal(str(row[1])))
+        for row in rows or []
+    ]
 
 
-async def add_to_pool(amount, *, connection=None) -> Decimal:
+async def get_pool_balance(*, connection=None, for_update: bool = False) -> Decimal:
+    shards = await _fetch_shards(connection=connection, for_update=for_update)
+    return sum((balance for _shard_id, balance in shards), Decimal("0"))
+
+
+async def add_to_pool(amount, *, connection=None, shard_key=None) -> Decimal:
     amount = _normalize_amount(amount)
     if amount <= 0:
         return Decimal("0")
-    if connection is None:
-        async with mysql_connection.transaction() as connection:
-            return await add_to_pool(amount, connection=connection)
-    await _ensure_pool_row(connection=connection)
+    # 单条语句，行不存在时顺手补上，只锁目标分片
     await mysql_connection.execute(
-        "UPDATE stake_reward_pool SET balance = balance + %s WHERE id = %s",
-        (amount, POOL_ROW_ID),
+        "INSERT INTO stake_reward_pool (id, balance) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE balance = balance + VALUES(balance)",
+        (shard_for(shard_key), amount),
         connection=connection,
     )
     return amount
 
 
+def _plan_debit(shards: list[tuple[int, Decimal]], amount: Decimal) -> dict[int, Decimal]:
+    """从余额最多的分片扣起；总额不够时差额记在 1 号行。"""
+    debits: dict[int, Decimal] = {}
+    remaining = amount
+    for shard_id, balance in sorted(shards, key=lambda shard: shard[1], reverse=True):
+        if remaining <= 0 or balance <= 0:
+            break
+        taken = min(balance, remaining)
+        debits[shard_id] = taken
+        remaining -= taken
+    if remaining > 0:
+        debits[POOL_ROW_ID] = debits.get(POOL_ROW_ID, Decimal("0")) + remaining
+    return debits
+
+
 async def subtract_from_pool(amount, *, connection=None) -> Decimal:
     amount = _normalize_amount(amount)
     if amount <= 0:
@@ -69,10 +96,47 @@ async def subtract_from_pool(amount, *, connection=None) -> Decimal:
     if connection is None:
         async with mysql_connection.transaction() as connection:
             return await subtract_from_pool(amount, connection=connection)
-    await _ensure_pool_row(connection=connection)
-    await mysql_connection.execute(
-        "UPDATE stake_reward_pool SET balance = balance - %s WHERE id = %s",
-        (amount, POOL_ROW_ID),
-        connection=connection,
-    )
+    shards = await _fetch_shards(connection=connection, for_update=True)
+    for shard_id, debit in _plan_debit(shards, amount).items():
+        await mysql_connection.execute(
+            "INSERT INTO stake_reward_pool (id, balance) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE balance = balance - %s",
+            (shard_id, -debit, debit),
+            connection=connection,
+        )
     return amount
+
+
+async def compact_pool() -> Decimal:
+    """把所有分片余额归并到 1 号行，其余行清零；返回池子总额。"""
+    async with mysql_connection.transaction() as connection:
+        shards = await _fetch_shards(connection=connection, for_update=True)
+        total = sum((balance for _shard_id, balance in shards), Decimal("0"))
+        if all(balance == 0 for shard_id, balance in shards if shard_id != POOL_ROW_ID):
+            return total
+        await mysql_connection.execute(
+            "UPDATE stake_reward_pool SET balance = IF(id = %s, %s, 0)",
+            (POOL_ROW_ID, total),
+            connection=connection,
+        )
+    return total
+
+
+async def _compact_pool_job(context) -> None:
+    # 归并锁住全部分片，webhook 多进程时只由 0 号进程执行
+    if not update_routing.is_primary_worker():
+        return
+    try:
+        total = await compact_pool()
+    except Exception as e:
+        logger.warning(f"归并奖励池分片失败: {e}")
+        return
+    logger.debug(f"奖励池分片已归并，余额 {total}")
+
+
+def setup_pool_jobs(application) -> None:
+    application.job_queue.run_repeating(
+        _compact_pool_job,
+        interval=POOL_COMPACT_INTERVAL,
+        first=POOL_COMPACT_INTERVAL,
+    )
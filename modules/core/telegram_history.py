@@ -17,6 +17,7 @@ from telegram import Update
 from telegram.ext import ExtBot
 
 from . import config, group_chat_history, mysql_connection
+from .keyed_registry import KeyedLocks
 from .prompt_utils import format_metadata_attrs, remove_xml_tags, xml_escape
 from .telegram_utils import describe_message_for_context
 
@@ -98,9 +99,14 @@ _SENSITIVE_COMMAND_OUTPUTS = {"create_code"}
 _VOLATILE_EVENT_ATTR_PATTERN = re.compile(
     r'\s(?:timestamp|message_id|reply_to_message_id|edited_at)="[^"]*"'
 )
+HISTORY_WRITER_CONCURRENCY = 8  # 后台写入器同时写库的用户数
+HISTORY_SHUTDOWN_SECONDS = 10.0  # 停止时冲刷全部元事件的时限
+
 _PENDING_EVENTS: dict[int, OrderedDict[str, _PendingTelegramEvent]] = {}
-_PENDING_FLUSH_TASKS: dict[int, asyncio.Task] = {}
-_PENDING_FLUSH_LOCKS: dict[int, asyncio.Lock] = {}
+# {user_id: 到期时间（事件循环时钟）}，由同一个后台写入器按到期先后批量写入
+_PENDING_DUE: dict[int, float] = {}
+_PENDING_FLUSH_LOCKS = KeyedLocks()
+_WRITER_TASK: asyncio.Task | None = None
 
 
 def _format_timestamp(value: Any) -> str:
@@ -416,40 +422,84 @@ async def _write_pending_events(
 
 async def flush_pending_events(user_id: int) -> None:
     """立即写入指定用户已通过限流的元事件。"""
-    flush_lock = _PENDING_FLUSH_LOCKS.setdefault(user_id, asyncio.Lock())
-    async with flush_lock:
-        flush_task = _PENDING_FLUSH_TASKS.get(user_id)
-        current_task = asyncio.current_task()
-        if flush_task is not None and flush_task is not current_task:
-            _PENDING_FLUSH_TASKS.pop(user_id, None)
-            flush_task.cancel()
-
+    async with _PENDING_FLUSH_LOCKS.hold(user_id):
+        _PENDING_DUE.pop(user_id, None)
         pending = _PENDING_EVENTS.pop(user_id, None)
         if not pending:
             return
         await _write_pending_events(user_id, list(pending.values()))
 
 
-async def _flush_pending_events_later(user_id: int) -> None:
-    try:
-        await asyncio.sleep(config.TELEGRAM_HISTORY_RATE_WINDOW_SECONDS)
-        await flush_pending_events(user_id)
-    except asyncio.CancelledError:
-        return
-    finally:
-        current_task = asyncio.current_task()
-        if _PENDING_FLUSH_TASKS.get(user_id) is current_task:
-            _PENDING_FLUSH_TASKS.pop(user_id, None)
-        if _PENDING_EVENTS.get(user_id) and user_id not in _PENDING_FLUSH_TASKS:
-            _PENDING_FLUSH_TASKS[user_id] = asyncio.create_task(
-                _flush_pending_events_later(user_id)
-            )
+async def take_pending_events(user_id: int) -> list[str]:
+    """取走指定用户待写的元事件，由调用方并入自己的那次历史写入。
+
+    AI 对话轮本来就要写一次历史，把元事件放在本轮消息前面一起写，省掉一次
+    单独的读改写。正在写入的那一批会先写完。
+    """
+    async with _PENDING_FLUSH_LOCKS.hold(user_id):
+        _PENDING_DUE.pop(user_id, None)
+        pending = _PENDING_EVENTS.pop(user_id, None)
+    return [event.content for event in (pending or {}).values()]
+
 
+async def _flush_users(user_ids: list[int]) -> None:
+    semaphore = asyncio.Semaphore(HISTORY_WRITER_CONCURRENCY)
 
-async def flush_all_pending_events() -> None:
-    """进程停止前尽力冲刷所有用户的元事件。"""
-    for user_id in list(_PENDING_EVENTS):
-        await flush_pending_events(user_id)
+    async def flush_one(user_id: int) -> None:
+        async with semaphore:
+            await flush_pending_events(user_id)
+
+    await asyncio.gather(*(flush_one(user_id) for user_id in user_ids))
+
+
+async def _run_history_writer() -> None:
+    """每轮取出所有到期的用户并发写入，没有待写事件时退出。"""
+    loop = asyncio.get_running_loop()
+    while _PENDING_DUE:
+        now = loop.time()
+        due_users = [user_id for user_id, due_at in _PENDING_DUE.items() if due_at <= now]
+        if not due_users:
+            await asyncio.sleep(min(_PENDING_DUE.values()) - now)
+            continue
+        try:
+            await _flush_users(due_users)
+        except Exception:  # pragma: no cover - defensive logging
+            logger.exception("后台写入 Telegram 元事件失败")
+            for user_id in due_users:
+                _PENDING_DUE.pop(user_id, None)
+
+
+def _schedule_flush(user_id: int) -> None:
+    global _WRITER_TASK
+    loop = asyncio.get_running_loop()
+    # 已经排上的用户不顺延，窗口内的后续事件跟着同一次写入
+    _PENDING_DUE.setdefault(
+        user_id,
+        loop.time() + config.TELEGRAM_HISTORY_RATE_WINDOW_SECONDS,
+    )
+    if _WRITER_TASK is None or _WRITER_TASK.done() or _WRITER_TASK.get_loop() is not loop:
+        _WRITER_TASK = loop.create_task(_run_history_writer())
+
+
+async def flush_all_pending_events(timeout: float = HISTORY_SHUTDOWN_SECONDS) -> None:
+    """进程停止前在时限内并发冲刷所有用户的元事件。"""
+    global _WRITER_TASK
+    writer = _WRITER_TASK
+    _WRITER_TASK = None
+    if writer is not None and not writer.done() and writer.get_loop() is asyncio.get_running_loop():
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
+    user_ids = list(_PENDING_EVENTS)
+    if not user_ids:
+        return
+    try:
+        await asyncio.wait_for(_flush_users(user_ids), timeout)
+    except asyncio.TimeoutError:
+        logger.warning(
+            "停止前未能在 %.0f 秒内写完元事件，剩余 %s 个用户",
+            timeout,
+            len(_PENDING_EVENTS),
+        )
 
 
 async def _persist_event(user_id: int, content: str, bot: Any) -> None:
@@ -467,11 +517,7 @@ async def _persist_event(user_id: int, content: str, bot: Any) -> None:
     while len(pending) > max_events:
         pending.popitem(last=False)
 
-    task = _PENDING_FLUSH_TASKS.get(user_id)
-    if task is None or task.done():
-        _PENDING_FLUSH_TASKS[user_id] = asyncio.create_task(
-            _flush_pending_events_later(user_id)
-        )
+    _schedule_flush(user_id)
 
 
 async def record_command_update(update: Update, bot: Any) -> None:
@@ -2,6 +2,8 @@
 
 import asyncio
 import logging
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from io import BytesIO
 from functools import partial
@@ -22,6 +24,9 @@ TELEGRAM_SEND_RETRY_ATTEMPTS = 3
 TELEGRAM_SEND_RETRY_INITIAL_DELAY_SECONDS = 0.5
 TELEGRAM_SEND_RETRY_MAX_DELAY_SECONDS = 8.0
 TELEGRAM_RETRY_AFTER_PADDING_SECONDS = 0.1
+CHAT_ADMIN_STATUSES = frozenset({"administrator", "creator"})
+CHAT_ADMIN_CACHE_TTL_SECONDS = 300.0
+CHAT_ADMIN_CACHE_MAX_CHATS = 1024
 
 
 class PartialTelegramSendError(Exception):
@@ -601,3 +606,146 @@ async def send_document_bytes(
                 telegram_error_summary(exc),
             )
         return False
+
+
+async def send_document_file(
+    bot: Any,
+    chat_id: int,
+    file_obj: Any,
+    filename: str,
+    *,
+    caption: str | None = None,
+    logger: logging.Logger | None = None,
+) -> bool:
+    """发送可 seek 的文件对象，重试时倒回开头，不在调用方拼整块 bytes。"""
+    try:
+        async def send_once() -> Any:
+            file_obj.seek(0)
+            return await bot.send_document(
+                chat_id=chat_id,
+                document=file_obj,
+                filename=filename,
+                caption=caption,
+            )
+
+        await retry_telegram_send(
+            send_once,
+            logger=logger,
+            action="send document file",
+        )
+        return True
+    except Exception as exc:  # pragma: no cover - defensive logging
+        if logger:
+            logger.warning(
+                "Failed to send document to %s: %s",
+                chat_id,
+                telegram_error_summary(exc),
+            )
+        return False
+
+
+class ChatAdminCache:
+    """Bounded TTL+LRU cache of each chat's administrator ids.
+
+    One ``get_chat_administrators`` call answers "is this user an admin" for
+    every member of the chat until the entry expires, instead of one
+    ``get_chat_member`` call per user. Concurrent misses for the same chat
+    share a single request.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float = CHAT_ADMIN_CACHE_TTL_SECONDS,
+        max_chats: int = CHAT_ADMIN_CACHE_MAX_CHATS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_chats = max_chats
+        self._clock = clock
+        self._entries: OrderedDict[int, tuple[float, frozenset[int]]] = OrderedDict()
+        self._loading: dict[int, asyncio.Future] = {}
+        # Chats invalidated while a fetch was in flight; that result is not stored.
+        self._stale_loads: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _cached(self, chat_id: int) -> frozenset[int] | None:
+        entry = self._entries.get(chat_id)
+        if entry is None:
+            return None
+        expires_at, admin_ids = entry
+        if self._clock() >= expires_at:
+            self._entries.pop(chat_id, None)
+            return None
+        self._entries.move_to_end(chat_id)
+        return admin_ids
+
+    def _store(self, chat_id: int, admin_ids: frozenset[int]) -> None:
+        self._entries[chat_id] = (self._clock() + self.ttl_seconds, admin_ids)
+        self._entries.move_to_end(chat_id)
+        while len(self._entries) > self.max_chats:
+            self._entries.popitem(last=False)
+
+    async def _fetch(self, bot: Any, chat_id: int) -> frozenset[int]:
+        administrators = await bot.get_chat_administrators(chat_id)
+        admin_ids = frozenset(
+            member.user.id
+            for member in administrators
+            if getattr(member, "status", None) in CHAT_ADMIN_STATUSES
+        )
+        if chat_id not in self._stale_loads:
+            self._store(chat_id, admin_ids)
+        return admin_ids
+
+    def _load_finished(self, chat_id: int) -> None:
+        self._loading.pop(chat_id, None)
+        self._stale_loads.discard(chat_id)
+
+    async def get_admin_ids(self, bot: Any, chat_id: int) -> frozenset[int]:
+        admin_ids = self._cached(chat_id)
+        if admin_ids is not None:
+            return admin_ids
+        future = self._loading.get(chat_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(bot, chat_id))
+            self._loading[chat_id] = future
+            future.add_done_callback(lambda _done: self._load_finished(chat_id))
+        return await asyncio.shield(future)
+
+    async def is_admin(self, bot: Any, chat_id: int, user_id: int) -> bool:
+        return user_id in await self.get_admin_ids(bot, chat_id)
+
+    def invalidate(self, chat_id: int | None = None) -> None:
+        if chat_id is None:
+            self._entries.clear()
+            self._stale_loads.update(self._loading)
+            return
+        self._entries.pop(chat_id, None)
+        if chat_id in self._loading:
+            self._stale_loads.add(chat_id)
+
+    def apply_member_update(self, chat_member_updated: Any) -> bool:
+        """Drop a chat's entry when a ``chat_member`` update changes admin status."""
+        old_status = getattr(chat_member_updated.old_chat_member, "status", None)
+        new_status = getattr(chat_member_updated.new_chat_member, "status", None)
+        if (old_status in CHAT_ADMIN_STATUSES) == (new_status in CHAT_ADMIN_STATUSES):
+            return False
+        self.invalidate(chat_member_updated.chat.id)
+        return True
+
+
+chat_admin_cache = ChatAdminCache()
+
+
+async def is_chat_admin(bot: Any, chat_id: int, user_id: int) -> bool:
+    """Return whether ``user_id`` administers ``chat_id``, using the shared cache."""
+    return await chat_admin_cache.is_admin(bot, chat_id, user_id)
+
+
+async def refresh_admin_cache_on_member_update(update: Any, context: Any) -> None:
+    """Handler for ``chat_member``/``my_chat_member`` updates."""
+    chat_member_updated = update.chat_member or update.my_chat_member
+    if chat_member_updated is not None:
+        chat_admin_cache.apply_member_update(chat_member_updated)
@@ -0,0 +1,80 @@
+"""Webhook 模式下把更新按会话分给多个工作进程。
+
+路由键：私聊取 user_id（私聊的 chat_id 就是 user_id），群组取 chat_id；没有 chat 的
+更新（内联查询、支付、投票回答等）取发起人的 user_id，都没有的落到 0 号进程。
+工作进程号为 ``key % WORKER_COUNT``，同一个会话的更新总是进同一个进程、按到达
+顺序入队，批处理窗口这类按 (chat, user) 的进程内状态因此不需要跨进程共享。
+AI 对话状态按用户记账，同一用户的群聊和私聊可能落在两个进程，会话锁在多进程时
+另加数据库命名锁（见 features.ai.conversation_locks）。
+
+定时任务里按用户或按群处理的部分用 ``owns_chat`` / ``owner_filter_sql`` 只认领
+本进程负责的会话；单进程（轮询模式）时两者都不做任何过滤。整表维护类任务
+（奖励池归并、共享冷却清理、质押汇总重算）用 ``is_primary_worker`` 只在 0 号进程跑。
+
+其余定时任务每个进程各跑一份，这是有意的：它们只清理或刷新本进程内存里的东西
+——抽奖消息记录、垃圾词库、音乐/图片/骰宝的请求与缓存、跨进程缓存失效轮询；
+警告计数的持久化只写本进程负责的群。
+"""
+
+from typing import Any
+
+# 本进程的编号与工作进程总数，由 webhook 工作进程启动时设置
+WORKER_INDEX = 0
+WORKER_COUNT = 1
+
+
+def configure_worker(index: int, count: int) -> None:
+    global WORKER_INDEX, WORKER_COUNT
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"invalid worker index {index} of {count}")
+    WORKER_INDEX = index
+    WORKER_COUNT = count
+
+
+def routing_key(update: dict[str, Any]) -> int:
+    """从原始更新 JSON 里取路由键。"""
+    for field, payload in update.items():
+        if field == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat")
+        if chat is None and isinstance(payload.get("message"), dict):
+            # 回调查询挂在消息上；内联消息的回调没有 message，下面按发起人路由
+            chat = payload["message"].get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return int(chat["id"])
+        for user_field in ("from", "user"):
+            user = payload.get(user_field)
+            if isinstance(user, dict) and "id" in user:
+                return int(user["id"])
+    return 0
+
+
+def worker_for_key(key: int, count: int | None = None) -> int:
+    return key % (count or WORKER_COUNT)
+
+
+def owns_chat(chat_id: int) -> bool:
+    """本进程是否负责该会话（私聊传 user_id）。"""
+    return WORKER_COUNT == 1 or worker_for_key(chat_id) == WORKER_INDEX
+
+
+def is_primary_worker() -> bool:
+    """全局任务只在 0 号进程执行。"""
+    return WORKER_INDEX == 0
+
+
+def owner_filter_sql(column: str) -> tuple[str, tuple]:
+    """按用户认领任务时追加的 SQL 条件，column 须是正数的 user_id 列。"""
+    if WORKER_COUNT == 1:
+        return "", ()
+    return f" AND MOD({column}, %s) = %s", (WORKER_COUNT, WORKER_INDEX)
+
+
+__all__ = [
+    "configure_worker",
+    "is_primary_worker",
+    "owner_filter_sql",
+    "owns_chat",
+    "routing_key",
+    "worker_for_key",
+]
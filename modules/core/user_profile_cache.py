@@ -0,0 +1,245 @@
+"""user / ai_user_affection 里读多写少字段的进程内缓存。
+
+process_user 的 get_user_permission、get_user_affection、get_user_impression、
+user_exists 以及不带连接的余额读取都先查这里，未命中再查库并回填：
+
+- 每个用户一条，按字段分别缓存，最近使用的排在后面，超过 ``max_users`` 时淘汰
+  最久未用的用户；条目超过有效期后下次读取重新查库；
+- 写入统一走 process_user，写完即失效对应字段；写在调用方事务里时，提交后再
+  失效一次，提交前被别的协程读回的旧值不会留下；
+- 读库途中被失效的用户，这次读到的结果不回填；
+- 带 ``connection`` 的余额读取（扣费、转账等事务内）直接查库，不经过缓存；
+- 用户注册后才存在，所以 user_exists 只缓存"存在"。
+
+多实例时订阅 cache_invalidation 的 ``user_profile`` topic，跨进程失效照常传播。
+发布的 key 是 user_id 按 USER_PROFILE_PUBLISH_BUCKETS 取模的桶号，收到后整桶失效
+（只是把桶的代号加一，读到旧代号的条目当作未命中），这样 cache_versions 和各实例
+记下的版本号都不会随用户数增长；写在事务里时等提交后才发布，别的实例不会抢在
+提交前把旧值读回去。``stats()`` 给出命中率，/stats 会显示。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from . import cache_invalidation, config
+from .sql import after_commit
+
+USER_PROFILE_CACHE_MAX_USERS = 10000
+USER_PROFILE_COINS_TTL_SECONDS = 30.0  # 余额变动频繁，单独用较短的有效期
+USER_PROFILE_TOPIC = "user_profile"
+USER_PROFILE_PUBLISH_BUCKETS = 256
+
+FIELD_EXISTS = "exists"
+FIELD_PERMISSION = "permission"
+FIELD_AFFECTION = "affection"
+FIELD_IMPRESSION = "impression"
+FIELD_COINS = "coins"
+
+
+class UserProfileCache:
+    def __init__(
+        self,
+        *,
+        ttl_seconds: float | None = None,
+        coins_ttl_seconds: float = USER_PROFILE_COINS_TTL_SECONDS,
+        max_users: int = USER_PROFILE_CACHE_MAX_USERS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._ttl_seconds = ttl_seconds
+        self.coins_ttl_seconds = coins_ttl_seconds
+        self.max_users = max_users
+        self._clock = clock
+        # {user_id: {field: (过期时间, 值, 写入时的桶代号)}}
+        self._entries: OrderedDict[int, dict[str, tuple[float, Any, int]]] = OrderedDict()
+        # {桶号: 代号}，跨进程整桶失效时加一
+        self._bucket_generations: dict[int, int] = {}
+        # {user_id: [在途读取数, 失效次数]}，只在有读取在途时存在
+        self._loading: dict[int, list[int]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ttl_seconds(self) -> float:
+        if self._ttl_seconds is None:
+            return config.USER_PROFILE_CACHE_TTL_SECONDS
+        return self._ttl_seconds
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _field_ttl(self, field: str) -> float:
+        if field == FIELD_COINS:
+            return min(self.ttl_seconds, self.coins_ttl_seconds)
+        return self.ttl_seconds
+
+    def _generation(self, user_id: int) -> int:
+        return self._bucket_generations.get(user_id % USER_PROFILE_PUBLISH_BUCKETS, 0)
+
+    def _lookup(self, user_id: int, field: str) -> tuple[bool, Any]:
+        fields = self._entries.get(user_id)
+        if fields is None or field not in fields:
+            return False, None
+        expires_at, value, generation = fields[field]
+        if self._clock() >= expires_at or generation != self._generation(user_id):
+            del fields[field]
+            return False, None
+        self._entries.move_to_end(user_id)
+        return True, value
+
+    def _store(self, user_id: int, field: str, value: Any) -> None:
+        fields = self._entries.get(user_id)
+        if fields is None:
+            fields = self._entries[user_id] = {}
+        fields[field] = (self._clock() + self._field_ttl(field), value, self._generation(user_id))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+
+    async def get_or_load(
+        self,
+        user_id: int,
+        field: str,
+        loader: Callable[[], Awaitable[Any]],
+        *,
+        cache_if: Callable[[Any], bool] | None = None,
+    ) -> Any:
+        """命中直接返回，否则调用 ``loader`` 查库并回填。"""
+        if self._field_ttl(field) <= 0:
+            return await loader()
+        hit, value = self._lookup(user_id, field)
+        if hit:
+            self.hits += 1
+            return value
+        self.misses += 1
+
+        loading = self._loading.setdefault(user_id, [0, 0])
+        loading[0] += 1
+        invalidations = loading[1]
+        try:
+            value = await loader()
+            if loading[1] == invalidations and (cache_if is None or cache_if(value)):
+                self._store(user_id, field, value)
+            return value
+        finally:
+            loading[0] -= 1
+            if loading[0] <= 0:
+                self._loading.pop(user_id, None)
+
+    def invalidate(self, user_id: int | None = None, *fields: str) -> None:
+        """丢掉用户的指定字段（不传字段表示全部）；user_id 为 None 时清空。"""
+        if user_id is None:
+            self._entries.clear()
+            for loading in self._loading.values():
+                loading[1] += 1
+            return
+        loading = self._loading.get(user_id)
+        if loading is not None:
+            loading[1] += 1
+        cached = self._entries.get(user_id)
+        if cached is None:
+            return
+        if not fields:
+            del self._entries[user_id]
+            return
+        for field in fields:
+            cached.pop(field, None)
+
+    def invalidate_bucket(self, bucket: int) -> None:
+        """丢掉 ``user_id % USER_PROFILE_PUBLISH_BUCKETS == bucket`` 的全部用户。"""
+        self._bucket_generations[bucket] = self._bucket_generations.get(bucket, 0) + 1
+        for user_id, loading in self._loading.items():
+            if user_id % USER_PROFILE_PUBLISH_BUCKETS == bucket:
+                loading[1] += 1
+
+    def invalidate_after_write(
+        self,
+        user_id: int,
+        *fields: str,
+        connection=None,
+        on_commit: Callable[[], None] | None = None,
+    ) -> bool:
+        """写入后调用；``connection`` 是 ``transaction()`` 的事务连接时，等 COMMIT
+        真正返回后再失效一次并调用 ``on_commit``。
+
+        返回是否挂上了提交回调。
+        """
+        self.invalidate(user_id, *fields)
+
+        def invalidate_committed() -> None:
+            self.invalidate(user_id, *fields)
+            if on_commit is not None:
+                on_commit()
+
+        return after_commit(connection, invalidate_committed)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "users": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def reset_stats(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+user_profile_cache = UserProfileCache()
+
+
+# 提交钩子里发起的跨进程发布，持有引用直到完成
+_publish_tasks: set[asyncio.Task] = set()
+
+
+def _on_remote_invalidation(key: str | None) -> None:
+    if key:
+        user_profile_cache.invalidate_bucket(int(key))
+    else:
+        user_profile_cache.invalidate()
+
+
+cache_invalidation.subscribe(USER_PROFILE_TOPIC, _on_remote_invalidation)
+
+
+async def publish_user_invalidation(user_id: int) -> None:
+    """多实例时通知其他进程丢掉这个用户所在的桶；本进程已由写入方失效。"""
+    await cache_invalidation.publish(
+        USER_PROFILE_TOPIC,
+        user_id % USER_PROFILE_PUBLISH_BUCKETS,
+        notify_local=False,
+    )
+
+
+async def invalidate_user_after_write(user_id: int, *fields: str, connection=None) -> None:
+    """写入后失效本进程的缓存并通知其他实例；在事务里时通知等到提交后再发。"""
+    on_commit = None
+    if cache_invalidation.cross_process_enabled():
+        loop = asyncio.get_running_loop()
+
+        def on_commit() -> None:
+            task = loop.create_task(publish_user_invalidation(user_id))
+            _publish_tasks.add(task)
+            task.add_done_callback(_publish_tasks.discard)
+
+    if user_profile_cache.invalidate_after_write(
+        user_id, *fields, connection=connection, on_commit=on_commit
+    ):
+        return
+    await publish_user_invalidation(user_id)
+
+
+__all__ = [
+    "FIELD_AFFECTION",
+    "FIELD_COINS",
+    "FIELD_EXISTS",
+    "FIELD_IMPRESSION",
+    "FIELD_PERMISSION",
+    "UserProfileCache",
+    "invalidate_user_after_write",
+    "publish_user_invalidation",
+    "user_profile_cache",
+]
@@ -1,7 +1,21 @@
 """user 表的基础查询。"""
 
+from dataclasses import dataclass, replace
+from typing import Any
+
+from . import config
 from .sql import fetch_one
 
+USER_PLAN_FREE = "free"
+USER_PLAN_PAID = "paid"
+USER_PLAN_ADMIN = "admin"
+
+
+def resolve_user_plan(user_id: int, coins_paid: int) -> str:
+    if user_id == config.ADMIN_USER_ID:
+        return USER_PLAN_ADMIN
+    return USER_PLAN_PAID if coins_paid > 0 else USER_PLAN_FREE
+
 
 async def check_user_exists(user_id: int) -> bool:
     row = await fetch_one("SELECT id FROM user WHERE id = %s", (user_id,))
@@ -10,3 +24,62 @@ async def check_user_exists(user_id: int) -> bool:
 
 async def async_check_user_exists(user_id: int) -> bool:
     return await check_user_exists(user_id)
+
+
+@dataclass(frozen=True)
+class UserTurnContext:
+    """一轮对话用到的用户信息快照，整轮只查一次。"""
+
+    user_id: int
+    permission: Any
+    coins_free: int
+    coins_paid: int
+    info: str
+    impression: str
+    has_diary: bool
+
+    @property
+    def total_coins(self) -> int:
+        return self.coins_free + self.coins_paid
+
+    @property
+    def plan(self) -> str:
+        return resolve_user_plan(self.user_id, self.coins_paid)
+
+    def with_coins(self, coins_free: int, coins_paid: int) -> "UserTurnContext":
+        return replace(self, coins_free=coins_free, coins_paid=coins_paid)
+
+
+async def load_user_turn_context(
+    user_id: int,
+    *,
+    connection=None,
+    for_update: bool = False,
+) -> UserTurnContext | None:
+    """一次查询取回余额、权限、资料、印象和是否写过日记；用户不存在时返回 None。
+
+    ``for_update`` 时在扣费事务里只锁住 user 行（不锁联表读到的印象和日记），
+    随后可以直接按快照扣费。
+    """
+    row = await fetch_one(
+        "SELECT u.permission, u.coins, u.coins_paid, u.info, a.impression, "
+        "EXISTS (SELECT 1 FROM ai_user_diary_pages AS d "
+        "WHERE d.user_id = u.id AND d.content != '') "
+        "FROM user AS u "
+        "LEFT JOIN ai_user_affection AS a ON a.user_id = u.id "
+        "WHERE u.id = %s" + (" FOR UPDATE OF u" if for_update else ""),
+        (user_id,),
+        connection=connection,
+    )
+    if not row:
+        return None
+    permission, coins_free, coins_paid, info, impression, has_diary = row
+    return UserTurnContext(
+        user_id=user_id,
+        permission=permission,
+        coins_free=int(coins_free or 0),
+        coins_paid=int(coins_paid or 0),
+        info=info or "",
+        impression=impression or "",
+        has_diary=bool(has_diary),
+    )
@@ -0,0 +1,326 @@
+"""可断点续发的公告群发任务。
+
+一次 /admin_announce 建一条 broadcast_jobs 记录（迁移 0021），分两步执行：
+
+1. 收集目标：用户表和几张群组表都按主键游标分页读取，跳过近期标记为不可达的
+   会话，写入 broadcast_targets，每个目标一行，初始为 pending；
+2. 发送：同样按游标分页取 pending 目标，每页并发发送（实际节奏由出站调度的
+   全局令牌桶决定，走低优先级通道），整页结果在一个事务里写回目标状态和任务计数。
+
+进度消息在发起的会话里定时编辑，显示完成数与速率。任务状态都在库里，进程重启后
+由定时任务接着发剩下的 pending 目标；崩溃前已发出但没来得及写回的那一页会重发。
+用户屏蔽 bot、群组踢出 bot 时记入 broadcast_unreachable_chats，之后的群发在一段
+时间内不再尝试。
+"""
+
+import asyncio
+import logging
+import time
+
+import telegram
+from sqlalchemy.exc import SQLAlchemyError
+from telegram.constants import ParseMode
+
+from core import mysql_connection, update_routing
+from core.outbound_scheduler import background_sends
+from core.telegram_utils import retry_telegram_send
+
+BROADCAST_PAGE_SIZE = 500
+BROADCAST_CONCURRENCY = 30  # 同时在途的发送数，约等于 Telegram 的全局每秒上限
+BROADCAST_PROGRESS_SECONDS = 10  # 进度消息的最短编辑间隔
+BROADCAST_RESUME_INTERVAL = 60
+BROADCAST_UNREACHABLE_RETRY_DAYS = 30  # 不可达的会话多久之后再尝试
+BROADCAST_GROUP_TABLES = (
+    "group_keywords",
+    "group_verification",
+    "group_spam_control",
+    "group_chart_tokens",
+    "chat_records_group",
+)
+_MIN_CHAT_ID = -(2**63)
+
+logger = logging.getLogger(__name__)
+
+# {job_id: 本进程里正在执行的 Task}
+_running = {}
+
+
+class BroadcastProgress:
+    def __init__(self, job_id, total, sent=0, failed=0, blocked=0, *, clock=time.monotonic):
+        self.job_id = job_id
+        self.total = total
+        self.sent = sent
+        self.failed = failed
+        self.blocked = blocked
+        self._clock = clock
+        self._started = clock()
+        self._handled_this_run = 0
+        self._last_report = None
+
+    @property
+    def done(self):
+        return self.sent + self.failed + self.blocked
+
+    def add(self, results):
+        for _chat_id, status, _error in results:
+            setattr(self, status, getattr(self, status) + 1)
+        self._handled_this_run += len(results)
+
+    def rate(self):
+        elapsed = self._clock() - self._started
+        return self._handled_this_run / elapsed if elapsed > 0 else 0.0
+
+    def report_due(self):
+        now = self._clock()
+        if self._last_report is not None and now - self._last_report < BROADCAST_PROGRESS_SECONDS:
+            return False
+        self._last_report = now
+        return True
+
+    def render(self, *, finished=False):
+        head = "📢 公告群发完成 Broadcast finished" if finished else "📢 公告群发中 Broadcasting"
+        return (
+            f"{head} #{self.job_id}\n\n"
+            f"进度 Progress: {self.done}/{self.total}\n"
+            f"✅ 成功 Success: {self.sent}\n"
+            f"❌ 失败 Failed: {self.failed}\n"
+            f"🚫 不可达 Unreachable: {self.blocked}\n"
+            f"⚡ 速率 Rate: {self.rate():.1f}/s"
+        )
+
+
+async def create_broadcast(text, report_chat_id):
+    async with mysql_connection.transaction() as connection:
+        await mysql_connection.execute(
+            "INSERT INTO broadcast_jobs (text, report_chat_id) VALUES (%s, %s)",
+            (text, report_chat_id),
+            connection=connection,
+        )
+        row = await mysql_connection.fetch_one("SELECT LAST_INSERT_ID()", connection=connection)
+    return int(row[0])
+
+
+async def _keyset_pages(sql, params=()):
+    """按第一列做游标分页，``sql`` 末尾依次接收 (游标, LIMIT) 两个参数。"""
+    page_size = BROADCAST_PAGE_SIZE
+    cursor = _MIN_CHAT_ID
+    while True:
+        rows = await mysql_connection.fetch_all(sql, (*params, cursor, page_size))
+        if not rows:
+            return
+        yield [row[0] for row in rows]
+        if len(rows) < page_size:
+            return
+        cursor = rows[-1][0]
+
+
+def _reachable_targets_sql(table, column):
+    return (
+        f"SELECT DISTINCT t.{column} FROM {table} AS t "
+        f"LEFT JOIN broadcast_unreachable_chats AS b ON b.chat_id = t.{column} "
+        f"AND b.marked_at > NOW() - INTERVAL {BROADCAST_UNREACHABLE_RETRY_DAYS} DAY "
+        f"WHERE b.chat_id IS NULL AND t.{column} > %s ORDER BY t.{column} LIMIT %s"
+    )
+
+
+async def collect_targets(job_id):
+    """把用户和已知群组写入目标表，可重复执行；返回目标总数。"""
+    sources = [("user", "id")] + [(table, "group_id") for table in BROADCAST_GROUP_TABLES]
+    for table, column in sources:
+        try:
+            async for page in _keyset_pages(_reachable_targets_sql(table, column)):
+                placeholders = ", ".join(["(%s, %s)"] * len(page))
+                await mysql_connection.execute(
+                    f"INSERT IGNORE INTO broadcast_targets (job_id, chat_id) VALUES {placeholders}",
+                    [value for chat_id in page for value in (job_id, chat_id)],
+                )
+        except SQLAlchemyError as e:
+            if table == "user":
+                raise
+            logger.warning(f"查询群组表 {table} 时出错: {e}")
+    row = await mysql_connection.fetch_one(
+        "SELECT COUNT(*) FROM broadcast_targets WHERE job_id = %s", (job_id,)
+    )
+    total = int(row[0]) if row else 0
+    await mysql_connection.execute(
+        "UPDATE broadcast_jobs SET status = 'sending', total = %s WHERE id = %s",
+        (total, job_id),
+    )
+    return total
+
+
+def _format_announcement(chat_id, text):
+    if chat_id > 0:
+        return f"📢 *公告 Announcement*:\n{text}"
+    return f"📢 *群组公告 Group Announcement*:\n{text}"
+
+
+async def _send_one(bot, chat_id, text, semaphore):
+    """返回 (chat_id, 状态, 错误)，状态为 sent / failed / blocked。"""
+    async with semaphore:
+        try:
+            await retry_telegram_send(
+                lambda: bot.send_message(
+                    chat_id=chat_id,
+                    text=_format_announcement(chat_id, text),
+                    parse_mode=ParseMode.MARKDOWN,
+                ),
+                logger=logger,
+                action="send broadcast",
+            )
+            return chat_id, "sent", None
+        except telegram.error.Forbidden as e:
+            return chat_id, "blocked", str(e)[:255]
+        except telegram.error.BadRequest as e:
+            status = "blocked" if "chat not found" in str(e).lower() else "failed"
+            return chat_id, status, str(e)[:255]
+        except Exception as e:
+            logger.warning(f"向 {chat_id} 发送公告失败: {e}")
+            return chat_id, "failed", str(e)[:255]
+
+
+async def _record_results(job_id, results):
+    sent = [chat_id for chat_id, status, _ in results if status == "sent"]
+    errors = [(status, error, chat_id) for chat_id, status, error in results if status != "sent"]
+    blocked = [(chat_id, error) for chat_id, status, error in results if status == "blocked"]
+    async with mysql_connection.transaction() as connection:
+        if sent:
+            placeholders = ", ".join(["%s"] * len(sent))
+            await mysql_connection.execute(
+                "UPDATE broadcast_targets SET status = 'sent' "
+                f"WHERE job_id = %s AND chat_id IN ({placeholders})",
+                (job_id, *sent),
+                connection=connection,
+            )
+        for status, error, chat_id in errors:
+            await mysql_connection.execute(
+                "UPDATE broadcast_targets SET status = %s, error = %s "
+                "WHERE job_id = %s AND chat_id = %s",
+                (status, error, job_id, chat_id),
+                connection=connection,
+            )
+        if blocked:
+            placeholders = ", ".join(["(%s, %s)"] * len(blocked))
+            await mysql_connection.execute(
+                f"INSERT INTO broadcast_unreachable_chats (chat_id, reason) VALUES {placeholders} "
+                "ON DUPLICATE KEY UPDATE reason = VALUES(reason), marked_at = CURRENT_TIMESTAMP",
+                [value for row in blocked for value in row],
+                connection=connection,
+            )
+        await mysql_connection.execute(
+            "UPDATE broadcast_jobs SET sent = sent + %s, failed = failed + %s, "
+            "blocked = blocked + %s WHERE id = %s",
+            (len(sent), len(errors) - len(blocked), len(blocked), job_id),
+            connection=connection,
+        )
+
+
+async def _report(bot, job_id, report_chat_id, progress, state, *, finished=False):
+    text = progress.render(finished=finished)
+    try:
+        if state.get("message_id"):
+            await bot.edit_message_text(
+                chat_id=report_chat_id, message_id=state["message_id"], text=text
+            )
+            return
+        message = await bot.send_message(chat_id=report_chat_id, text=text)
+        state["message_id"] = message.message_id
+        await mysql_connection.execute(
+            "UPDATE broadcast_jobs SET report_message_id = %s WHERE id = %s",
+            (message.message_id, job_id),
+        )
+    except Exception as e:
+        # 进度消息只是展示，失败不影响群发本身
+        logger.debug(f"更新群发进度失败: {e}")
+
+
+async def run_broadcast(bot, job_id):
+    row = await mysql_connection.fetch_one(
+        "SELECT text, status, report_chat_id, report_message_id, total, sent, failed, blocked "
+        "FROM broadcast_jobs WHERE id = %s",
+        (job_id,),
+    )
+    if row is None or row[1] not in ("collecting", "sending"):
+        return
+    text, status, report_chat_id, report_message_id, total, sent, failed, blocked = row
+    if status == "collecting":
+        total = await collect_targets(job_id)
+    progress = BroadcastProgress(job_id, total, sent, failed, blocked)
+    state = {"message_id": report_message_id}
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+
+    with background_sends():
+        pending = _keyset_pages(
+            "SELECT chat_id FROM broadcast_targets "
+            "WHERE job_id = %s AND status = 'pending' AND chat_id > %s "
+            "ORDER BY chat_id LIMIT %s",
+            (job_id,),
+        )
+        async for page in pending:
+            results = await asyncio.gather(
+                *(_send_one(bot, chat_id, text, semaphore) for chat_id in page)
+            )
+            await _record_results(job_id, results)
+            progress.add(results)
+            if progress.report_due():
+                await _report(bot, job_id, report_chat_id, progress, state)
+
+    await mysql_connection.execute(
+        "UPDATE broadcast_jobs SET status = 'done' WHERE id = %s", (job_id,)
+    )
+    await _report(bot, job_id, report_chat_id, progress, state, finished=True)
+    logger.info(
+        f"群发 #{job_id} 完成：成功 {progress.sent}，失败 {progress.failed}，"
+        f"不可达 {progress.blocked}"
+    )
+
+
+async def _run_guarded(bot, job_id):
+    try:
+        await run_broadcast(bot, job_id)
+    except Exception as e:
+        # 任务状态仍是未完成，下一轮恢复任务会从剩下的 pending 目标继续
+        logger.error(f"群发 #{job_id} 中断: {e}")
+    finally:
+        _running.pop(job_id, None)
+
+
+def start_broadcast(application, job_id):
+    if job_id in _running:
+        return _running[job_id]
+    task = application.create_task(_run_guarded(application.bot, job_id))
+    _running[job_id] = task
+    return task
+
+
+async def _resume_broadcasts_job(context):
+    try:
+        rows = await mysql_connection.fetch_all(
+            "SELECT id, report_chat_id FROM broadcast_jobs "
+            "WHERE status IN ('collecting', 'sending') ORDER BY id"
+        )
+    except Exception as e:
+        logger.error(f"查询未完成的群发任务时出错: {e}")
+        return
+    for job_id, report_chat_id in rows or []:
+        # webhook 多进程时由负责发起会话的进程接着发，避免重复发送
+        if job_id not in _running and update_routing.owns_chat(report_chat_id):
+            start_broadcast(context.application, job_id)
+
+
+def setup_broadcast_jobs(application):
+    application.job_queue.run_repeating(
+        _resume_broadcasts_job,
+        interval=BROADCAST_RESUME_INTERVAL,
+        first=10,
+    )
+
+
+__all__ = [
+    "BroadcastProgress",
+    "collect_targets",
+    "create_broadcast",
+    "run_broadcast",
+    "setup_broadcast_jobs",
+    "start_broadcast",
+]
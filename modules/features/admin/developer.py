@@ -4,6 +4,7 @@ from telegram import Update
 from telegram.ext import ContextTypes, CommandHandler
 from sqlalchemy.exc import SQLAlchemyError
 from core import config, mysql_connection
+from core.user_profile_cache import user_profile_cache
 import tempfile
 from core.command_cooldown import cooldown # 导入冷却装饰器
 
@@ -95,7 +96,13 @@ async def get_bot_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         stats_message += f"💬 配置关键词群组: {keyword_group_count}\n"
         stats_message += f"✅ 启用验证群组: {verify_group_count}\n"
         stats_message += f"🛡️ 启用垃圾控制群组: {spam_group_count}\n"
-        stats_message += f"📈 配置图表群组: {chart_group_count}\n\n"
+        stats_message += f"📈 配置图表群组: {chart_group_count}\n"
+        cache_stats = user_profile_cache.stats()
+        stats_message += (
+            f"🗂️ 用户资料缓存: {cache_stats['users']} 人，命中率 "
+            f"{cache_stats['hit_rate']:.1%} ({cache_stats['hits']}/"
+            f"{cache_stats['hits'] + cache_stats['misses']})\n\n"
+        )
         
         # 添加最近用户信息
         stats_message += "*最近的用户 (按ID排序，最多10个):*\n"
@@ -1,11 +1,109 @@
+"""同一会话（按 user_id）的 AI 轮次串行执行。
+
+进程内用 KeyedLocks 排队。webhook 多进程时同一用户的群聊和私聊更新会落到不同
+进程（群组按 chat_id 路由），进程内的锁管不到对方，这时再叠一把 MySQL 命名锁
+（GET_LOCK），在持有期间独占一条数据库连接，保证扣费和写聊天记录不会在两个进程
+里同时进行。单进程时不碰数据库。
+
+命名锁要跨整轮对话（含模型调用和工具）持有连接，所以用 ``db.get_lock_engine()``
+的独立小连接池，并用同样大小的信号量限流：超出的对话在进程内排队，不会把主连接池
+占满，也不会等到连接池超时。
+"""
+
 import asyncio
+import logging
+
+from core import config, db, update_routing
+from core.keyed_registry import KeyedLocks
+
+# 每次 GET_LOCK 最多等这么久再重试，避免一条查询长时间挂起无法取消
+CONVERSATION_DB_LOCK_POLL_SECONDS = 5
+
+logger = logging.getLogger(__name__)
+
+# 只保留正在使用的会话，没有协程持有或等待时自动删除
+_CONVERSATION_LOCKS = KeyedLocks()
+_db_lock_slots: asyncio.Semaphore | None = None
+
+
+def _db_lock_name(conversation_id: int) -> str:
+    return f"fogmoe:conversation:{conversation_id}"
+
+
+def _lock_slots() -> asyncio.Semaphore:
+    global _db_lock_slots
+    if _db_lock_slots is None:
+        _db_lock_slots = asyncio.Semaphore(config.TELEGRAM_WEBHOOK_LOCK_CONNECTIONS)
+    return _db_lock_slots
+
+
+class _ConversationLockHandle:
+    __slots__ = ("_conversation_id", "_local", "_slots", "_connection_cm", "_connection")
+
+    def __init__(self, conversation_id: int):
+        self._conversation_id = conversation_id
+        self._local = _CONVERSATION_LOCKS.hold(conversation_id)
+        self._slots = None
+        self._connection_cm = None
+        self._connection = None
+
+    async def __aenter__(self):
+        await self._local.__aenter__()
+        if update_routing.WORKER_COUNT == 1:
+            return
+        try:
+            slots = _lock_slots()
+            await slots.acquire()
+            self._slots = slots
+            await self._acquire_db_lock()
+        except BaseException:
+            await self._release_db_side()
+            await self._local.__aexit__(None, None, None)
+            raise
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            if self._connection is not None:
+                try:
+                    await self._connection.exec_driver_sql(
+                        "SELECT RELEASE_LOCK(%s)",
+                        (_db_lock_name(self._conversation_id),),
+                    )
+                except Exception as e:
+                    # 连接随后关闭，会话结束时 MySQL 会自动释放命名锁
+                    logger.warning(f"释放会话锁失败 {self._conversation_id}: {e}")
+                    await self._connection.invalidate()
+            await self._release_db_side()
+        finally:
+            await self._local.__aexit__(exc_type, exc, tb)
+
+    async def _acquire_db_lock(self) -> None:
+        self._connection_cm = db.get_lock_engine().connect()
+        self._connection = await self._connection_cm.__aenter__()
+        name = _db_lock_name(self._conversation_id)
+        while True:
+            result = await self._connection.exec_driver_sql(
+                "SELECT GET_LOCK(%s, %s)",
+                (name, CONVERSATION_DB_LOCK_POLL_SECONDS),
+            )
+            row = result.fetchone()
+            if row and row[0] == 1:
+                return
+            if not row or row[0] is None:
+                raise RuntimeError(f"GET_LOCK failed for {name}")
+            logger.debug(f"等待其他进程释放会话锁 {name}")
 
-_CONVERSATION_LOCKS: dict[int, asyncio.Lock] = {}
+    async def _release_db_side(self) -> None:
+        connection_cm, self._connection_cm, self._connection = self._connection_cm, None, None
+        slots, self._slots = self._slots, None
+        try:
+            if connection_cm is not None:
+                await connection_cm.__aexit__(None, None, None)
+        finally:
+            if slots is not None:
+                slots.release()
 
 
-def get_conversation_lock(conversation_id: int) -> asyncio.Lock:
-    lock = _CONVERSATION_LOCKS.get(conversation_id)
-    if lock is None:
-        lock = asyncio.Lock()
-        _CONVERSATION_LOCKS[conversation_id] = lock
-    return lock
+def get_conversation_lock(conversation_id: int):
+    """``async with get_conversation_lock(conversation_id):`` 串行处理同一会话。"""
+    return _ConversationLockHandle(conversation_id)
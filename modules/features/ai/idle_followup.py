@@ -15,8 +15,9 @@ from typing import Any, Iterable
 from pydantic import BaseModel, ConfigDict, Field, ValidationError
 from telegram.ext import ContextTypes
 
-from core import config, mysql_connection, process_user
+from core import config, mysql_connection, process_user, update_routing
 from core.archive_utils import send_permanent_records_archive
+from core.outbound_scheduler import background_sends
 from core.prompt_utils import format_metadata_attrs, xml_escape
 from core.telegram_history import suppress_telegram_history
 from core.telegram_utils import partial_send
@@ -513,6 +514,7 @@ async def _claim_due_followups(
 ) -> list[IdleFollowupClaim]:
     now = datetime.now(timezone.utc).replace(tzinfo=None)
     claim_until = now + timedelta(minutes=IDLE_FOLLOWUP_CLAIM_MINUTES)
+    owner_sql, owner_params = update_routing.owner_filter_sql("f.user_id")
     async with mysql_connection.transaction() as connection:
         rows = await mysql_connection.fetch_all(
             "SELECT f.user_id, f.activity_version, f.retry_count "
@@ -522,9 +524,10 @@ async def _claim_due_followups(
             "OR (f.status = 'executing' AND f.claim_until IS NOT NULL "
             "AND f.claim_until <= %s)) "
             "AND (u.id IS NULL OR "
-            "COALESCE(u.coins, 0) + COALESCE(u.coins_paid, 0) > 0) "
+            "COALESCE(u.coins, 0) + COALESCE(u.coins_paid, 0) > 0)"
+            f"{owner_sql} "
             "ORDER BY f.next_run_at ASC, f.user_id ASC LIMIT %s FOR UPDATE",
-            (now, now, limit),
+            (now, now, *owner_params, limit),
             connection=connection,
         )
         claims = [
@@ -802,7 +805,8 @@ async def run_idle_followup_job(context: ContextTypes.DEFAULT_TYPE) -> None:
     async with _idle_followup_job_lock:
         claims = await _claim_due_followups()
         if claims:
-            await asyncio.gather(*(_process_claim(claim, context) for claim in claims))
+            with background_sends():
+                await asyncio.gather(*(_process_claim(claim, context) for claim in claims))
 
 
 __all__ = [
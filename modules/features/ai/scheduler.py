@@ -5,8 +5,9 @@ from typing import Optional
 
 from telegram.ext import ContextTypes
 
-from core import mysql_connection, process_user
+from core import mysql_connection, process_user, update_routing
 from core.archive_utils import send_permanent_records_archive
+from core.outbound_scheduler import background_sends
 from core.prompt_utils import format_metadata_attrs, xml_escape
 from core.telegram_history import suppress_telegram_history, telegram_history_scope
 from core.telegram_utils import partial_send
@@ -176,6 +177,8 @@ async def _persist_tool_logs(
 
 
 async def _claim_due_schedules(limit: int = SCHEDULE_BATCH_SIZE) -> list[tuple]:
+    # webhook 多进程时只认领本进程负责的用户，会话锁才能和私聊消息互斥
+    owner_sql, owner_params = update_routing.owner_filter_sql("s.user_id")
     async with mysql_connection.transaction() as connection:
         rows = await mysql_connection.fetch_all(
             "SELECT s.id, s.user_id, s.run_at, s.created_at, s.trigger_reason, "
@@ -187,10 +190,11 @@ async def _claim_due_schedules(limit: int = SCHEDULE_BATCH_SIZE) -> list[tuple]:
             "COALESCE(u.coins, 0) + COALESCE(u.coins_paid, 0) > 0) "
             "AND (u.id IS NULL OR u.ai_schedule_trigger_date IS NULL "
             "OR u.ai_schedule_trigger_date <> UTC_DATE() "
-            "OR u.ai_schedule_trigger_count < %s) "
+            "OR u.ai_schedule_trigger_count < %s)"
+            f"{owner_sql} "
             "ORDER BY s.run_at ASC, s.id ASC "
             "LIMIT %s FOR UPDATE",
-            (DAILY_SCHEDULE_TRIGGER_LIMIT, limit),
+            (DAILY_SCHEDULE_TRIGGER_LIMIT, *owner_params, limit),
             connection=connection,
         )
         if not rows:
@@ -436,8 +440,9 @@ async def run_ai_schedule_job(context: ContextTypes.DEFAULT_TYPE) -> None:
         tasks = await _claim_due_schedules()
         if not tasks:
             return
-        for task in tasks:
-            await _process_schedule_task(task, context)
+        with background_sends():
+            for task in tasks:
+                await _process_schedule_task(task, context)
 
 
 def setup_schedule_jobs(application) -> None:
@@ -18,7 +18,10 @@ from .provider_resolver import (
 from .tool_runner import run_tool_loop
 from .tools.context import clear_tool_request_context, set_tool_request_context
 from .tools.schemas import SUMMARY_SEARCH_PRIOR_CONTEXT_TOOL
-from .tools.summary_tools import search_prior_context_tool
+from .tools.summary_tools import (
+    search_prior_context_tool,
+    update_prior_summary_index,
+)
 
 SUMMARY_MAX_TOKENS = 2500
 SUMMARY_CONTEXT_HARD_LIMIT_RATIO = 1.5
@@ -55,7 +58,7 @@ def _generate_and_store_summary(user_id: int) -> Optional[str]:
         logging.warning("Conversation summary generation failed for user %s after retries.", user_id)
         return None
 
-    _store_summary(record_id, summary_text)
+    _store_summary(user_id, record_id, summary_text)
     return summary_text
 
 
@@ -428,10 +431,11 @@ def _generate_summary(
     return None
 
 
-def _store_summary(record_id: int, summary_text: str) -> None:
+def _store_summary(user_id: int, record_id: int, summary_text: str) -> None:
     mysql_connection.run_sync(
         mysql_connection.execute(
             "UPDATE permanent_chat_records SET summary = %s WHERE id = %s",
             (summary_text, record_id),
         )
     )
+    update_prior_summary_index(user_id, record_id, summary_text)
@@ -5,6 +5,7 @@ import time
 from typing import Any
 
 from core import config
+from core.keyed_registry import KeyedState
 
 from ..errors import is_timeout_error
 from ..provider_resolver import get_models_for_task, get_provider_order_for_task
@@ -12,7 +13,8 @@ from ..task_runner import run_ai_task
 from .context import get_tool_request_context
 
 _CALL_COUNT_CONTEXT_KEY = "_advisor_call_count"
-_RATE_LIMITS: dict[str, list[float]] = {}
+# {user_key: 窗口内的调用时间}，整个窗口没有调用的用户自动丢弃
+_RATE_LIMITS = KeyedState(list, config.AI_ADVISOR_RATE_LIMIT_WINDOW_SECONDS)
 _RATE_LIMIT_LOCK = threading.Lock()
 _ADVISOR_SEMAPHORE = threading.BoundedSemaphore(
     config.AI_ADVISOR_MAX_CONCURRENT_REQUESTS
@@ -51,25 +53,17 @@ def _reserve_user_rate_limit(user_id: object) -> tuple[bool, int | None]:
     user_key = str(user_id)
 
     with _RATE_LIMIT_LOCK:
-        for existing_user_key, existing_timestamps in list(_RATE_LIMITS.items()):
-            active_timestamps = [
-                timestamp
-                for timestamp in existing_timestamps
-                if timestamp > cutoff
-            ]
-            if active_timestamps:
-                _RATE_LIMITS[existing_user_key] = active_timestamps
-            else:
-                _RATE_LIMITS.pop(existing_user_key, None)
-
-        timestamps = list(_RATE_LIMITS.get(user_key, []))
+        _RATE_LIMITS.idle_seconds = window_seconds
+        timestamps = [
+            timestamp for timestamp in _RATE_LIMITS.get(user_key) if timestamp > cutoff
+        ]
         if len(timestamps) >= max_calls:
-            _RATE_LIMITS[user_key] = timestamps
+            _RATE_LIMITS.set(user_key, timestamps)
             retry_after = math.ceil(max(1, window_seconds - (now - timestamps[0])))
             return False, retry_after
 
         timestamps.append(now)
-        _RATE_LIMITS[user_key] = timestamps
+        _RATE_LIMITS.set(user_key, timestamps)
         return True, None
 
 
@@ -1,8 +1,9 @@
 import json
 import re
-from typing import Optional
+from typing import Callable, Optional
 
-from core import config, group_chat_history, mysql_connection
+from core import config, group_chat_history, mysql_connection, safe_regex
+from core.chat_records import permanent_search_boolean_query
 
 from .context import get_tool_request_context
 
@@ -157,13 +158,159 @@ def fetch_permanent_summaries_tool(
     }
 
 
+def _searchable_messages(snapshot_text: object) -> list[dict]:
+    if isinstance(snapshot_text, bytes):
+        snapshot_text = snapshot_text.decode("utf-8")
+    try:
+        messages = json.loads(snapshot_text) if isinstance(snapshot_text, str) else snapshot_text
+    except (TypeError, ValueError, json.JSONDecodeError):
+        return []
+    if not isinstance(messages, list):
+        return []
+
+    filtered_messages = []
+    for message in messages:
+        if not isinstance(message, dict):
+            continue
+        role = message.get("role")
+        if role not in ("user", "assistant"):
+            continue
+        content = message.get("content")
+        if content is None:
+            continue
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+        if role == "user" and (
+            'origin="history_state"' in content
+            or 'origin="idle_recap"' in content
+        ):
+            continue
+        filtered_messages.append({"role": role, "content": content})
+    return filtered_messages
+
+
+def _collect_match_windows(
+    filtered_messages: list[dict],
+    is_match: Callable[[str], bool],
+    *,
+    record_position: int,
+    created_at: object,
+    results: list[dict],
+    limit: int,
+) -> None:
+    for idx in range(len(filtered_messages) - 1, -1, -1):
+        if not is_match(filtered_messages[idx]["content"]):
+            continue
+
+        before_start = max(0, idx - 5)
+        after_end = min(len(filtered_messages), idx + 6)
+        before = [
+            {"index": before_start + offset, **msg}
+            for offset, msg in enumerate(filtered_messages[before_start:idx])
+        ]
+        after = [
+            {"index": idx + 1 + offset, **msg}
+            for offset, msg in enumerate(filtered_messages[idx + 1 : after_end])
+        ]
+        results.append(
+            {
+                "record_position": record_position,
+                "created_at": created_at.isoformat(sep=" ") if created_at else None,
+                "match": {"index": idx, **filtered_messages[idx]},
+                "before": before,
+                "after": after,
+            }
+        )
+        if len(results) >= limit:
+            return
+
+
+def _keyword_terms(query: str) -> list[str]:
+    terms: list[str] = []
+    for term in query.replace('"', " ").split():
+        folded = term.casefold()
+        if folded not in terms:
+            terms.append(folded)
+    return terms
+
+
+def _search_permanent_records_fulltext(
+    user_id: int,
+    terms: list[str],
+    is_match: Callable[[str], bool],
+    *,
+    scan_limit: int,
+    limit: int,
+    oldest_first: bool,
+) -> list[dict]:
+    """FULLTEXT 先在库里圈出命中的快照，只加载这些快照来拼上下文窗口。"""
+    id_rows = mysql_connection.run_sync(
+        mysql_connection.fetch_all(
+            "SELECT id FROM permanent_chat_records WHERE user_id = %s "
+            "ORDER BY created_at DESC, id DESC",
+            (user_id,),
+        )
+    )
+    ordered_ids = [row[0] for row in id_rows]
+    window_ids = ordered_ids[-scan_limit:] if oldest_first else ordered_ids[:scan_limit]
+    positions = {
+        record_id: position
+        for position, record_id in enumerate(ordered_ids, start=1)
+    }
+
+    match_rows = mysql_connection.run_sync(
+        mysql_connection.fetch_all(
+            "SELECT id FROM permanent_chat_records WHERE user_id = %s "
+            "AND MATCH(search_text) AGAINST (%s IN BOOLEAN MODE)",
+            (user_id, permanent_search_boolean_query(" ".join(terms))),
+        )
+    )
+    window_set = set(window_ids)
+    matched_ids = sorted(
+        (row[0] for row in match_rows if row[0] in window_set),
+        key=positions.__getitem__,
+        reverse=oldest_first,
+    )
+
+    results: list[dict] = []
+    batch_size = 50
+    for start in range(0, len(matched_ids), batch_size):
+        batch_ids = matched_ids[start : start + batch_size]
+        placeholders = ", ".join(["%s"] * len(batch_ids))
+        rows = mysql_connection.run_sync(
+            mysql_connection.fetch_all(
+                "SELECT id, conversation_snapshot, created_at "
+                "FROM permanent_chat_records "
+                f"WHERE user_id = %s AND id IN ({placeholders})",
+                (user_id, *batch_ids),
+            )
+        )
+        rows_by_id = {row[0]: row for row in rows}
+        for record_id in batch_ids:
+            row = rows_by_id.get(record_id)
+            if row is None:
+                continue
+            _collect_match_windows(
+                _searchable_messages(row[1]),
+                is_match,
+                record_position=positions[record_id],
+                created_at=row[2],
+                results=results,
+                limit=limit,
+            )
+            if len(results) >= limit:
+                return results
+    return results
+
+
 def search_permanent_records_tool(
     pattern: str,
     limit: Optional[int] = None,
     oldest_first: Optional[bool] = None,
+    mode: Optional[str] = None,
     **kwargs,
 ) -> dict:
-    """Search user's permanent conversation snapshots with a regex pattern."""
+    """Search user's permanent conversation snapshots with a regex pattern or keywords."""
     context = get_tool_request_context()
     user_id = context.get("user_id")
     if not user_id:
@@ -184,12 +331,53 @@ def search_permanent_records_tool(
     elif isinstance(oldest_first, str):
         oldest_first_value = oldest_first.strip().lower() in {"1", "true", "yes", "y"}
 
+    mode_value = (mode or "regex").strip().lower()
+    if mode_value not in {"regex", "keyword"}:
+        return {"user_id": user_id, "error": f"Unknown search mode: {mode}"}
+
     warning = None
-    try:
-        matcher = re.compile(pattern, re.IGNORECASE | re.DOTALL)
-    except re.error:
-        warning = "Invalid regex pattern, treated as literal string"
-        matcher = re.compile(re.escape(pattern), re.IGNORECASE | re.DOTALL)
+    terms: list[str] = []
+    if mode_value == "keyword":
+        terms = _keyword_terms(pattern)
+        if not terms:
+            return {"user_id": user_id, "error": "Missing search keywords"}
+
+        def is_match(content: str) -> bool:
+            folded = content.casefold()
+            return any(term in folded for term in terms)
+
+    else:
+        # 字面量 pattern 是线性匹配，直接用 re；只有真正的正则才走安全执行层
+        try:
+            matcher = safe_regex.compile_safe(pattern, re.IGNORECASE | re.DOTALL)
+        except re.error:
+            warning = "Invalid regex pattern, treated as literal string"
+            matcher = re.compile(re.escape(pattern), re.IGNORECASE | re.DOTALL)
+        except safe_regex.UnsafePatternError as exc:
+            warning = f"Regex pattern rejected ({exc}), treated as literal string"
+            matcher = re.compile(re.escape(pattern), re.IGNORECASE | re.DOTALL)
+        timed_out = False
+
+        def is_match(content: str) -> bool:
+            nonlocal timed_out
+            if timed_out:
+                return False
+            try:
+                return matcher.search(content) is not None
+            except safe_regex.RegexTimeoutError:
+                timed_out = True
+                return False
+
+    response = {
+        "user_id": user_id,
+        "pattern": pattern,
+        "mode": mode_value,
+        "limit": limit_value,
+        "oldest_first": oldest_first_value,
+        "results": [],
+    }
+    if warning:
+        response["warning"] = warning
 
     total_row = mysql_connection.run_sync(
         mysql_connection.fetch_one(
@@ -199,15 +387,6 @@ def search_permanent_records_tool(
     )
     total_rows = total_row[0] if total_row and total_row[0] is not None else 0
     if total_rows <= 0:
-        response = {
-            "user_id": user_id,
-            "pattern": pattern,
-            "limit": limit_value,
-            "oldest_first": oldest_first_value,
-            "results": [],
-        }
-        if warning:
-            response["warning"] = warning
         return response
 
     max_records = mysql_connection.PERMANENT_RECORDS_KEEP
@@ -229,6 +408,17 @@ def search_permanent_records_tool(
 
     scan_limit = min(max_records, total_rows)
 
+    if mode_value == "keyword" and config.PERMANENT_RECORDS_SEARCH_MODE == "fulltext":
+        response["results"] = _search_permanent_records_fulltext(
+            user_id,
+            terms,
+            is_match,
+            scan_limit=scan_limit,
+            limit=limit_value,
+            oldest_first=oldest_first_value,
+        )
+        return response
+
     order_clause = "ORDER BY created_at ASC, id ASC"
     if not oldest_first_value:
         order_clause = "ORDER BY created_at DESC, id DESC"
@@ -254,75 +444,6 @@ def search_permanent_records_tool(
             return total_rows - (offset + row_index)
         return offset + row_index + 1
 
-    def _scan_rows(rows: list[tuple], results: list[dict], offset: int) -> list[dict]:
-        for row_index, row in enumerate(rows):
-            _record_id, snapshot_text, created_at = row
-            if isinstance(snapshot_text, bytes):
-                snapshot_text = snapshot_text.decode("utf-8")
-
-            try:
-                messages = json.loads(snapshot_text) if isinstance(snapshot_text, str) else snapshot_text
-            except (TypeError, ValueError, json.JSONDecodeError):
-                continue
-
-            if not isinstance(messages, list):
-                continue
-
-            filtered_messages = []
-            for message in messages:
-                if not isinstance(message, dict):
-                    continue
-                role = message.get("role")
-                if role not in ("user", "assistant"):
-                    continue
-                content = message.get("content")
-                if content is None:
-                    continue
-                if not isinstance(content, str):
-                    content = json.dumps(content, ensure_ascii=False)
-                if role == "user" and (
-                    'origin="history_state"' in content
-                    or 'origin="idle_recap"' in content
-                ):
-                    continue
-                filtered_messages.append(
-                    {
-                        "role": role,
-                        "content": content,
-                    }
-                )
-
-            if not filtered_messages:
-                continue
-
-            for idx in range(len(filtered_messages) - 1, -1, -1):
-                content = filtered_messages[idx]["content"]
-                if not matcher.search(content):
-                    continue
-
-                before_start = max(0, idx - 5)
-                after_end = min(len(filtered_messages), idx + 6)
-                before = [
-                    {"index": before_start + offset, **msg}
-                    for offset, msg in enumerate(filtered_messages[before_start:idx])
-                ]
-                after = [
-                    {"index": idx + 1 + offset, **msg}
-                    for offset, msg in enumerate(filtered_messages[idx + 1 : after_end])
-                ]
-                results.append(
-                    {
-                        "record_position": _record_position(offset, row_index),
-                        "created_at": created_at.isoformat(sep=" ") if created_at else None,
-                        "match": {"index": idx, **filtered_messages[idx]},
-                        "before": before,
-                        "after": after,
-                    }
-                )
-                if len(results) >= limit_value:
-                    return results
-        return results
-
     results: list[dict] = []
     offset = 0
     remaining = scan_limit
@@ -331,22 +452,26 @@ def search_permanent_records_tool(
         rows = _fetch_rows(offset, fetch_size)
         if not rows:
             break
-        results = _scan_rows(rows, results, offset)
+        for row_index, row in enumerate(rows):
+            _record_id, snapshot_text, created_at = row
+            _collect_match_windows(
+                _searchable_messages(snapshot_text),
+                is_match,
+                record_position=_record_position(offset, row_index),
+                created_at=created_at,
+                results=results,
+                limit=limit_value,
+            )
+            if len(results) >= limit_value:
+                break
         if len(rows) < fetch_size:
             break
         offset += fetch_size
         remaining -= fetch_size
 
-    response = {
-        "user_id": user_id,
-        "pattern": pattern,
-        "limit": limit_value,
-        "oldest_first": oldest_first_value,
-        "results": results,
-    }
-    if warning:
-        response["warning"] = warning
-
+    response["results"] = results
+    if mode_value == "regex" and timed_out:
+        response["warning"] = "Regex search timed out; results are incomplete"
     return response
 
 
@@ -197,7 +197,21 @@ class FetchPermanentSummariesArgs(ToolArguments):
 
 
 class SearchPermanentRecordsArgs(ToolArguments):
-    pattern: str = Field(description="Regex pattern to search for in user/assistant messages")
+    pattern: str = Field(
+        description=(
+            "Regex pattern to search for in user/assistant messages; in keyword "
+            "mode, space-separated keywords that match if any one appears"
+        )
+    )
+    mode: str | None = Field(
+        default="regex",
+        description=(
+            "regex | keyword. regex matches the pattern as a case-insensitive "
+            "regular expression; keyword matches literal words and is faster on "
+            "long histories"
+        ),
+        json_schema_extra={"enum": ["regex", "keyword"]},
+    )
     limit: int | None = Field(
         default=5,
         ge=1,
@@ -150,7 +150,7 @@ OPENAI_TOOLS: list[dict[str, Any]] = [
     ),
     _tool_definition(
         "search_permanent_records",
-        "Search user's permanent chat snapshots with a regex pattern",
+        "Search user's permanent chat snapshots with a regex pattern or literal keywords",
     ),
     _tool_definition(
         "schedule_ai_message",
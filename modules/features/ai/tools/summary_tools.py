@@ -4,12 +4,14 @@ from __future__ import annotations
 
 import math
 import re
+import threading
 import unicodedata
-from collections import Counter
+from collections import Counter, OrderedDict
 from dataclasses import dataclass
 from typing import Iterable
 
-from core import mysql_connection
+from core import config, mysql_connection
+from core.chat_records import permanent_search_boolean_query
 
 from .context import get_tool_request_context
 
@@ -18,6 +20,8 @@ SUMMARY_BM25_MAX_RESULTS = 3
 SUMMARY_BM25_EXCERPT_CHARS = 800
 SUMMARY_BM25_MIN_SCORE = 0.5
 SUMMARY_BM25_RECENCY_BOOST = 0.35
+SUMMARY_BM25_INDEX_MAX_DOCUMENTS = 200
+SUMMARY_BM25_INDEX_MAX_USERS = 256
 
 _CJK_SEQUENCE_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
 _WORD_RE = re.compile(r"[a-z0-9]+(?:[._/-][a-z0-9]+)*")
@@ -100,69 +104,188 @@ def _matching_excerpt(content: str, query: str) -> str:
     return excerpt
 
 
-def rank_prior_summaries(
-    documents: Iterable[PriorSummaryDocument],
-    query: str,
-    *,
-    limit: int = SUMMARY_BM25_MAX_RESULTS,
-) -> list[dict]:
-    document_list = list(documents)
-    query_tokens = set(_bm25_tokens(query))
-    if not document_list or not query_tokens:
-        return []
-
-    tokenized = [_bm25_tokens(document.content) for document in document_list]
-    lengths = [len(tokens) for tokens in tokenized if tokens]
-    if not lengths:
-        return []
-    average_length = sum(lengths) / len(lengths)
-
-    document_frequency: Counter[str] = Counter()
-    for tokens in tokenized:
-        document_frequency.update(set(tokens) & query_tokens)
-
-    total_documents = len(document_list)
-    scored: list[tuple[float, PriorSummaryDocument]] = []
-    k1 = 1.5
-    b = 0.75
-    for document, tokens in zip(document_list, tokenized):
-        if not tokens:
-            continue
+@dataclass(frozen=True)
+class _IndexedSummary:
+    content: str
+    length: int
+    terms: frozenset[str]
+
+
+class PriorSummaryIndex:
+    """Per-user BM25 postings over summary record ids.
+
+    Documents are tokenized once when they enter the index; each query only
+    walks the postings of its own tokens. Document frequency and average
+    length are computed over the candidate ids passed to ``rank`` so scores
+    match the bounded window the caller selected.
+    """
+
+    def __init__(self, max_documents: int = 0) -> None:
+        self.max_documents = max_documents
+        self._documents: dict[int, _IndexedSummary] = {}
+        self._postings: dict[str, dict[int, int]] = {}
+
+    def __contains__(self, record_id: int) -> bool:
+        return record_id in self._documents
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def missing(self, record_ids: Iterable[int]) -> list[int]:
+        return [record_id for record_id in record_ids if record_id not in self._documents]
+
+    def discard(self, record_id: int) -> None:
+        document = self._documents.pop(record_id, None)
+        if document is None:
+            return
+        for token in document.terms:
+            posting = self._postings.get(token)
+            if posting is None:
+                continue
+            posting.pop(record_id, None)
+            if not posting:
+                del self._postings[token]
+
+    def upsert(self, record_id: int, summary: object) -> None:
+        if record_id in self._documents:
+            self.discard(record_id)
+        content = re.sub(r"\s+", " ", str(summary or "")).strip()
+        tokens = _bm25_tokens(content)
         frequencies = Counter(tokens)
-        score = 0.0
+        self._documents[record_id] = _IndexedSummary(
+            content=content,
+            length=len(tokens),
+            terms=frozenset(frequencies),
+        )
+        for token, frequency in frequencies.items():
+            self._postings.setdefault(token, {})[record_id] = frequency
+        if self.max_documents and len(self._documents) > self.max_documents:
+            # Windows always take the newest summaries; the lowest ids are
+            # the least likely to be requested again.
+            for stale_id in sorted(self._documents)[: len(self._documents) - self.max_documents]:
+                self.discard(stale_id)
+
+    def rank(
+        self,
+        query: str,
+        candidates: Iterable[tuple[int, str | None, int]],
+        *,
+        limit: int = SUMMARY_BM25_MAX_RESULTS,
+    ) -> list[dict]:
+        """Score ``(record_id, created_at, recency_rank)`` candidates."""
+        query_tokens = set(_bm25_tokens(query))
+        window = [
+            (record_id, created_at, recency_rank)
+            for record_id, created_at, recency_rank in candidates
+            if self._documents.get(record_id) is not None
+            and self._documents[record_id].content
+        ]
+        if not window or not query_tokens:
+            return []
+
+        lengths = [
+            self._documents[record_id].length
+            for record_id, _created_at, _rank in window
+            if self._documents[record_id].length
+        ]
+        if not lengths:
+            return []
+        average_length = sum(lengths) / len(lengths)
+        window_ids = {record_id for record_id, _created_at, _rank in window}
+
+        total_documents = len(window)
+        scores: dict[int, float] = {}
+        k1 = 1.5
+        b = 0.75
         for token in query_tokens:
-            frequency = frequencies.get(token, 0)
-            if frequency <= 0:
+            posting = self._postings.get(token)
+            if not posting:
+                continue
+            hits = [
+                (record_id, frequency)
+                for record_id, frequency in posting.items()
+                if record_id in window_ids
+            ]
+            if not hits:
                 continue
-            frequency_in_documents = document_frequency[token]
             inverse_document_frequency = math.log(
-                1
-                + (total_documents - frequency_in_documents + 0.5)
-                / (frequency_in_documents + 0.5)
-            )
-            denominator = frequency + k1 * (
-                1 - b + b * len(tokens) / average_length
-            )
-            score += inverse_document_frequency * (
-                frequency * (k1 + 1) / denominator
+                1 + (total_documents - len(hits) + 0.5) / (len(hits) + 0.5)
             )
+            for record_id, frequency in hits:
+                denominator = frequency + k1 * (
+                    1 - b + b * self._documents[record_id].length / average_length
+                )
+                scores[record_id] = scores.get(record_id, 0.0) + (
+                    inverse_document_frequency * frequency * (k1 + 1) / denominator
+                )
 
-        if score <= 0:
-            continue
-        score += SUMMARY_BM25_RECENCY_BOOST / (document.recency_rank + 1)
-        if score >= SUMMARY_BM25_MIN_SCORE:
-            scored.append((score, document))
-
-    result_limit = max(1, min(int(limit), SUMMARY_BM25_MAX_RESULTS))
-    scored.sort(key=lambda item: item[0], reverse=True)
-    return [
-        {
-            "created_at": document.created_at,
-            "content": _matching_excerpt(document.content, query),
-            "score": round(score, 4),
-        }
-        for score, document in scored[:result_limit]
-    ]
+        scored: list[tuple[float, int, str | None]] = []
+        for record_id, created_at, recency_rank in window:
+            score = scores.get(record_id, 0.0)
+            if score <= 0:
+                continue
+            score += SUMMARY_BM25_RECENCY_BOOST / (recency_rank + 1)
+            if score >= SUMMARY_BM25_MIN_SCORE:
+                scored.append((score, record_id, created_at))
+
+        result_limit = max(1, min(int(limit), SUMMARY_BM25_MAX_RESULTS))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return [
+            {
+                "created_at": created_at,
+                "content": _matching_excerpt(self._documents[record_id].content, query),
+                "score": round(score, 4),
+            }
+            for score, record_id, created_at in scored[:result_limit]
+        ]
+
+
+_PRIOR_SUMMARY_INDEXES: "OrderedDict[int, PriorSummaryIndex]" = OrderedDict()
+# The summary executor runs jobs on several threads.
+_PRIOR_SUMMARY_INDEX_LOCK = threading.Lock()
+
+
+def _prior_summary_index(user_id: int) -> PriorSummaryIndex:
+    index = _PRIOR_SUMMARY_INDEXES.get(user_id)
+    if index is None:
+        index = PriorSummaryIndex(SUMMARY_BM25_INDEX_MAX_DOCUMENTS)
+        _PRIOR_SUMMARY_INDEXES[user_id] = index
+        while len(_PRIOR_SUMMARY_INDEXES) > SUMMARY_BM25_INDEX_MAX_USERS:
+            _PRIOR_SUMMARY_INDEXES.popitem(last=False)
+    else:
+        _PRIOR_SUMMARY_INDEXES.move_to_end(user_id)
+    return index
+
+
+def update_prior_summary_index(user_id: int, record_id: int, summary: str) -> None:
+    """Fold a freshly stored summary into the user's cached index.
+
+    Users without a cached index are skipped; their index is built lazily on
+    the next search.
+    """
+    with _PRIOR_SUMMARY_INDEX_LOCK:
+        index = _PRIOR_SUMMARY_INDEXES.get(int(user_id))
+        if index is not None:
+            index.upsert(int(record_id), summary)
+
+
+def clear_prior_summary_indexes() -> None:
+    with _PRIOR_SUMMARY_INDEX_LOCK:
+        _PRIOR_SUMMARY_INDEXES.clear()
+
+
+def rank_prior_summaries(
+    documents: Iterable[PriorSummaryDocument],
+    query: str,
+    *,
+    limit: int = SUMMARY_BM25_MAX_RESULTS,
+) -> list[dict]:
+    index = PriorSummaryIndex()
+    candidates = []
+    for position, document in enumerate(documents):
+        index.upsert(position, document.content)
+        candidates.append((position, document.created_at, document.recency_rank))
+    return index.rank(query, candidates, limit=limit)
 
 
 def search_prior_context_tool(query: str, limit: int | None = None) -> dict:
@@ -184,29 +307,75 @@ def search_prior_context_tool(query: str, limit: int | None = None) -> dict:
 
     # Both boundaries are injected by the runner. The model cannot select a
     # different user or search the snapshot currently being summarized.
-    rows = mysql_connection.run_sync(
-        mysql_connection.fetch_all(
-            "SELECT created_at, summary FROM permanent_chat_records "
-            "WHERE user_id = %s AND id < %s "
-            "AND summary IS NOT NULL AND summary <> '' "
-            "ORDER BY created_at DESC, id DESC LIMIT %s",
-            (int(user_id), int(record_id), SUMMARY_BM25_MAX_SUMMARIES),
+    # Only ids are listed here; summary text is loaded for ids the cached
+    # index has not seen yet.
+    rows = []
+    if config.PERMANENT_RECORDS_SEARCH_MODE == "fulltext":
+        # Let the FULLTEXT index pick the most recent matching archives, so
+        # older relevant summaries can still reach BM25 ranking.
+        rows = mysql_connection.run_sync(
+            mysql_connection.fetch_all(
+                "SELECT id, created_at FROM permanent_chat_records "
+                "WHERE user_id = %s AND id < %s "
+                "AND summary IS NOT NULL AND summary <> '' "
+                "AND MATCH(search_text) AGAINST (%s IN BOOLEAN MODE) "
+                "ORDER BY created_at DESC, id DESC LIMIT %s",
+                (
+                    int(user_id),
+                    int(record_id),
+                    permanent_search_boolean_query(query_value),
+                    SUMMARY_BM25_MAX_SUMMARIES,
+                ),
+            )
         )
-    )
-    documents = build_prior_summary_documents(rows)
+    if not rows:
+        rows = mysql_connection.run_sync(
+            mysql_connection.fetch_all(
+                "SELECT id, created_at FROM permanent_chat_records "
+                "WHERE user_id = %s AND id < %s "
+                "AND summary IS NOT NULL AND summary <> '' "
+                "ORDER BY created_at DESC, id DESC LIMIT %s",
+                (int(user_id), int(record_id), SUMMARY_BM25_MAX_SUMMARIES),
+            )
+        )
+    candidates = [
+        (int(row[0]), _timestamp_text(row[1]), recency_rank)
+        for recency_rank, row in enumerate(rows or [])
+    ]
+
+    with _PRIOR_SUMMARY_INDEX_LOCK:
+        missing = _prior_summary_index(int(user_id)).missing(
+            candidate[0] for candidate in candidates
+        )
+    if missing:
+        placeholders = ", ".join(["%s"] * len(missing))
+        summary_rows = mysql_connection.run_sync(
+            mysql_connection.fetch_all(
+                "SELECT id, summary FROM permanent_chat_records "
+                f"WHERE user_id = %s AND id IN ({placeholders})",
+                (int(user_id), *missing),
+            )
+        )
+    else:
+        summary_rows = []
+
+    with _PRIOR_SUMMARY_INDEX_LOCK:
+        index = _prior_summary_index(int(user_id))
+        for summary_id, summary in summary_rows or []:
+            index.upsert(int(summary_id), summary)
+        results = index.rank(query_value, candidates, limit=limit_value)
     return {
         "query": query_value,
-        "results": rank_prior_summaries(
-            documents,
-            query_value,
-            limit=limit_value,
-        ),
+        "results": results,
     }
 
 
 __all__ = [
     "PriorSummaryDocument",
+    "PriorSummaryIndex",
     "build_prior_summary_documents",
+    "clear_prior_summary_indexes",
     "rank_prior_summaries",
     "search_prior_context_tool",
+    "update_prior_summary_index",
 ]
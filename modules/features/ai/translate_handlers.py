@@ -180,7 +180,7 @@ async def tl_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         try:
             pool_add = stake_reward_pool.calculate_pool_add(coin_cost)
             if pool_add > 0:
-                await stake_reward_pool.add_to_pool(pool_add)
+                await stake_reward_pool.add_to_pool(pool_add, shard_key=user_id)
         except Exception as pool_error:
             logger.error("更新奖励池失败: %s", pool_error)
     except Exception as e:
@@ -14,16 +14,17 @@ from core import (
     stake_reward_pool,
 )
 from core.archive_utils import send_permanent_records_archive
-from core.prompt_utils import format_user_state_prompt
 from core.telegram_history import (
     capture_telegram_history_events,
     format_user_message as _format_xml_message,
     flush_pending_events,
     normalize_command_name,
     suppress_telegram_history,
+    take_pending_events,
     telegram_history_scope,
 )
 from core.telegram_utils import partial_send, safe_send_markdown
+from core.user_records import load_user_turn_context
 from features.ai import ai_chat, idle_followup, summary
 from features.ai.conversation_locks import get_conversation_lock
 from features.ai.outbound import send_generated_media
@@ -37,6 +38,7 @@ from features.ai.tool_history import (
     tool_logs_completed_clear,
     tool_logs_to_record_entries,
 )
+from features.ai.user_state import format_user_context_prompt
 
 from . import batching, lifecycle, messages, triggers
 from .history_hooks import handle_history_overflow
@@ -328,223 +330,214 @@ async def _reply_batch_unlocked(batch_items: list[batching._QueuedUpdate]) -> No
     if not message_jobs:
         return
 
-    # 在扣费前写完上一项操作，避免余额恰好归零时把旧事件误判为收尾记录。
-    await flush_pending_events(conversation_id)
-
     async with mysql_connection.transaction() as connection:
-        row = await mysql_connection.fetch_one(
-            "SELECT permission, coins, coins_paid, info FROM user WHERE id = %s",
-            (user_id,),
+        # 一次查询取回本轮要用的用户信息并锁住 user 行，扣费和提示词都用这份快照
+        user_context = await load_user_turn_context(
+            user_id,
             connection=connection,
+            for_update=True,
         )
-        if not row:
+        if user_context is None:
             await effective_message.reply_text(
                 "请先使用 /me 命令注册个人信息后再聊天。\n"
                 "Please register first using the /me command before chatting."
             )
             return
-        user_permission = row[0]
-        user_coins_free = row[1] or 0
-        user_coins_paid = row[2] or 0
-        user_info_raw = row[3] if len(row) > 3 else ""
-        user_coins = user_coins_free + user_coins_paid
 
-        if user_coins < total_coin_cost:
+        if user_context.total_coins < total_coin_cost:
             await effective_message.reply_text(
                 f"您的硬币不足，无法与雾萌娘连接，需要{total_coin_cost}个硬币。试试通过 /lottery 抽奖吧！\n"
                 f"You don't have enough coins (need {total_coin_cost}), I don't want to talk to you. "
                 f"Try using /lottery to get some coins!")
             return
 
-        await process_user.spend_user_coins(
-            user_id,
+        user_context = await process_user.spend_coins_from_context(
+            user_context,
             total_coin_cost,
             connection=connection,
         )
         pool_add = stake_reward_pool.calculate_pool_add(total_coin_cost)
         if pool_add > 0:
-            await stake_reward_pool.add_to_pool(pool_add, connection=connection)
-        if user_coins_free >= total_coin_cost:
-            new_free = user_coins_free - total_coin_cost
-            new_paid = user_coins_paid
-        else:
-            remaining = total_coin_cost - user_coins_free
-            new_free = 0
-            new_paid = max(user_coins_paid - remaining, 0)
-        user_coins = new_free + new_paid
-        user_plan = process_user.resolve_user_plan(user_id, new_paid)
-
-    user_impression_raw = await process_user.async_get_user_impression(user_id)
-    impression_display = (user_impression_raw or "").strip()
-    if impression_display:
-        impression_display = impression_display.replace("\r", " ").replace("\n", " ")
-        if len(impression_display) > 500:
-            impression_display = impression_display[:497] + "..."
-    else:
-        impression_display = "Not recorded"
-
-    personal_info_display = (user_info_raw or "").strip()
-    if personal_info_display:
-        if len(personal_info_display) > 500:
-            personal_info_display = personal_info_display[:500]
-
-    diary_row = await mysql_connection.fetch_one(
-        "SELECT 1 FROM ai_user_diary_pages WHERE user_id = %s AND content != '' LIMIT 1",
-        (user_id,),
-    )
-    diary_exists = bool(diary_row)
-
-    user_state_prompt = format_user_state_prompt(
-        user_coins=user_coins,
-        user_plan=user_plan,
-        user_permission=user_permission,
-        impression=impression_display,
-        personal_info=personal_info_display,
-        diary_exists=diary_exists,
-    )
+            await stake_reward_pool.add_to_pool(
+                pool_add,
+                connection=connection,
+                shard_key=user_id,
+            )
+
+    user_state_prompt = format_user_context_prompt(user_context)
 
     chat_type = update.effective_chat.type or "private"
     group_title = (update.effective_chat.title or "").strip() if update.effective_chat else ""
-    user_record_entries = []
+
+    # 本轮之前待写的元事件（命令、按钮、bot 回复等）并入本轮的历史写入，不再单独
+    # 读改写一次。扣费事务提交后才从内存取走，事务回滚时它们仍在缓冲里；之后提前
+    # 返回或出错没能写入的，在 finally 里单独补写，不会丢。
+    history_entries = [
+        ("user", content) for content in await take_pending_events(conversation_id)
+    ]
+    history_saved = False
+
+    async def write_history_entries() -> None:
+        if history_entries and not history_saved:
+            await persist_records(
+                await mysql_connection.async_insert_chat_records(
+                    conversation_id,
+                    history_entries,
+                    allow_zero_balance=True,
+                ),
+                announce=True,
+            )
+
+    user_record_entries = list(history_entries)
     runtime_replacements = []
 
-    for job in message_jobs:
-        message = job["message"]
-        current_message_time = messages._format_message_timestamp(message.date) or time.strftime(
-            '%Y-%m-%d %H:%M:%S'
-        )
-        is_edited = bool(job.get("is_edited"))
-        message_metadata_kwargs = {
-            "message_id": getattr(message, "message_id", None),
-            "edited": is_edited,
-            "edited_at": (
-                messages._format_message_timestamp(getattr(message, "edit_date", None))
-                if is_edited
-                else None
-            ),
-        }
-        command = normalize_command_name(getattr(message, "text", None))
-        if command:
-            message_metadata_kwargs.update(
-                {
-                    "event": "command",
-                    "command": command,
-                }
+    try:
+        for job in message_jobs:
+            message = job["message"]
+            current_message_time = messages._format_message_timestamp(message.date) or time.strftime(
+                '%Y-%m-%d %H:%M:%S'
+            )
+            is_edited = bool(job.get("is_edited"))
+            message_metadata_kwargs = {
+                "message_id": getattr(message, "message_id", None),
+                "edited": is_edited,
+                "edited_at": (
+                    messages._format_message_timestamp(getattr(message, "edit_date", None))
+                    if is_edited
+                    else None
+                ),
+            }
+            command = normalize_command_name(getattr(message, "text", None))
+            if command:
+                message_metadata_kwargs.update(
+                    {
+                        "event": "command",
+                        "command": command,
+                    }
+                )
+            forward_kwargs = messages._build_forward_format_kwargs(message)
+            reply_kwargs = (
+                messages._build_reply_format_kwargs(message.reply_to_message)
+                if message.reply_to_message
+                else {}
             )
-        forward_kwargs = messages._build_forward_format_kwargs(message)
-        reply_kwargs = (
-            messages._build_reply_format_kwargs(message.reply_to_message)
-            if message.reply_to_message
-            else {}
-        )
 
-        # 如果是媒体消息，进行下载、AI分析、格式化描述
-        if job["is_media"]:
-            try:
-                if message.photo:
-                    media_type = "photo"
-                    file = await message.photo[-1].get_file()
-                    media_emoji = None
-                else:
-                    media_type = "sticker"
-                    file = await message.sticker.get_file()
-                    media_emoji = getattr(message.sticker, "emoji", None)
-
-                # 检查是否有文本说明
-                caption = message.caption if message.caption else ""
-
-                file_size = getattr(file, "file_size", None)
-                if file_size and file_size > MAX_MEDIA_DOWNLOAD_BYTES:
-                    await message.reply_text(
-                        "图片太大啦，请压缩后再发送。\n"
-                        "The image is too large. Please compress it and try again."
+            # 如果是媒体消息，进行下载、AI分析、格式化描述
+            if job["is_media"]:
+                try:
+                    if message.photo:
+                        media_type = "photo"
+                        file = await message.photo[-1].get_file()
+                        media_emoji = None
+                    else:
+                        media_type = "sticker"
+                        file = await message.sticker.get_file()
+                        media_emoji = getattr(message.sticker, "emoji", None)
+
+                    # 检查是否有文本说明
+                    caption = message.caption if message.caption else ""
+
+                    file_size = getattr(file, "file_size", None)
+                    if file_size and file_size > MAX_MEDIA_DOWNLOAD_BYTES:
+                        await message.reply_text(
+                            "图片太大啦，请压缩后再发送。\n"
+                            "The image is too large. Please compress it and try again."
+                        )
+                        return
+
+                    # 直接下载到内存，避免把用户图片落盘。
+                    file_bytes = await file.download_as_bytearray()
+                    if len(file_bytes) > MAX_MEDIA_DOWNLOAD_BYTES:
+                        await message.reply_text(
+                            "图片太大啦，请压缩后再发送。\n"
+                            "The image is too large. Please compress it and try again."
+                        )
+                        return
+
+                    base64_str = base64.b64encode(file_bytes).decode('utf-8')
+
+                    # 异步调用图像分析AI
+                    image_description = await ai_chat.analyze_image(base64_str)
+
+                    # 组合图片描述和用户文本说明
+                    message_text = caption if caption else f"[{media_type}]"
+                    formatted_message = _format_xml_message(
+                        chat_type=chat_type,
+                        chat_title=group_title or None,
+                        timestamp=current_message_time,
+                        user_name=user_name,
+                        message_text=message_text,
+                        **message_metadata_kwargs,
+                        **forward_kwargs,
+                        **reply_kwargs,
+                        media_type=media_type,
+                        media_description=image_description,
+                        media_emoji=media_emoji,
                     )
-                    return
+                    runtime_formatted_message = _format_xml_message(
+                        chat_type=chat_type,
+                        chat_title=group_title or None,
+                        timestamp=current_message_time,
+                        user_name=user_name,
+                        message_text=message_text,
+                        **message_metadata_kwargs,
+                        **forward_kwargs,
+                        **reply_kwargs,
+                        media_type=media_type,
+                        media_emoji=media_emoji,
+                    )
+                    runtime_user_message = messages._build_multimodal_user_message(
+                        runtime_formatted_message,
+                        base64_str=base64_str,
+                        mime_type=messages._media_mime_type(media_type, message),
+                    )
+                    if runtime_user_message:
+                        runtime_replacements.append(
+                            (formatted_message, runtime_user_message)
+                        )
 
-                # 直接下载到内存，避免把用户图片落盘。
-                file_bytes = await file.download_as_bytearray()
-                if len(file_bytes) > MAX_MEDIA_DOWNLOAD_BYTES:
+                except Exception as e:
+                    logging.error(f"处理媒体消息时出错: {str(e)}")
                     await message.reply_text(
-                        "图片太大啦，请压缩后再发送。\n"
-                        "The image is too large. Please compress it and try again."
-                    )
+                        "抱歉呢，雾萌娘暂时无法处理您发送的媒体，请稍后再试试看喵~\n"
+                        "Sorry, I'm having trouble processing your image/sticker right now. Please try again later, meow!")
                     return
-
-                base64_str = base64.b64encode(file_bytes).decode('utf-8')
-
-                # 异步调用图像分析AI
-                image_description = await ai_chat.analyze_image(base64_str)
-
-                # 组合图片描述和用户文本说明
-                message_text = caption if caption else f"[{media_type}]"
+            else:
+                # 保留原有文本处理逻辑，处理文本消息
+                user_message = message.text or ""
                 formatted_message = _format_xml_message(
                     chat_type=chat_type,
                     chat_title=group_title or None,
                     timestamp=current_message_time,
                     user_name=user_name,
-                    message_text=message_text,
+                    message_text=user_message,
                     **message_metadata_kwargs,
                     **forward_kwargs,
                     **reply_kwargs,
-                    media_type=media_type,
-                    media_description=image_description,
-                    media_emoji=media_emoji,
                 )
-                runtime_formatted_message = _format_xml_message(
-                    chat_type=chat_type,
-                    chat_title=group_title or None,
-                    timestamp=current_message_time,
-                    user_name=user_name,
-                    message_text=message_text,
-                    **message_metadata_kwargs,
-                    **forward_kwargs,
-                    **reply_kwargs,
-                    media_type=media_type,
-                    media_emoji=media_emoji,
-                )
-                runtime_user_message = messages._build_multimodal_user_message(
-                    runtime_formatted_message,
-                    base64_str=base64_str,
-                    mime_type=messages._media_mime_type(media_type, message),
-                )
-                if runtime_user_message:
-                    runtime_replacements.append(
-                        (formatted_message, runtime_user_message)
-                    )
 
-            except Exception as e:
-                logging.error(f"处理媒体消息时出错: {str(e)}")
-                await message.reply_text(
-                    "抱歉呢，雾萌娘暂时无法处理您发送的媒体，请稍后再试试看喵~\n"
-                    "Sorry, I'm having trouble processing your image/sticker right now. Please try again later, meow!")
-                return
-        else:
-            # 保留原有文本处理逻辑，处理文本消息
-            user_message = message.text or ""
-            formatted_message = _format_xml_message(
-                chat_type=chat_type,
-                chat_title=group_title or None,
-                timestamp=current_message_time,
-                user_name=user_name,
-                message_text=user_message,
-                **message_metadata_kwargs,
-                **forward_kwargs,
-                **reply_kwargs,
-            )
+            if command != "fogmoebot":
+                user_record_entries.append(("user", formatted_message))
 
-        if command != "fogmoebot":
-            user_record_entries.append(("user", formatted_message))
-
-    if user_record_entries:
-        # /fogmoebot 已由统一命令观察器写入；其他消息在这里批量写入。
-        await persist_records(
-            await mysql_connection.async_insert_chat_records(
+        if user_record_entries:
+            # /fogmoebot 由统一命令观察器记为元事件，随上面的元事件一起写入；其他消息在这里批量写入。
+            inserted_records = await mysql_connection.async_insert_chat_records(
                 conversation_id,
                 user_record_entries,
                 system_prompt_extra=user_state_prompt,
                 allow_zero_balance=True,
+                # 媒体要下载和识图，中途余额可能被别的操作改过，这时让写入事务自己回查
+                known_total_coins=(
+                    None
+                    if any(job["is_media"] for job in message_jobs)
+                    else user_context.total_coins
+                ),
             )
-        )
+            history_saved = True
+            await persist_records(inserted_records)
+    finally:
+        await write_history_entries()
+
     if update.effective_chat.type == "private":
         await idle_followup.arm_from_private_turn(user_id)
 
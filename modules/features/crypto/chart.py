@@ -1,21 +1,31 @@
 import logging
-import time
 
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import CommandHandler, ContextTypes
 from sqlalchemy.exc import SQLAlchemyError
 
-from core import mysql_connection
+from core import cache_invalidation, mysql_connection
 from core.command_cooldown import cooldown  # 导入命令冷却装饰器
+from core.telegram_utils import is_chat_admin
 
 # 创建日志记录器
 logger = logging.getLogger(__name__)
 
-# 创建缓存
-token_cache = {}  # 群组ID -> (chain, ca) 的映射
-cache_timestamps = {}  # 群组ID -> 缓存时间戳的映射
-CACHE_EXPIRY = 600  # 缓存过期时间（秒），10分钟
+# 创建缓存：群组ID -> (chain, ca)，未绑定的群缓存 None
+# 不设过期时间，绑定/清除时发布失效，其他实例据此丢掉对应条目
+token_cache = {}
+CHART_TOKEN_TOPIC = "group_chart_token"
+
+
+def _on_token_invalidated(key):
+    if key is None:
+        token_cache.clear()
+    else:
+        token_cache.pop(int(key), None)
+
+
+cache_invalidation.subscribe(CHART_TOKEN_TOPIC, _on_token_invalidated)
 
 
 async def bind_token_for_group(group_id, chain, ca, set_by):
@@ -38,7 +48,7 @@ async def bind_token_for_group(group_id, chain, ca, set_by):
                 )
 
         token_cache[group_id] = (chain, ca)
-        cache_timestamps[group_id] = time.time()
+        await cache_invalidation.publish(CHART_TOKEN_TOPIC, group_id, notify_local=False)
         return True
     except SQLAlchemyError as e:
         logger.error(f"数据库错误: {str(e)}")
@@ -46,43 +56,21 @@ async def bind_token_for_group(group_id, chain, ca, set_by):
 
 
 async def get_group_token(group_id):
-    current_time = time.time()
-    if group_id in token_cache and group_id in cache_timestamps:
-        if current_time - cache_timestamps[group_id] < CACHE_EXPIRY:
-            logger.info(f"从缓存获取群组 {group_id} 的代币信息")
-            return token_cache[group_id]
+    if group_id in token_cache:
+        return token_cache[group_id]
 
     row = await mysql_connection.fetch_one(
         "SELECT chain, ca FROM group_chart_tokens WHERE group_id = %s",
         (group_id,),
     )
-    if row:
-        token_cache[group_id] = (row[0], row[1])
-        cache_timestamps[group_id] = current_time
-        return token_cache[group_id]
-    return None
-
-
-def clean_expired_cache():
-    current_time = time.time()
-    expired_keys = [
-        group_id for group_id in cache_timestamps
-        if current_time - cache_timestamps[group_id] >= CACHE_EXPIRY
-    ]
-
-    for group_id in expired_keys:
-        token_cache.pop(group_id, None)
-        cache_timestamps.pop(group_id, None)
-
-    if expired_keys:
-        logger.info(f"已清理 {len(expired_keys)} 个过期缓存条目")
+    token_cache[group_id] = (row[0], row[1]) if row else None
+    return token_cache[group_id]
 
 
 async def is_user_admin(update: Update):
     user_id = update.effective_user.id
     try:
-        chat_member = await update.effective_chat.get_member(user_id)
-        return chat_member.status in ["creator", "administrator"]
+        return await is_chat_admin(update.get_bot(), update.effective_chat.id, user_id)
     except Exception as e:
         logger.error(f"检查管理员权限时出错: {str(e)}")
         return False
@@ -94,8 +82,8 @@ async def delete_token_for_group(group_id):
             "DELETE FROM group_chart_tokens WHERE group_id = %s",
             (group_id,),
         )
-        token_cache.pop(group_id, None)
-        cache_timestamps.pop(group_id, None)
+        token_cache[group_id] = None
+        await cache_invalidation.publish(CHART_TOKEN_TOPIC, group_id, notify_local=False)
         return True
     except SQLAlchemyError as e:
         logger.error(f"数据库错误: {str(e)}")
@@ -157,8 +145,6 @@ async def chart_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     if len(args) == 0:
         group_id = update.effective_chat.id
-        if cache_timestamps:
-            clean_expired_cache()
         token_info = await get_group_token(group_id)
 
         if token_info:
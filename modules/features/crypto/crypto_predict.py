@@ -8,23 +8,18 @@ from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler
 from telegram.constants import ParseMode
 import time
 from core.command_cooldown import cooldown
+from core.keyed_registry import KeyedLocks
 
 
 logger = logging.getLogger(__name__)
-# 用户级别的锁，而非全局锁，避免不同用户操作互相阻塞
-user_locks = {}
+# 用户级别的锁，而非全局锁，避免不同用户操作互相阻塞；没人使用时自动回收
+user_locks = KeyedLocks()
 # 每个用户的预测任务，防止重复开启
 active_predict_tasks = {}  # {user_id: asyncio.Task}
 # 添加一个全局字典来跟踪用户的按钮点击，防止重复点击
 button_click_cooldown = {}  # {user_id: last_click_time}
 CLICK_COOLDOWN_SECONDS = 3  # 设置按钮冷却时间为3秒
 
-async def get_user_lock(user_id):
-    """获取特定用户的锁，如果不存在则创建"""
-    if (user_id not in user_locks):
-        user_locks[user_id] = asyncio.Lock()
-    return user_locks[user_id]
-
 async def get_btc_price():
     """获取比特币当前价格"""
     try:
@@ -303,11 +298,10 @@ async def crypto_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     return
             
             # 使用用户特定的锁，防止同一用户多次操作冲突
-            user_lock = await get_user_lock(user_id)
             # 增加锁的超时控制，防止长时间阻塞
             try:
                 # 修改timeout的使用方式，使用asyncio.wait_for替代
-                async with user_lock:
+                async with user_locks.hold(user_id):
                     # 设置任务超时
                     async def locked_operation():
                         # 检查用户是否已有活跃预测 - 这里再次检查是为了防止快速点击导致的并发问题
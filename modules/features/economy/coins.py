@@ -1,5 +1,4 @@
 import logging
-import time
 from datetime import datetime
 
 from telegram import Update
@@ -8,9 +7,10 @@ from telegram.ext import ContextTypes
 from core import mysql_connection, process_user
 from core.command_cooldown import cooldown
 
+from . import leaderboard
+
 logger = logging.getLogger(__name__)
 
-last_rich_query_time = 0
 GIVE_DAILY_LIMIT = 5
 
 
@@ -30,15 +30,21 @@ async def lottery_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 @cooldown
 async def rich_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global last_rich_query_time
-    current_time = time.time()
-    if current_time - last_rich_query_time < 60:
-        await update.message.reply_text("查询过于频繁，每60秒只能查询一次，请稍后再试。")
-        return
-    last_rich_query_time = current_time
+    """/rich [页码]：富豪榜，附带自己的名次。"""
+    page = 1
+    if context.args:
+        try:
+            page = int(context.args[0])
+        except ValueError:
+            page = 0
+        if not 1 <= page <= leaderboard.RICH_MAX_PAGE:
+            await update.message.reply_text(
+                f"用法：/rich [页码]，页码为 1-{leaderboard.RICH_MAX_PAGE}"
+            )
+            return
     try:
-        query = "SELECT name, (coins + coins_paid) AS coins_total FROM user ORDER BY coins_total DESC LIMIT 5"
-        results = await mysql_connection.fetch_all(query)
+        results = await leaderboard.get_leaderboard_page(page)
+        my_rank = await leaderboard.get_user_rank(update.effective_user.id)
     except Exception as e:
         await update.message.reply_text(f"查询富豪榜时出错：{str(e)}")
         return
@@ -47,9 +53,16 @@ async def rich_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("暂无数据")
         return
 
-    rich_list = " 富豪榜 Top 5 \n\n"
-    for idx, (name, coins) in enumerate(results, start=1):
+    first_rank = (page - 1) * leaderboard.RICH_PAGE_SIZE + 1
+    if page == 1:
+        rich_list = f" 富豪榜 Top {leaderboard.RICH_PAGE_SIZE} \n\n"
+    else:
+        rich_list = f" 富豪榜 第 {page} 页 \n\n"
+    for idx, (_user_id, name, coins) in enumerate(results, start=first_rank):
         rich_list += f"{idx}. {name} - {coins} 枚硬币\n"
+    if my_rank is not None:
+        rank, coins = my_rank
+        rich_list += f"\n你的排名：第 {rank} 名 - {coins} 枚硬币"
     await update.message.reply_text(rich_list)
 
 
@@ -0,0 +1,83 @@
+"""/rich 富豪榜查询。
+
+排序依据是 user.coins_total（迁移 0023 加的生成列，等于 coins + coins_paid），
+由 MySQL 随每次余额变动自动维护并建了 (coins_total, id) 索引：取一页是沿索引倒序
+读几行，查自己的名次是数一段索引区间，都不再扫全表排序。榜单上余额相同按 id
+倒序，名次稳定。每页结果在进程内缓存一小段时间，连续刷榜不重复查库。
+
+名次按余额并列（余额相同名次相同），只由硬币总数决定，所以"前面有多少人"按
+硬币总数缓存：数索引区间的代价和名次成正比，排名靠后的用户反复 /rich 时不再每次
+都数一遍。
+"""
+
+import time
+
+from core import mysql_connection
+
+RICH_PAGE_SIZE = 10
+RICH_MAX_PAGE = 50  # OFFSET 越大越慢，只开放前面这些页
+RICH_CACHE_SECONDS = 60
+RICH_RANK_CACHE_SIZE = 1024  # 最多缓存这么多个不同硬币总数的名次
+
+# {页码: (过期时间, [(user_id, name, coins_total), ...])}
+_page_cache: dict[int, tuple[float, list[tuple[int, str, int]]]] = {}
+# {硬币总数: (过期时间, 余额更高的人数)}
+_rank_cache: dict[int, tuple[float, int]] = {}
+
+
+async def get_leaderboard_page(page: int = 1, *, clock=time.monotonic):
+    """返回第 ``page`` 页（从 1 开始），每页 RICH_PAGE_SIZE 人。"""
+    page = max(1, min(int(page), RICH_MAX_PAGE))
+    now = clock()
+    cached = _page_cache.get(page)
+    if cached is not None and now < cached[0]:
+        return cached[1]
+    rows = await mysql_connection.fetch_all(
+        "SELECT id, name, coins_total FROM user "
+        "ORDER BY coins_total DESC, id DESC LIMIT %s OFFSET %s",
+        (RICH_PAGE_SIZE, (page - 1) * RICH_PAGE_SIZE),
+    )
+    entries = [(int(row[0]), row[1], int(row[2] or 0)) for row in rows or []]
+    _page_cache[page] = (now + RICH_CACHE_SECONDS, entries)
+    return entries
+
+
+async def get_user_rank(user_id: int, *, clock=time.monotonic) -> tuple[int, int] | None:
+    """返回 (名次, 硬币总数)；未注册返回 None。余额相同的用户名次相同。"""
+    row = await mysql_connection.fetch_one(
+        "SELECT coins_total FROM user WHERE id = %s",
+        (user_id,),
+    )
+    if not row:
+        return None
+    coins_total = int(row[0] or 0)
+    now = clock()
+    cached = _rank_cache.get(coins_total)
+    if cached is not None and now < cached[0]:
+        return cached[1] + 1, coins_total
+    result = await mysql_connection.fetch_one(
+        "SELECT COUNT(*) FROM user WHERE coins_total > %s",
+        (coins_total,),
+    )
+    ahead = int(result[0] if result else 0)
+    if len(_rank_cache) >= RICH_RANK_CACHE_SIZE:
+        for key in [key for key, (expires, _) in _rank_cache.items() if expires <= now]:
+            del _rank_cache[key]
+        if len(_rank_cache) >= RICH_RANK_CACHE_SIZE:
+            _rank_cache.clear()
+    _rank_cache[coins_total] = (now + RICH_CACHE_SECONDS, ahead)
+    return ahead + 1, coins_total
+
+
+def clear_cache() -> None:
+    _page_cache.clear()
+    _rank_cache.clear()
+
+
+__all__ = [
+    "RICH_MAX_PAGE",
+    "RICH_PAGE_SIZE",
+    "clear_cache",
+    "get_leaderboard_page",
+    "get_user_rank",
+]
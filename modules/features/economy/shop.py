@@ -183,9 +183,10 @@ async def shop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         if not spent:
                             await query.answer("硬币不足，无法购买此商品。", show_alert=True)
                             return
-                        await connection.exec_driver_sql(
-                            "UPDATE user SET permission = %s WHERE id = %s",
-                            (1, user_id),
+                        await process_user.set_user_permission(
+                            user_id,
+                            1,
+                            connection=connection,
                         )
                         await query.answer("购买成功！您的权限已升级到1级。", show_alert=True)
             except Exception:
@@ -222,9 +223,10 @@ async def shop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         if not spent:
                             await query.answer("硬币不足，无法购买此商品。", show_alert=True)
                             return
-                        await connection.exec_driver_sql(
-                            "UPDATE user SET permission = %s WHERE id = %s",
-                            (2, user_id),
+                        await process_user.set_user_permission(
+                            user_id,
+                            2,
+                            connection=connection,
                         )
                         await query.answer("购买成功！您的权限已升级到2级。", show_alert=True)
             except Exception:
@@ -261,9 +263,10 @@ async def shop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         if not spent:
                             await query.answer("硬币不足，无法购买此商品。", show_alert=True)
                             return
-                        await connection.exec_driver_sql(
-                            "UPDATE user SET permission = %s WHERE id = %s",
-                            (3, user_id),
+                        await process_user.set_user_permission(
+                            user_id,
+                            3,
+                            connection=connection,
                         )
                         await query.answer("购买成功！您的权限已升级到3级。", show_alert=True)
             except Exception:
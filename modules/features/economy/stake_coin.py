@@ -1,11 +1,12 @@
 import asyncio
+import logging
 from datetime import datetime, timedelta
 from decimal import Decimal
 
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import CallbackQueryHandler, CommandHandler, ContextTypes
 
-from core import mysql_connection, process_user, stake_reward_pool
+from core import mysql_connection, process_user, stake_reward_pool, update_routing
 from core.command_cooldown import cooldown
 
 # 全局锁，确保同一时间只有一个质押操作执行
@@ -14,6 +15,13 @@ REWARD_INTERVAL_DAYS = 7
 WITHDRAW_FEE_RATE = 0.03
 MAX_DAILY_RATE = 0.3
 MIN_DAILY_RATE = 0.05
+# 全站金币与质押总额存在 stake_aggregates（迁移 0024），定时重算；
+# 质押、领取、取出时顺手增减，回报率基本实时
+STAKE_AGGREGATES_ROW_ID = 1
+STAKE_AGGREGATES_REFRESH_SECONDS = 300
+STAKE_AGGREGATES_MAX_AGE_SECONDS = 900  # 定时任务没跑时，读到比这更旧的数就当场重算
+
+logger = logging.getLogger(__name__)
 
 
 async def get_total_coins():
@@ -26,9 +34,44 @@ async def get_total_staked():
     return row[0] if row and row[0] else 0
 
 
+async def refresh_stake_aggregates():
+    """全表重算一次总额并写入 stake_aggregates，返回 (金币总额, 质押总额)。"""
+    total_coins = int(await get_total_coins())
+    total_staked = int(await get_total_staked())
+    await mysql_connection.execute(
+        "INSERT INTO stake_aggregates (id, total_coins, total_staked, refreshed_at) "
+        "VALUES (%s, %s, %s, CURRENT_TIMESTAMP) "
+        "ON DUPLICATE KEY UPDATE total_coins = VALUES(total_coins), "
+        "total_staked = VALUES(total_staked), refreshed_at = VALUES(refreshed_at)",
+        (STAKE_AGGREGATES_ROW_ID, total_coins, total_staked),
+    )
+    return total_coins, total_staked
+
+
+async def get_stake_aggregates():
+    """读预先算好的 (金币总额, 质押总额)，过旧或缺失时重算。"""
+    row = await mysql_connection.fetch_one(
+        "SELECT total_coins, total_staked, "
+        "TIMESTAMPDIFF(SECOND, refreshed_at, CURRENT_TIMESTAMP) "
+        "FROM stake_aggregates WHERE id = %s",
+        (STAKE_AGGREGATES_ROW_ID,),
+    )
+    if not row or row[2] is None or row[2] > STAKE_AGGREGATES_MAX_AGE_SECONDS:
+        return await refresh_stake_aggregates()
+    return int(row[0] or 0), int(row[1] or 0)
+
+
+async def _adjust_stake_aggregates(coins_delta, staked_delta, *, connection):
+    # 不动 refreshed_at：增量只是近似，仍按时全量重算
+    await connection.exec_driver_sql(
+        "UPDATE stake_aggregates SET total_coins = total_coins + %s, "
+        "total_staked = total_staked + %s, refreshed_at = refreshed_at WHERE id = %s",
+        (int(coins_delta), int(staked_delta), STAKE_AGGREGATES_ROW_ID),
+    )
+
+
 async def calculate_reward_rate():
-    total_coins = await get_total_coins()
-    total_staked = await get_total_staked()
+    total_coins, total_staked = await get_stake_aggregates()
 
     if total_staked == 0 or total_coins == 0:
         return MAX_DAILY_RATE
@@ -118,12 +161,14 @@ async def get_user_stake(user_id, *, connection=None):
     }
 
 
-async def calculate_available_reward(user_id):
-    user_stake = await get_user_stake(user_id)
+async def calculate_available_reward(user_id, *, user_stake=None, reward_rate=None):
+    if user_stake is None:
+        user_stake = await get_user_stake(user_id)
     if not user_stake or user_stake["stake_amount"] <= 0:
         return 0
 
-    reward_rate = await calculate_reward_rate()
+    if reward_rate is None:
+        reward_rate = await calculate_reward_rate()
     reward, _, _ = _calculate_reward_window(user_stake, reward_rate)
     return reward
 
@@ -166,7 +211,11 @@ async def show_stake_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status_message += f"取出本金将收取 {int(WITHDRAW_FEE_RATE * 100)}% 手续费。\n"
 
     if user_stake:
-        available_reward = await calculate_available_reward(user_id)
+        available_reward = await calculate_available_reward(
+            user_id,
+            user_stake=user_stake,
+            reward_rate=reward_rate,
+        )
         stake_time_str = user_stake["stake_time"].strftime("%Y-%m-%d %H:%M:%S")
 
         status_message += (
@@ -232,6 +281,7 @@ async def stake_coins(update: Update, context: ContextTypes.DEFAULT_TYPE, amount
                     "INSERT INTO user_stakes (user_id, stake_amount, stake_time) VALUES (%s, %s, %s)",
                     (user_id, amount, now),
                 )
+                await _adjust_stake_aggregates(-amount, amount, connection=connection)
 
             reward_rate = await calculate_reward_rate()
             await update.message.reply_text(
@@ -316,6 +366,7 @@ async def collect_reward(query, user_id):
                     connection=connection,
                 )
                 await stake_reward_pool.subtract_from_pool(reward, connection=connection)
+                await _adjust_stake_aggregates(reward, 0, connection=connection)
 
                 new_last_reward_time = last_reward_time + timedelta(
                     days=intervals_paid * REWARD_INTERVAL_DAYS
@@ -412,6 +463,11 @@ async def withdraw_stake(query, user_id):
                     "DELETE FROM user_stakes WHERE user_id = %s",
                     (user_id,),
                 )
+                await _adjust_stake_aggregates(
+                    refunded_principal + reward,
+                    -stake_amount,
+                    connection=connection,
+                )
 
             reward_rate = await calculate_reward_rate()
             await query.edit_message_text(
@@ -426,8 +482,23 @@ async def withdraw_stake(query, user_id):
             await query.answer(f"取出本金时发生错误: {str(e)}", show_alert=True)
 
 
+async def _refresh_stake_aggregates_job(context):
+    # webhook 多进程时只由 0 号进程重算，其他进程读同一行
+    if not update_routing.is_primary_worker():
+        return
+    try:
+        await refresh_stake_aggregates()
+    except Exception as e:
+        logger.warning(f"重算质押总额失败: {e}")
+
+
 # 创建质押相关的处理器
 def setup_stake_handlers(application):
     """为质押系统设置处理器"""
     application.add_handler(CommandHandler("stake", stake_command))
     application.add_handler(CallbackQueryHandler(stake_callback, pattern=r"^stake_"))
+    application.job_queue.run_repeating(
+        _refresh_stake_aggregates_job,
+        interval=STAKE_AGGREGATES_REFRESH_SECONDS,
+        first=10,
+    )
@@ -1,4 +1,3 @@
-import asyncio
 import logging
 import random
 from typing import Dict, List, Tuple
@@ -10,13 +9,14 @@ from telegram.ext import (
 )
 from core import mysql_connection, process_user
 from core.command_cooldown import cooldown
+from core.keyed_registry import KeyedLocks
 
 # 设置日志
 logger = logging.getLogger(__name__)
 
 # 定义游戏状态字典和锁
 active_games: Dict[int, Dict] = {}  # 储存活跃游戏: {user_id: game_state}
-game_locks: Dict[int, asyncio.Lock] = {}  # 用户游戏锁: {user_id: asyncio.Lock()}
+game_locks = KeyedLocks()  # 用户游戏锁，没人持有时自动回收
 
 # 骰宝赔率表
 PAYOUT_RATES = {
@@ -40,12 +40,6 @@ BET_TYPE_NAMES = {
     "triple_4": "围骰4", "triple_5": "围骰5", "triple_6": "围骰6",
 }
 
-# 获取用户锁
-def get_user_lock(user_id: int) -> asyncio.Lock:
-    if user_id not in game_locks:
-        game_locks[user_id] = asyncio.Lock()
-    return game_locks[user_id]
-
 # 安全更新用户金币
 async def update_user_coins_safely(user_id: int, amount: int) -> bool:
     try:
@@ -90,9 +84,6 @@ async def cleanup_expired_games(context: ContextTypes.DEFAULT_TYPE) -> None:
         if user_id in active_games:
             del active_games[user_id]
             logger.info(f"已清理用户 {user_id} 的过期游戏会话")
-    for user_id in list(game_locks.keys()):
-        if user_id not in active_games:
-            del game_locks[user_id]
 
 # 创建下注类型选择键盘
 def get_bet_type_keyboard(user_id: int) -> InlineKeyboardMarkup:
@@ -198,17 +189,14 @@ def get_dice_emoji(dice_value: int) -> str:
 def end_game(user_id: int) -> None:
     if user_id in active_games:
         del active_games[user_id]
-    if user_id in game_locks:
-        del game_locks[user_id]
 
 @cooldown
 async def sicbo_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    user_lock = get_user_lock(user_id)
     
     try:
-        if not user_lock.locked():
-            async with user_lock:
+        if not game_locks.locked(user_id):
+            async with game_locks.hold(user_id):
                 if user_id in active_games:
                     await update.message.reply_text("您已经在一个骰宝游戏中，请先完成当前游戏。")
                     return
@@ -270,9 +258,8 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await query.edit_message_text("游戏已结束或已被取消。请使用 /sicbo 开始新游戏。")
         return
     
-    user_lock = get_user_lock(user_id)
-    if not user_lock.locked():
-        async with user_lock:
+    if not game_locks.locked(user_id):
+        async with game_locks.hold(user_id):
             if action == "cancel":
                 end_game(user_id)
                 await query.answer("游戏已取消")
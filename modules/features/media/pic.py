@@ -338,7 +338,7 @@ async def pic_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         try:
             pool_add = stake_reward_pool.calculate_pool_add(COIN_COST)
             if pool_add > 0:
-                await stake_reward_pool.add_to_pool(pool_add)
+                await stake_reward_pool.add_to_pool(pool_add, shard_key=user_id)
         except Exception as pool_error:
             logger.error("奖励池入账失败: %s", pool_error)
         
@@ -563,7 +563,7 @@ async def hd_pic_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             try:
                 pool_add = stake_reward_pool.calculate_pool_add(HD_COIN_COST)
                 if pool_add > 0:
-                    await stake_reward_pool.add_to_pool(pool_add)
+                    await stake_reward_pool.add_to_pool(pool_add, shard_key=user_id)
             except Exception as pool_error:
                 logger.error("奖励池入账失败: %s", pool_error)
         else:
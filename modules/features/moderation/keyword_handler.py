@@ -9,6 +9,13 @@ import threading
 import html
 from collections import defaultdict
 from core.command_cooldown import cooldown
+from core.telegram_utils import is_chat_admin
+from .policy import (
+    ASCII_KEYWORD_RE,
+    KeywordReplies,
+    get_group_policy,
+    refresh_group_policy,
+)
 
 # HTML标签白名单
 ALLOWED_HTML_TAGS = {
@@ -19,11 +26,7 @@ ALLOWED_HTML_TAGS = {
 # 响应内容最大长度限制
 MAX_RESPONSE_LENGTH = 1000
 
-# 关键词缓存
-# 格式: { group_id: {"keywords": [(keyword, response), ...], "last_updated": timestamp } }
-keyword_cache = {}
-cache_lock = threading.Lock()  # 用于保护缓存操作的锁
-CACHE_TIMEOUT = 300  # 缓存过期时间：5分钟 = 300秒
+# 群关键词连同编译好的 KeywordReplies 存在 policy.GroupModerationPolicy 快照里
 
 # 速率限制器: {chat_id: {last_trigger_times: [时间戳列表]}}
 rate_limiter = defaultdict(lambda: {"last_trigger_times": []})
@@ -58,7 +61,7 @@ def is_keyword_match(keyword, message):
     
     # 对于中文和其他没有明确单词边界的语言，
     # 可以直接做子字符串匹配，因为这些语言不使用空格分隔单词
-    if not re.match(r'^[a-zA-Z0-9\s\W]+$', keyword):
+    if not ASCII_KEYWORD_RE.match(keyword):
         return keyword.lower() in message.lower()
     
     return False
@@ -84,42 +87,32 @@ def can_trigger_keyword(chat_id):
         return True
 
 
-# 从数据库加载指定群组的关键词
+# 从数据库重新加载指定群组的关键词，并替换策略快照
 async def load_keywords_from_db(chat_id):
     try:
-        # 使用参数化查询，chat_id作为参数而非直接拼接
-        keywords = await mysql_connection.fetch_all(
-            "SELECT keyword, response FROM group_keywords WHERE group_id = %s",
-            (chat_id,),
-        )
-        
-        # 线程安全地更新缓存
-        with cache_lock:
-            keyword_cache[chat_id] = {
-                "keywords": keywords,
-                "last_updated": time.time()
-            }
-        return keywords
+        policy = await refresh_group_policy(chat_id)
+        return list(policy.keyword_rows)
     except Exception as e:
         logging.error(f"从数据库加载关键词时出错: {str(e)}")
         return []
 
 
-# 获取群组关键词（优先使用缓存）
+# 获取群组编译好的关键词匹配器（读策略快照）
+async def get_group_keyword_replies(chat_id):
+    try:
+        return (await get_group_policy(chat_id)).keyword_replies
+    except Exception as e:
+        logging.error(f"从数据库加载关键词时出错: {str(e)}")
+        return KeywordReplies(())
+
+
+# 获取群组关键词（读策略快照）
 async def get_group_keywords(chat_id):
-    now = time.time()
-    
-    # 线程安全地读取缓存
-    with cache_lock:
-        # 检查缓存是否存在且未过期
-        if chat_id in keyword_cache:
-            cache_data = keyword_cache[chat_id]
-            # 如果缓存未过期，直接返回
-            if now - cache_data["last_updated"] < CACHE_TIMEOUT:
-                return cache_data["keywords"]
-    
-    # 缓存不存在或已过期，从数据库重新加载
-    return await load_keywords_from_db(chat_id)
+    try:
+        return list((await get_group_policy(chat_id)).keyword_rows)
+    except Exception as e:
+        logging.error(f"从数据库加载关键词时出错: {str(e)}")
+        return []
 
 
 @cooldown
@@ -134,8 +127,7 @@ async def keyword_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # 检查用户是否为群组管理员
-    chat_member = await context.bot.get_chat_member(chat_id, user_id)
-    if chat_member.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context.bot, chat_id, user_id):
         await update.message.reply_text("只有群组管理员才能使用此命令。\nOnly group administrators can use this command.")
         return
 
@@ -229,11 +221,10 @@ async def add_keyword(update: Update, chat_id: int, user_id: int, keyword: str,
         
         # 如果不是更新现有关键词，检查群组关键词数量是否已达上限
         if not existing_keyword:
-            # 优先使用缓存判断关键词数量
-            with cache_lock:
-                if chat_id in keyword_cache and len(keyword_cache[chat_id]["keywords"]) >= 10:
-                    await update.message.reply_text("每个群组最多只能设置10个关键词，请先删除一些关键词再添加。")
-                    return
+            # 优先使用策略快照判断关键词数量
+            if len(await get_group_keywords(chat_id)) >= 10:
+                await update.message.reply_text("每个群组最多只能设置10个关键词，请先删除一些关键词再添加。")
+                return
             
             # 缓存不存在或不确定，查询数据库
             count_row = await mysql_connection.fetch_one(
@@ -256,7 +247,7 @@ async def add_keyword(update: Update, chat_id: int, user_id: int, keyword: str,
             (chat_id, keyword, response, user_id),
         )
         
-        # 更新成功后，强制刷新缓存
+        # 更新成功后，重建策略快照
         await load_keywords_from_db(chat_id)
         
         # 检查是更新还是新增
@@ -276,7 +267,7 @@ async def del_keyword(update: Update, chat_id: int, keyword: str):
             (chat_id, keyword),
         )
         
-        # 删除后，强制刷新缓存
+        # 删除后，重建策略快照
         if rowcount > 0:
             await load_keywords_from_db(chat_id)
             await update.message.reply_text(f"已删除关键词触发器：'{keyword}'")
@@ -306,10 +297,10 @@ async def process_group_message(update: Update, context: ContextTypes.DEFAULT_TY
     chat_id = update.effective_chat.id
     message_text = effective_message.text
     
-    # 使用缓存获取关键词
-    keywords = await get_group_keywords(chat_id)
+    # 使用缓存获取编译好的关键词
+    replies = await get_group_keyword_replies(chat_id)
     
-    if not keywords:
+    if not replies:
         return
     
     # 检查速率限制
@@ -317,20 +308,20 @@ async def process_group_message(update: Update, context: ContextTypes.DEFAULT_TY
         # 触发过于频繁，静默忽略
         return
         
-    for keyword, response in keywords:
-        # 使用更精确的匹配方法
-        if is_keyword_match(keyword, message_text):
-            try:
-                # 发送前再次净化HTML
-                safe_response = sanitize_html(response)
-                await effective_message.reply_text(safe_response, parse_mode=ParseMode.HTML)
-            except Exception as e:
-                # 如果HTML解析失败，尝试不使用解析模式发送
-                logging.warning(f"HTML解析失败，尝试纯文本: {str(e)}")
-                await effective_message.reply_text(
-                    f"【回复内容HTML格式错误】\n\n{html.escape(response)}"
-                )
-            break  # 只触发第一个匹配的关键词
+    # 单遍匹配，只触发配置顺序最靠前的关键词
+    matched = replies.match(message_text)
+    if matched:
+        _keyword, response = matched
+        try:
+            # 发送前再次净化HTML
+            safe_response = sanitize_html(response)
+            await effective_message.reply_text(safe_response, parse_mode=ParseMode.HTML)
+        except Exception as e:
+            # 如果HTML解析失败，尝试不使用解析模式发送
+            logging.warning(f"HTML解析失败，尝试纯文本: {str(e)}")
+            await effective_message.reply_text(
+                f"【回复内容HTML格式错误】\n\n{html.escape(response)}"
+            )
 
 def setup_keyword_handlers(dispatcher):
     """注册关键词相关的处理器"""
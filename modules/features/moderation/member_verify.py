@@ -1,10 +1,42 @@
-import asyncio
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatPermissions
 from telegram.ext import ContextTypes, CommandHandler, CallbackQueryHandler, MessageHandler, filters
 from core import mysql_connection
-from datetime import datetime, timedelta
 import secrets
 from core.command_cooldown import cooldown
+from core.telegram_utils import is_chat_admin
+from core import cache_invalidation
+from .raid_mode import RAID_VERIFY_CALLBACK, enqueue_raid_member, join_detector
+from .verification_timers import setup_verification_jobs, verification_queue
+
+# 群是否开启验证：{group_id: bool}，进群时先查这里；/verify 开关时更新并通知其他实例
+verification_enabled_cache = {}
+VERIFICATION_TOPIC = "group_verification"
+
+
+def _on_verification_invalidated(key):
+    if key is None:
+        verification_enabled_cache.clear()
+    else:
+        verification_enabled_cache.pop(int(key), None)
+
+
+cache_invalidation.subscribe(VERIFICATION_TOPIC, _on_verification_invalidated)
+
+
+async def is_verification_enabled(chat_id):
+    enabled = verification_enabled_cache.get(chat_id)
+    if enabled is None:
+        record = await mysql_connection.fetch_one(
+            "SELECT group_id FROM group_verification WHERE group_id = %s",
+            (chat_id,),
+        )
+        enabled = verification_enabled_cache[chat_id] = record is not None
+    return enabled
+
+
+async def _set_verification_enabled(chat_id, enabled):
+    verification_enabled_cache[chat_id] = enabled
+    await cache_invalidation.publish(VERIFICATION_TOPIC, chat_id, notify_local=False)
 
 # 在开启验证功能前详细检查必要权限
 async def check_bot_permissions(bot, chat_id):
@@ -31,16 +63,10 @@ async def check_bot_permissions(bot, chat_id):
 @cooldown
 async def verify_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
-    # 查询数据库判断当前群组是否已开启接管验证
-    record = await mysql_connection.fetch_one(
-        "SELECT group_id FROM group_verification WHERE group_id = %s",
-        (chat_id,),
-    )
-
-    if record:
+    # 判断当前群组是否已开启接管验证
+    if await is_verification_enabled(chat_id):
         # 若记录存在，则只有群组管理员才能取消接管
-        sender_member = await context.bot.get_chat_member(chat_id, update.effective_user.id)
-        if sender_member.status not in ["administrator", "creator"]:
+        if not await is_chat_admin(context.bot, chat_id, update.effective_user.id):
             await update.message.reply_text("只有群组管理员才能取消接管。")
             return
         context.chat_data["enable_verify"] = False
@@ -48,12 +74,12 @@ async def verify_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "DELETE FROM group_verification WHERE group_id = %s",
             (chat_id,),
         )
+        await _set_verification_enabled(chat_id, False)
         await update.message.reply_text("验证接管已取消。")
         return
 
     # 仅允许群组管理员调用
-    sender_member = await context.bot.get_chat_member(chat_id, update.effective_user.id)
-    if sender_member.status not in ["administrator", "creator"]:
+    if not await is_chat_admin(context.bot, chat_id, update.effective_user.id):
         await update.message.reply_text("只有群组管理员才能使用该命令。")
         return
     # 检查机器人是否具备管理员权限
@@ -70,34 +96,28 @@ async def verify_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     group_name = update.effective_chat.title if update.effective_chat.title else "未知群组"
     await mysql_connection.execute(insert_query, (chat_id, group_name))
+    await _set_verification_enabled(chat_id, True)
     await update.message.reply_text("新成员验证功能已开启。新成员加入时将被禁言并要求点击【验证】按钮验证，5分钟内有效。")
 
 # 新成员加入事件处理
 async def new_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     
-    # 从数据库直接查询群组是否开启了验证功能
-    record = await mysql_connection.fetch_one(
-        "SELECT group_id FROM group_verification WHERE group_id = %s",
-        (chat_id,),
-    )
-    verification_enabled = record is not None
-    
-    # 若未开启验证功能，则直接返回
-    if not verification_enabled:
+    # 若未开启验证功能，则直接返回（开关状态有缓存，不必每次查库）
+    if not await is_verification_enabled(chat_id):
         return
     
     # 同步内存状态变量（可选，为了保持一致性）
     context.chat_data["enable_verify"] = True
     
-    for new_member in update.message.new_chat_members:
+    # 跳过机器人验证
+    new_members = [member for member in update.message.new_chat_members if not member.is_bot]
+    # 短时间内大量进群时改为合并验证消息，避免触发 Telegram 的发送频率限制
+    raid = join_detector.record_joins(chat_id, len(new_members))
+    
+    for new_member in new_members:
         user_id = new_member.id
         
-        # 跳过机器人验证
-        if new_member.is_bot:
-            print(f"跳过机器人 {new_member.full_name}({user_id}) 的验证")
-            continue
-            
         try:
             # 禁言新成员（禁止发送消息）
             await context.bot.restrict_chat_member(
@@ -121,6 +141,8 @@ async def new_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
         except Exception as e:
             error_str = str(e)
             print(f"限制成员 {user_id} 失败: {error_str}")
+            if raid:
+                continue  # raid 时不逐条报错，避免刷屏
             if "httpx.ConnectError" in error_str or "Not enough rights" in error_str:
                 await context.bot.send_message(
                     chat_id,
@@ -128,6 +150,10 @@ async def new_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
                 )
             continue
 
+        if raid:
+            enqueue_raid_member(context.bot, chat_id, new_member)
+            continue
+
         # 生成验证令牌
         token = secrets.token_hex(8)
         keyboard = InlineKeyboardMarkup([
@@ -140,73 +166,25 @@ async def new_member_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
             reply_markup=keyboard,
             parse_mode="HTML"
         )
-        # 保存任务信息：包含欢迎消息ID及定时任务
-        if "verify_tasks" not in context.chat_data:
-            context.chat_data["verify_tasks"] = {}
-        context.chat_data["verify_tasks"][user_id] = {
-            "message_id": welcome_msg.message_id,
-            "timer": asyncio.create_task(verification_timeout(context, chat_id, user_id, welcome_msg.message_id))
-        }
-
-        # 在发送欢迎信息后保存验证任务到数据库
-        expire_time = datetime.now() + timedelta(minutes=5)
-        insert_query = """
-        INSERT INTO verification_tasks (user_id, group_id, message_id, expire_time) 
-        VALUES (%s, %s, %s, %s) 
-        ON DUPLICATE KEY UPDATE message_id = VALUES(message_id), expire_time = VALUES(expire_time)
-        """
-        await mysql_connection.execute(
-            insert_query,
-            (user_id, chat_id, welcome_msg.message_id, expire_time),
-        )
-
-# 定时任务：等待5分钟后若未验证，则移出群组并编辑欢迎消息
-async def verification_timeout(context: ContextTypes.DEFAULT_TYPE, chat_id, user_id, message_id):
-    await asyncio.sleep(300)  # 等待5分钟
-    verify_tasks = context.chat_data.get("verify_tasks", {})
-    task_info = verify_tasks.get(user_id)
-    if task_info:
-        try:
-            # 将 kick_chat_member 替换为 ban_chat_member
-            await context.bot.ban_chat_member(chat_id, user_id)
-            # 可选择解禁以便记录：这里立即解禁防止永久封禁
-            await context.bot.unban_chat_member(chat_id, user_id)
-        except Exception as e:
-            print(f"踢出成员 {user_id} 时出错: {e}")
-        try:
-            await context.bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=message_id,
-                text="验证超时，您已被移出群组。"
-            )
-        except Exception as e:
-            print(f"编辑消息 {message_id} 出错: {e}")
-        # 清除任务记录
-        verify_tasks.pop(user_id, None)
-        # 在清除任务记录时同时从数据库删除
-        await mysql_connection.execute(
-            "DELETE FROM verification_tasks WHERE user_id = %s AND group_id = %s",
-            (user_id, chat_id),
-        )
+        # 挂到验证超时队列，5分钟后统一批量处理；数据库记录也由队列批量写入
+        verification_queue.add(chat_id, user_id, welcome_msg.message_id)
 
 # 回调查询处理：点击验证按钮时解除禁言并更新消息
 async def verify_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     user_id = query.from_user.id
     
-    # 解析回调数据
+    # 解析回调数据；合并验证消息的按钮由消息里的任意待验证成员点击
+    shared_button = query.data == RAID_VERIFY_CALLBACK
     callback_parts = query.data.split("_")
-    if len(callback_parts) != 3 or callback_parts[0] != "verify" or callback_parts[1] != str(user_id):
+    if not shared_button and (
+        len(callback_parts) != 3 or callback_parts[0] != "verify" or callback_parts[1] != str(user_id)
+    ):
         await query.answer("这不是为您准备的验证按钮。", show_alert=True)
         return
     
-    verify_tasks = context.chat_data.get("verify_tasks", {})
-    task_info = verify_tasks.get(user_id)
-    if task_info:
-        timer_task = task_info.get("timer")
-        if timer_task and not timer_task.done():
-            timer_task.cancel()
-        verify_tasks.pop(user_id, None)
+    message_id = verification_queue.remove(update.effective_chat.id, user_id)
+    if message_id is not None:
         try:
             # 解除禁言（恢复发送消息权限）
             await context.bot.restrict_chat_member(
@@ -227,14 +205,10 @@ async def verify_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                                 can_send_video_notes=True,
                                 can_send_voice_notes=True,)
             )
-            await query.edit_message_text("验证通过，欢迎加入群组！")
+            # 共用的验证消息还要留给其他人，等所有人处理完后统一删除
+            if not verification_queue.is_shared(update.effective_chat.id, message_id):
+                await query.edit_message_text("验证通过，欢迎加入群组！")
             await query.answer("验证成功！", show_alert=True)
-            
-            # 从数据库中删除验证任务记录
-            await mysql_connection.execute(
-                "DELETE FROM verification_tasks WHERE user_id = %s AND group_id = %s",
-                (user_id, update.effective_chat.id),
-            )
         except Exception as e:
             error_str = str(e)
             if "httpx.ConnectError" in error_str or "Not enough rights" in error_str:
@@ -243,6 +217,8 @@ async def verify_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     f"验证错误: 无法解除禁言成员({user_id})：{error_str}"
                 )
             await query.answer("验证时出现错误，请稍后再试。", show_alert=True)
+    elif shared_button:
+        await query.answer("您不在待验证名单中，或验证已失效。", show_alert=True)
     else:
         await query.answer("验证已失效或已处理。", show_alert=True)
         try:
@@ -251,25 +227,6 @@ async def verify_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             print(f"删除验证消息时出错: {e}")
 
-# 在启动时恢复验证任务
-async def restore_verification_tasks(dispatcher):
-    """从数据库恢复所有未完成的验证任务"""
-    # 查询未过期的验证任务
-    now = datetime.now()
-    tasks = await mysql_connection.fetch_all(
-        "SELECT user_id, group_id, message_id, expire_time FROM verification_tasks WHERE expire_time > %s",
-        (now,),
-    )
-
-    for user_id, chat_id, message_id, expire_time in tasks:
-        # 计算剩余时间
-        remaining_time = (expire_time - now).total_seconds()
-        if remaining_time > 0:
-            # 重建超时任务
-            asyncio.create_task(
-                verification_timeout(dispatcher.application, chat_id, user_id, message_id)
-            )
-
 # 处理成员离开群组的事件（合并处理机器人和普通用户）
 async def handle_member_left(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
@@ -283,37 +240,22 @@ async def handle_member_left(update: Update, context: ContextTypes.DEFAULT_TYPE)
             "DELETE FROM group_verification WHERE group_id = %s",
             (chat_id,),
         )
+        await _set_verification_enabled(chat_id, False)
         return
     
     # 如果是普通成员离开，检查是否有未完成的验证任务
-    user_id = user.id
-    verify_tasks = context.chat_data.get("verify_tasks", {})
-    task_info = verify_tasks.get(user_id)
+    message_id = verification_queue.remove(chat_id, user.id)
     
-    if task_info:
-        # 取消定时任务
-        timer_task = task_info.get("timer")
-        if timer_task and not timer_task.done():
-            timer_task.cancel()
-            
+    if message_id is not None and not verification_queue.is_shared(chat_id, message_id):
         # 尝试编辑欢迎消息
         try:
             await context.bot.edit_message_text(
                 chat_id=chat_id,
-                message_id=task_info["message_id"],
+                message_id=message_id,
                 text=f"用户 {user.full_name} 在验证前离开了群组。"
             )
         except Exception as e:
             print(f"编辑消息出错: {e}")
-            
-        # 从内存中删除验证任务
-        verify_tasks.pop(user_id, None)
-        
-        # 从数据库中删除验证任务
-        await mysql_connection.execute(
-            "DELETE FROM verification_tasks WHERE user_id = %s AND group_id = %s",
-            (user_id, chat_id),
-        )
 
 # 注册该模块的处理器
 def setup_member_verification(dispatcher):
@@ -321,3 +263,5 @@ def setup_member_verification(dispatcher):
     dispatcher.add_handler(MessageHandler(filters.StatusUpdate.NEW_CHAT_MEMBERS, new_member_handler))
     dispatcher.add_handler(CallbackQueryHandler(verify_callback, pattern=r"^verify_"))
     dispatcher.add_handler(MessageHandler(filters.StatusUpdate.LEFT_CHAT_MEMBER, handle_member_left))
+    # 验证超时与数据库写入由一个定时任务批量处理，首轮从数据库恢复未完成的验证
+    setup_verification_jobs(dispatcher)
@@ -0,0 +1,271 @@
+"""群管理策略快照。
+
+一条群文本消息要过垃圾过滤（总开关、链接、@提及、自定义垃圾词）和关键词
+自动回复两道处理。这里把一个群的这些配置连同编译好的匹配器打包成一个不可变
+对象：首次使用时单飞加载（同一个群并发只查一次库），管理员修改后整体替换，
+读取方直接拿引用，不加锁。所有处理器都跑在同一个事件循环里，字典赋值即原子
+替换。
+
+快照不设过期时间：这些表只有 bot 自己写，修改方通过 core.cache_invalidation
+发布失效，其他实例收到后丢掉对应快照，下次读取重新加载。
+"""
+
+import asyncio
+import dataclasses
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+
+from core import cache_invalidation, mysql_connection, safe_regex
+from core.keyword_matcher import KeywordMatcher
+
+POLICY_TOPIC = "group_moderation_policy"
+
+# 只由这些字符组成的关键词按单词边界匹配，否则（如中文）按子串匹配
+ASCII_KEYWORD_RE = re.compile(r'^[a-zA-Z0-9\s\W]+$')
+
+
+class KeywordReplies:
+    """一个群的关键词集合，加载时编译一次，整条消息单遍匹配。
+
+    可按单词边界匹配的关键词合成一个带命名分组的交替正则（放在前瞻里，
+    重叠的命中也不会漏）；中日韩等没有单词边界的关键词走子串自动机。
+    多个关键词命中时取配置顺序最靠前的，与逐个调用 is_keyword_match 一致。
+    """
+
+    def __init__(self, keywords):
+        self.keywords = [tuple(item) for item in keywords]
+        boundary_parts = []
+        substring_words = []
+        self._substring_index = {}
+        for index, (keyword, _response) in enumerate(self.keywords):
+            if not keyword:
+                continue
+            if ASCII_KEYWORD_RE.match(keyword):
+                boundary_parts.append(f"(?P<k{index}>\\b{re.escape(keyword)}\\b)")
+            else:
+                lowered = keyword.lower()
+                self._substring_index.setdefault(lowered, index)
+                substring_words.append(lowered)
+        self._boundary_pattern = (
+            re.compile("(?=" + "|".join(boundary_parts) + ")", re.IGNORECASE)
+            if boundary_parts
+            else None
+        )
+        self._substring_matcher = KeywordMatcher(substring_words)
+
+    def __bool__(self):
+        return bool(self.keywords)
+
+    def match(self, message):
+        """返回命中的 (keyword, response)，没有命中返回 None。"""
+        if not message or not self.keywords:
+            return None
+        best = None
+        if self._substring_matcher:
+            word = self._substring_matcher.search(message.lower())
+            if word is not None:
+                best = self._substring_index[word]
+        if self._boundary_pattern is not None and best != 0:
+            for found in self._boundary_pattern.finditer(message):
+                index = int(found.lastgroup[1:])
+                if best is None or index < best:
+                    best = index
+                    if best == 0:
+                        break
+        return None if best is None else self.keywords[best]
+
+
+def compile_spam_patterns(patterns):
+    """编译自定义垃圾词正则，跳过无效或过于复杂的。"""
+    compiled = []
+    for keyword in patterns:
+        try:
+            compiled.append(safe_regex.compile_safe(keyword, re.IGNORECASE))
+        except re.error:
+            logging.error(f"无效的自定义正则表达式: {keyword}")
+        except safe_regex.UnsafePatternError as e:
+            logging.error(f"自定义正则表达式过于复杂，已跳过: {keyword} ({e})")
+    return tuple(compiled)
+
+
+@dataclass(frozen=True)
+class GroupModerationPolicy:
+    group_id: int
+    spam_enabled: bool = False
+    block_links: bool = False
+    block_mentions: bool = False
+    # 自定义垃圾词：原始行 (keyword, is_regex) 与编译结果
+    spam_keyword_rows: tuple = ()
+    spam_keywords: KeywordMatcher = field(default_factory=lambda: KeywordMatcher(()))
+    spam_patterns: tuple = ()
+    # 关键词自动回复：原始行 (keyword, response) 与编译结果
+    keyword_rows: tuple = ()
+    keyword_replies: KeywordReplies = field(default_factory=lambda: KeywordReplies(()))
+    loaded_at: float = 0.0
+
+    @property
+    def has_custom_spam_keywords(self):
+        return bool(self.spam_keywords) or bool(self.spam_patterns)
+
+
+def build_group_policy(
+    group_id,
+    *,
+    spam_row=None,
+    spam_keyword_rows=(),
+    keyword_rows=(),
+    loaded_at=None,
+):
+    """由数据库行构建快照，匹配器在这里一次编译好。"""
+    spam_keyword_rows = tuple(tuple(row) for row in spam_keyword_rows or ())
+    keyword_rows = tuple(tuple(row) for row in keyword_rows or ())
+    enabled, block_links, block_mentions = spam_row or (False, False, False)
+    return GroupModerationPolicy(
+        group_id=group_id,
+        spam_enabled=bool(enabled),
+        block_links=bool(block_links),
+        block_mentions=bool(block_mentions),
+        spam_keyword_rows=spam_keyword_rows,
+        spam_keywords=KeywordMatcher(
+            keyword.lower() for keyword, is_regex in spam_keyword_rows if not is_regex
+        ),
+        spam_patterns=compile_spam_patterns(
+            keyword for keyword, is_regex in spam_keyword_rows if is_regex
+        ),
+        keyword_rows=keyword_rows,
+        keyword_replies=KeywordReplies(keyword_rows),
+        loaded_at=time.time() if loaded_at is None else loaded_at,
+    )
+
+
+# {group_id: GroupModerationPolicy}，只做整体替换
+_policies = {}
+# {group_id: asyncio.Future}，同一个群同时只有一个加载
+_loading = {}
+# {group_id: int}，管理员修改或失效时递增，丢弃之前发起的加载结果
+_generations = {}
+# 整个 topic 失效时递增
+_epoch = 0
+
+
+def _generation(group_id):
+    return (_epoch, _generations.get(group_id, 0))
+
+
+def _bump_generation(group_id):
+    _generations[group_id] = _generations.get(group_id, 0) + 1
+    return _generation(group_id)
+
+
+async def _fetch_group_policy(group_id):
+    spam_row, spam_keyword_rows, keyword_rows = await asyncio.gather(
+        mysql_connection.fetch_one(
+            "SELECT enabled, block_links, block_mentions FROM group_spam_control WHERE group_id = %s",
+            (group_id,),
+        ),
+        mysql_connection.fetch_all(
+            "SELECT keyword, is_regex FROM group_spam_keywords WHERE group_id = %s",
+            (group_id,),
+        ),
+        mysql_connection.fetch_all(
+            "SELECT keyword, response FROM group_keywords WHERE group_id = %s",
+            (group_id,),
+        ),
+    )
+    return build_group_policy(
+        group_id,
+        spam_row=spam_row,
+        spam_keyword_rows=spam_keyword_rows,
+        keyword_rows=keyword_rows,
+    )
+
+
+async def _load_group_policy(group_id, generation):
+    try:
+        policy = await _fetch_group_policy(group_id)
+    except Exception as e:
+        logging.error(f"加载群管理策略时出错: {e}")
+        previous = _policies.get(group_id)
+        if previous is not None:
+            return previous  # 沿用旧快照，下次读取再重试
+        raise
+    if _generation(group_id) == generation:
+        _policies[group_id] = policy
+    return _policies.get(group_id, policy)
+
+
+async def get_group_policy(group_id):
+    """返回群的当前策略快照；不存在时单飞加载。"""
+    policy = _policies.get(group_id)
+    if policy is not None:
+        return policy
+
+    future = _loading.get(group_id)
+    if future is None:
+        # 代数在发起时记下：加载期间若有管理员修改，结果不再落盘
+        generation = _generation(group_id)
+        future = asyncio.ensure_future(_load_group_policy(group_id, generation))
+        _loading[group_id] = future
+        future.add_done_callback(lambda _done: _loading.pop(group_id, None))
+    return await asyncio.shield(future)
+
+
+async def refresh_group_policy(group_id):
+    """管理员修改后从数据库重建快照，原子替换并通知其他实例。"""
+    generation = _bump_generation(group_id)
+    policy = await _fetch_group_policy(group_id)
+    if _generation(group_id) == generation:
+        _policies[group_id] = policy
+    await cache_invalidation.publish(POLICY_TOPIC, group_id, notify_local=False)
+    return policy
+
+
+async def update_group_policy(group_id, **changes):
+    """只改开关时不必重新查库：基于当前快照替换字段，再通知其他实例。"""
+    _bump_generation(group_id)
+    current = _policies.get(group_id)
+    policy = None
+    if current is not None:
+        policy = dataclasses.replace(current, **changes)
+        _policies[group_id] = policy
+    # 没有快照时不凭空造一个，下次读取会从库里加载到新值
+    await cache_invalidation.publish(POLICY_TOPIC, group_id, notify_local=False)
+    return policy
+
+
+def invalidate_group_policy(group_id=None):
+    """丢掉快照（group_id 为 None 时全部），下次读取重新加载。"""
+    global _epoch
+    if group_id is None:
+        _epoch += 1
+        _policies.clear()
+        return
+    _bump_generation(group_id)
+    _policies.pop(group_id, None)
+
+
+def _on_policy_invalidated(key):
+    invalidate_group_policy(None if key is None else int(key))
+
+
+cache_invalidation.subscribe(POLICY_TOPIC, _on_policy_invalidated)
+
+
+def clear_group_policies():
+    _policies.clear()
+    _loading.clear()
+    _generations.clear()
+
+
+__all__ = [
+    "GroupModerationPolicy",
+    "KeywordReplies",
+    "build_group_policy",
+    "clear_group_policies",
+    "get_group_policy",
+    "invalidate_group_policy",
+    "refresh_group_policy",
+    "update_group_policy",
+]
@@ -0,0 +1,153 @@
+"""进群突增（raid）时的合并验证。
+
+开启验证的群在短时间内进群人数超过阈值时进入 raid 模式：新成员照常禁言，但不再
+逐人发送验证消息，而是攒几秒后合并成一条“@若干人，请点击下方按钮验证”的消息，
+所有人共用一个按钮。超时、写库仍走 verification_timers 的批处理队列，多人的记录
+在同一轮里一次写入。
+
+成员一进批次就以占位消息 ID（0）挂进验证队列并写库，消息发出后再改挂到真实的
+消息上；攒批期间进程被取消或崩溃，这些人也会照常超时移出，不会一直被禁言。
+"""
+
+import asyncio
+import html
+import logging
+import time
+from collections import deque
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from core.telegram_utils import retry_telegram_send
+
+from .verification_timers import verification_queue
+
+RAID_JOIN_WINDOW_SECONDS = 30
+RAID_JOIN_THRESHOLD = 10  # 窗口内进群人数达到该值即进入 raid 模式
+RAID_MODE_SECONDS = 300  # 最后一次突增之后保持 raid 模式的时间
+RAID_BATCH_SECONDS = 3  # 合并验证消息的攒批时间
+RAID_MENTIONS_PER_MESSAGE = 30
+RAID_VERIFY_CALLBACK = "verify_all"
+RAID_MAX_TRACKED_CHATS = 1024
+RAID_PENDING_MESSAGE_ID = 0  # 合并验证消息发出前（或没发出去时）挂在队列里的占位 ID
+
+logger = logging.getLogger(__name__)
+
+
+class JoinBurstDetector:
+    def __init__(
+        self,
+        *,
+        window_seconds=RAID_JOIN_WINDOW_SECONDS,
+        threshold=RAID_JOIN_THRESHOLD,
+        mode_seconds=RAID_MODE_SECONDS,
+        clock=time.monotonic,
+    ):
+        self.window_seconds = window_seconds
+        self.threshold = threshold
+        self.mode_seconds = mode_seconds
+        self._clock = clock
+        # {chat_id: deque[进群时间]}，最多保留 threshold 条，够判断窗口内是否达到阈值
+        self._joins = {}
+        # {chat_id: raid 模式结束时间}
+        self._raid_until = {}
+
+    def in_raid_mode(self, chat_id):
+        return self._raid_until.get(chat_id, 0) > self._clock()
+
+    def record_joins(self, chat_id, count=1):
+        """记录进群人数，返回该群当前是否处于 raid 模式。"""
+        now = self._clock()
+        joins = self._joins.get(chat_id)
+        if joins is None:
+            if len(self._joins) >= RAID_MAX_TRACKED_CHATS:
+                self.prune()
+            joins = self._joins[chat_id] = deque(maxlen=self.threshold)
+        joins.extend([now] * count)
+        if len(joins) >= self.threshold and now - joins[0] <= self.window_seconds:
+            self._raid_until[chat_id] = now + self.mode_seconds
+        return self.in_raid_mode(chat_id)
+
+    def prune(self):
+        """丢掉窗口外没有进群、也不在 raid 模式的群。"""
+        now = self._clock()
+        for chat_id in list(self._joins):
+            if self._raid_until.get(chat_id, 0) > now:
+                continue
+            self._raid_until.pop(chat_id, None)
+            if now - self._joins[chat_id][-1] > self.window_seconds:
+                del self._joins[chat_id]
+
+
+join_detector = JoinBurstDetector()
+
+# {chat_id: [等待合并验证的成员]} 与每个群的攒批任务
+_pending_members = {}
+_flush_tasks = {}
+
+
+def _mention(member):
+    return f'<a href="tg://user?id={member.id}">{html.escape(member.full_name)}</a>'
+
+
+async def send_consolidated_captcha(bot, chat_id, members):
+    """给一批成员发合并的验证消息，并挂入超时队列，返回发送的消息数。"""
+    keyboard = InlineKeyboardMarkup(
+        [[InlineKeyboardButton("点击验证", callback_data=RAID_VERIFY_CALLBACK)]]
+    )
+    sent = 0
+    for start in range(0, len(members), RAID_MENTIONS_PER_MESSAGE):
+        chunk = members[start:start + RAID_MENTIONS_PER_MESSAGE]
+        text = (
+            f"欢迎 {'、'.join(_mention(member) for member in chunk)} 加入群组！\n"
+            "新成员较多，请各自点击【验证】按钮进行验证（5分钟内有效）。"
+        )
+        try:
+            message = await retry_telegram_send(
+                lambda: bot.send_message(
+                    chat_id, text, reply_markup=keyboard, parse_mode="HTML"
+                ),
+                logger=logger,
+                action="send consolidated verification message",
+            )
+            message_id = message.message_id
+            sent += 1
+        except Exception as e:
+            # 发不出验证消息时保持占位，超时后照常移出，避免成员被永久禁言
+            logger.error(f"发送合并验证消息失败: {e}")
+            message_id = RAID_PENDING_MESSAGE_ID
+        for member in chunk:
+            if not verification_queue.attach_message(chat_id, member.id, message_id):
+                verification_queue.add(chat_id, member.id, message_id, shared=True)
+    return sent
+
+
+async def _flush_after_delay(bot, chat_id):
+    try:
+        await asyncio.sleep(RAID_BATCH_SECONDS)
+    finally:
+        members = _pending_members.pop(chat_id, [])
+        _flush_tasks.pop(chat_id, None)
+    # 攒批期间已经离开的成员不再提及
+    members = [
+        member for member in members
+        if verification_queue.get(chat_id, member.id) == RAID_PENDING_MESSAGE_ID
+    ]
+    if members:
+        await send_consolidated_captcha(bot, chat_id, members)
+
+
+def enqueue_raid_member(bot, chat_id, member):
+    """把已禁言的新成员放进合并验证的批次，并立即挂入验证超时队列。"""
+    verification_queue.add(chat_id, member.id, RAID_PENDING_MESSAGE_ID, shared=True)
+    _pending_members.setdefault(chat_id, []).append(member)
+    if chat_id not in _flush_tasks:
+        _flush_tasks[chat_id] = asyncio.create_task(_flush_after_delay(bot, chat_id))
+
+
+__all__ = [
+    "JoinBurstDetector",
+    "RAID_VERIFY_CALLBACK",
+    "enqueue_raid_member",
+    "join_detector",
+    "send_consolidated_captcha",
+]
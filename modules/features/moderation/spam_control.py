@@ -1,38 +1,21 @@
-from core import mysql_connection
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from core import config, mysql_connection, safe_regex
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ChatPermissions
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, CommandHandler, MessageHandler, filters, CallbackQueryHandler
-import asyncio
 import logging
-import os
 import re
 import time
 import threading
-from collections import defaultdict
 from core.command_cooldown import cooldown
-from core.config import BASE_DIR
-
-SPAM_FILE_PATH = BASE_DIR / "resources" / "spam_words.txt"
-# 垃圾信息过滤缓存 {group_id: enabled}
-spam_filter_cache = {}
-cache_lock = threading.Lock()  # 缓存操作锁
-CACHE_TIMEOUT = 300  # 缓存过期时间：5分钟
-
-# 垃圾词列表缓存
-spam_words = set()
-spam_patterns = []
-last_spam_file_update = 0
-SPAM_FILE_UPDATE_INTERVAL = 600  # 垃圾词文件检查更新间隔：10分钟
-
-# 自定义垃圾词缓存 {group_id: {"keywords": [关键词列表], "patterns": [正则列表], "last_updated": timestamp}}
-custom_spam_words_cache = {}
-custom_cache_lock = threading.Lock()  # 自定义垃圾词缓存操作锁
-custom_loading_groups = set()
-
-# 速率限制器 {chat_id: {user_id: count}}
-warning_rate_limiter = defaultdict(lambda: defaultdict(int))
-rate_limit_lock = threading.Lock()
-WARNING_RESET_INTERVAL = 3600  # 警告计数重置时间：1小时
+from core.telegram_utils import is_chat_admin
+from .policy import get_group_policy, refresh_group_policy, update_group_policy
+from .spam_list import get_global_spam_list, setup_spam_list_watcher
+from .warning_counters import setup_warning_counter_jobs, warning_counters
+
+# 群的开关和自定义垃圾词都在 policy.GroupModerationPolicy 快照里
+# 全局垃圾词库由 spam_list 在后台加载，这里只读内存中的当前版本
+
+# 警告计数在 warning_counters 里按群、按用户滑动窗口统计，窗口 1 小时
 
 # 添加全局防抖字典，记录用户最后点击时间
 callback_cooldown = {}
@@ -85,79 +68,17 @@ SPAM_CONTROL_HELP_TEXT_PLAIN = (
     "/spam del <词> - 删除垃圾词\n"
 )
 
-# 从数据库加载群组的垃圾信息过滤状态
-async def load_spam_control_status(group_id):
-    """从数据库加载群组的垃圾信息过滤状态"""
-    try:
-        # 假设数据库结构已经正确设置，直接查询所有字段
-        result = await mysql_connection.fetch_one(
-            "SELECT enabled, block_links, block_mentions FROM group_spam_control WHERE group_id = %s",
-            (group_id,),
-        )
-        
-        with cache_lock:
-            if result:
-                spam_filter_cache[group_id] = {
-                    "enabled": result[0],
-                    "block_links": result[1],
-                    "block_mentions": result[2],
-                    "last_updated": time.time()
-                }
-                return result[0], result[1], result[2]
-            else:
-                spam_filter_cache[group_id] = {
-                    "enabled": False,
-                    "block_links": False,
-                    "block_mentions": False,
-                    "last_updated": time.time()
-                }
-                return False, False, False
-    except Exception as e:
-        logging.error(f"加载垃圾信息过滤状态时出错: {e}")
-        # 继续抛出异常，以便调用者处理
-        raise
-
 async def is_spam_control_enabled(group_id):
     """检查群组是否启用垃圾信息过滤"""
-    now = time.time()
-    
-    with cache_lock:
-        if group_id in spam_filter_cache:
-            cache_data = spam_filter_cache[group_id]
-            if now - cache_data["last_updated"] < CACHE_TIMEOUT:
-                return cache_data["enabled"]
-    
-    # 缓存不存在或已过期，从数据库加载
-    enabled, _, _ = await load_spam_control_status(group_id)
-    return enabled
+    return (await get_group_policy(group_id)).spam_enabled
 
 async def is_link_blocking_enabled(group_id):
     """检查群组是否启用链接过滤"""
-    now = time.time()
-    
-    with cache_lock:
-        if group_id in spam_filter_cache:
-            cache_data = spam_filter_cache[group_id]
-            if now - cache_data["last_updated"] < CACHE_TIMEOUT:
-                return cache_data.get("block_links", False)
-    
-    # 缓存不存在或已过期，从数据库加载
-    _, block_links, _ = await load_spam_control_status(group_id)
-    return block_links
+    return (await get_group_policy(group_id)).block_links
 
 async def is_mention_blocking_enabled(group_id):
     """检查群组是否启用@mention过滤"""
-    now = time.time()
-    
-    with cache_lock:
-        if group_id in spam_filter_cache:
-            cache_data = spam_filter_cache[group_id]
-            if now - cache_data["last_updated"] < CACHE_TIMEOUT:
-                return cache_data.get("block_mentions", False)
-    
-    # 缓存不存在或已过期，从数据库加载
-    _, _, block_mentions = await load_spam_control_status(group_id)
-    return block_mentions
+    return (await get_group_policy(group_id)).block_mentions
 
 def contains_url(text):
     """检查文本是否包含URL"""
@@ -179,149 +100,43 @@ def contains_mention(text):
         return True, match.group(0)
     return False, None
 
-def load_spam_words():
-    """从文件加载垃圾词列表"""
-    global spam_words, spam_patterns, last_spam_file_update
-    
-    # 检查文件是否存在
-    if not os.path.exists(SPAM_FILE_PATH):
-        logging.warning(f"垃圾词列表文件未找到: {SPAM_FILE_PATH}")
-        SPAM_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
-        with open(SPAM_FILE_PATH, 'w', encoding='utf-8') as f:
-            f.write("# 垃圾词列表，一行一个词语\n")
-            f.write("博彩\n发财\n")
-            f.write("# 使用//开头的行表示正则表达式匹配模式\n")
-            f.write("//\\d+\\s*[元块]\\s*[充值提现]\n")
-        logging.info(f"已创建默认垃圾词列表文件: {SPAM_FILE_PATH}")
-    
-    # 检查文件是否需要更新
-    file_mtime = os.path.getmtime(SPAM_FILE_PATH)
-    if file_mtime <= last_spam_file_update:
-        return  # 文件未更新，无需重新加载
-        
-    try:
-        new_spam_words = set()
-        new_patterns = []
-        
-        with open(SPAM_FILE_PATH, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'):
-                    continue
-                
-                # 处理正则表达式模式
-                if line.startswith('//'):
-                    pattern = line[2:].strip()  # 修复拼写错误：trip -> strip
-                    try:
-                        compiled = re.compile(pattern, re.IGNORECASE)
-                        new_patterns.append(compiled)
-                    except re.error:
-                        logging.error(f"无效的正则表达式: {pattern}")
-                else:
-                    new_spam_words.add(line.lower())
-                    
-        # 更新全局变量
-        spam_words = new_spam_words
-        spam_patterns = new_patterns
-        last_spam_file_update = file_mtime
-        logging.info(f"已加载 {len(spam_words)} 个垃圾词和 {len(spam_patterns)} 个正则表达式模式")
-    except Exception as e:
-        logging.error(f"加载垃圾词列表时出错: {e}")
-
-async def load_custom_spam_keywords(group_id):
-    """从数据库加载群组的自定义垃圾词"""
-    try:
-        results = await mysql_connection.fetch_all(
-            "SELECT keyword, is_regex FROM group_spam_keywords WHERE group_id = %s",
-            (group_id,),
-        )
-        
-        keywords = []
-        patterns = []
-        
-        for keyword, is_regex in results:
-            if is_regex:
-                try:
-                    compiled = re.compile(keyword, re.IGNORECASE)
-                    patterns.append(compiled)
-                except re.error:
-                    logging.error(f"无效的自定义正则表达式: {keyword}")
-            else:
-                keywords.append(keyword.lower())
-        
-        with custom_cache_lock:
-            custom_spam_words_cache[group_id] = {
-                "keywords": keywords,
-                "patterns": patterns,
-                "last_updated": time.time()
-            }
-        
-        return keywords, patterns
-    except Exception as e:
-        logging.error(f"加载自定义垃圾词时出错: {e}")
-        return [], []
-
 async def get_custom_spam_keywords(group_id):
-    """获取群组的自定义垃圾词，优先使用缓存，优化数据库访问"""
-    now = time.time()
-    
-    # 首先检查缓存是否存在且未过期
-    with custom_cache_lock:
-        if group_id in custom_spam_words_cache:
-            cache_data = custom_spam_words_cache[group_id]
-            # 如果缓存未过期，直接返回
-            if now - cache_data["last_updated"] < CACHE_TIMEOUT:
-                return cache_data["keywords"], cache_data["patterns"]
-    
-    # 二次检查：如果此群组正在被另一个协程加载，等待一小段时间后再次检查缓存
-    with custom_cache_lock:
-        is_loading = group_id in custom_loading_groups
-
-    if is_loading:
-        await asyncio.sleep(0.1)
-        with custom_cache_lock:
-            if group_id in custom_spam_words_cache:
-                cache_data = custom_spam_words_cache[group_id]
-                if now - cache_data["last_updated"] < CACHE_TIMEOUT:
-                    return cache_data["keywords"], cache_data["patterns"]
-    
-    # 标记该群组为"正在加载"状态
-    with custom_cache_lock:
-        custom_loading_groups.add(group_id)
-    
-    try:
-        # 从数据库加载
-        keywords, patterns = await load_custom_spam_keywords(group_id)
-        return keywords, patterns
-    finally:
-        # 无论加载成功与否，都移除"正在加载"标记
-        with custom_cache_lock:
-            custom_loading_groups.discard(group_id)
+    """获取群组编译好的自定义垃圾词 (关键词匹配器, 正则列表)"""
+    policy = await get_group_policy(group_id)
+    return policy.spam_keywords, policy.spam_patterns
 
 async def has_custom_spam_keywords(group_id):
     """检查群组是否有自定义垃圾词"""
-    keywords, patterns = await get_custom_spam_keywords(group_id)
-    return len(keywords) > 0 or len(patterns) > 0
+    return (await get_group_policy(group_id)).has_custom_spam_keywords
 
 async def is_spam_message(message_text, group_id):
     """检查消息是否为垃圾信息，返回(是否垃圾信息, 触发的关键词)"""
+    if not message_text:
+        return False, None
+    return check_spam_text(await get_group_policy(group_id), message_text)
+
+def check_spam_text(policy, message_text):
+    """按群策略快照检查文本，返回(是否垃圾信息, 触发的关键词)"""
     if not message_text:
         return False, None
 
     # 检查群组是否有自定义垃圾词，有则优先使用
-    custom_keywords, custom_patterns = await get_custom_spam_keywords(group_id)
+    custom_keywords, custom_patterns = policy.spam_keywords, policy.spam_patterns
     
     # 如果有自定义垃圾词，就只用自定义的
     if custom_keywords or custom_patterns:
         # 检查自定义垃圾词
-        text_lower = message_text.lower()
-        for word in custom_keywords:
-            if word in text_lower:
+        if custom_keywords:
+            word = custom_keywords.search(message_text.lower())
+            if word:
                 return True, word
         
         # 检查自定义正则表达式
         for pattern in custom_patterns:
-            match = pattern.search(message_text)
+            try:
+                match = pattern.search(message_text)
+            except safe_regex.RegexTimeoutError:
+                continue
             if match:
                 matched_text = match.group(0) if match.group(0) else pattern.pattern
                 return True, matched_text
@@ -329,22 +144,22 @@ async def is_spam_message(message_text, group_id):
         return False, None
     
     # 无自定义垃圾词，使用全局垃圾词列表
-    # 检查文件是否需要更新
-    now = time.time()
-    if now - last_spam_file_update > SPAM_FILE_UPDATE_INTERVAL:
-        load_spam_words()
+    spam_list = get_global_spam_list()
     
     # 转为小写进行匹配
     text_lower = message_text.lower()
     
-    # 检查垃圾词
-    for word in spam_words:
-        if word in text_lower:
-            return True, word
+    # 检查垃圾词：单遍扫描，命中多个时按词表顺序取第一个
+    word = spam_list.words.search(text_lower)
+    if word:
+        return True, word
     
     # 检查正则表达式模式
-    for pattern in spam_patterns:
-        match = pattern.search(message_text)
+    for pattern in spam_list.patterns:
+        try:
+            match = pattern.search(message_text)
+        except safe_regex.RegexTimeoutError:
+            continue
         if match:
             # 尝试返回匹配到的实际文本，如果无法获取则返回模式
             matched_text = match.group(0) if match.group(0) else pattern.pattern
@@ -353,11 +168,31 @@ async def is_spam_message(message_text, group_id):
     return False, None
 
 def update_warning_count(chat_id, user_id):
-    """更新用户警告次数，返回当前警告次数"""
-    with rate_limit_lock:
-        # 获取当前计数
-        warning_rate_limiter[chat_id][user_id] += 1
-        return warning_rate_limiter[chat_id][user_id]
+    """更新用户警告次数，返回窗口内的警告次数"""
+    return warning_counters.record(chat_id, user_id)
+
+async def escalate_warning(bot, chat_id, user_id, warning_count):
+    """警告次数达到阈值时禁言并清零计数，返回附加在警告消息后的说明。
+
+    只在跨过阈值的那一条消息上调用一次 API，平时不产生额外请求。禁言失败（比如
+    bot 没有权限）也清零，要重新攒够阈值才再试，不会每条警告都去调 API。
+    """
+    threshold = config.SPAM_WARNING_RESTRICT_THRESHOLD
+    if not threshold or warning_count < threshold:
+        return ""
+    minutes = config.SPAM_WARNING_RESTRICT_MINUTES
+    warning_counters.reset(chat_id, user_id)
+    try:
+        await bot.restrict_chat_member(
+            chat_id,
+            user_id,
+            permissions=ChatPermissions(can_send_messages=False),
+            until_date=int(time.time()) + minutes * 60,
+        )
+    except Exception as e:
+        logging.error(f"自动禁言用户时出错: {e}")
+        return ""
+    return f"\n已累计 {warning_count} 次警告，禁言 {minutes} 分钟。"
 
 @cooldown
 async def toggle_spam_control(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -372,8 +207,7 @@ async def toggle_spam_control(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # 检查用户是否为群组管理员
     try:
-        chat_member = await context.bot.get_chat_member(chat_id, user_id)
-        if chat_member.status not in ["administrator", "creator"]:
+        if not await is_chat_admin(context.bot, chat_id, user_id):
             await update.message.reply_text("只有群组管理员才能使用此命令。")
             return
         is_admin = True  # 标记用户为管理员
@@ -473,7 +307,7 @@ async def toggle_spam_control(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     # 获取当前状态
-    current_status = await is_spam_control_enabled(chat_id)
+    current_status = (await get_group_policy(chat_id)).spam_enabled
     
     # 切换状态
     new_status = not current_status
@@ -506,20 +340,13 @@ async def toggle_spam_control(update: Update, context: ContextTypes.DEFAULT_TYPE
                 (chat_id, block_links, block_mentions, user_id, user_id),
             )
         
-        # 更新缓存，保留所有设置
-        with cache_lock:
-            if chat_id in spam_filter_cache:
-                spam_filter_cache[chat_id].update({
-                    "enabled": new_status,
-                    "last_updated": time.time()
-                })
-            else:
-                spam_filter_cache[chat_id] = {
-                    "enabled": new_status,
-                    "block_links": block_links,
-                    "block_mentions": block_mentions,
-                    "last_updated": time.time()
-                }
+        # 替换策略快照，保留所有设置
+        await update_group_policy(
+            chat_id,
+            spam_enabled=new_status,
+            block_links=bool(block_links),
+            block_mentions=bool(block_mentions),
+        )
         
         if new_status:
             # 只对管理员显示"查看更多功能"按钮
@@ -570,11 +397,8 @@ async def toggle_link_blocking(update: Update, chat_id: int, user_id: int, enabl
             (enable, chat_id),
         )
         
-        # 更新缓存
-        with cache_lock:
-            if chat_id in spam_filter_cache:
-                spam_filter_cache[chat_id]["block_links"] = enable
-                spam_filter_cache[chat_id]["last_updated"] = time.time()
+        # 替换策略快照
+        await update_group_policy(chat_id, block_links=enable)
         
         status_text = "开启" if enable else "关闭"
         await update.message.reply_text(
@@ -612,11 +436,8 @@ async def toggle_mention_blocking(update: Update, chat_id: int, user_id: int, en
             (enable, chat_id),
         )
         
-        # 更新缓存
-        with cache_lock:
-            if chat_id in spam_filter_cache:
-                spam_filter_cache[chat_id]["block_mentions"] = enable
-                spam_filter_cache[chat_id]["last_updated"] = time.time()
+        # 替换策略快照
+        await update_group_policy(chat_id, block_mentions=enable)
         
         status_text = "开启" if enable else "关闭"
         await update.message.reply_text(
@@ -637,10 +458,13 @@ async def add_custom_spam_keyword(update: Update, chat_id: int, user_id: int, ke
         
         # 验证正则表达式是否有效
         try:
-            re.compile(keyword)
+            safe_regex.compile_safe(keyword, re.IGNORECASE)
         except re.error:
             await update.message.reply_text(f"无效的正则表达式: {keyword}")
             return
+        except safe_regex.UnsafePatternError as e:
+            await update.message.reply_text(f"正则表达式过于复杂，可能拖慢消息检测: {e}")
+            return
     
     # 检查关键词长度
     if len(keyword) > 255:
@@ -674,8 +498,8 @@ async def add_custom_spam_keyword(update: Update, chat_id: int, user_id: int, ke
             (chat_id, keyword, is_regex, user_id),
         )
         
-        # 更新缓存
-        await load_custom_spam_keywords(chat_id)
+        # 重建策略快照
+        await refresh_group_policy(chat_id)
         
         if existing_keyword:
             await update.message.reply_text(f"已更新自定义垃圾词: '{keyword}'")
@@ -698,8 +522,8 @@ async def del_custom_spam_keyword(update: Update, chat_id: int, keyword: str):
         )
         
         if rowcount > 0:
-            # 更新缓存
-            await load_custom_spam_keywords(chat_id)
+            # 重建策略快照
+            await refresh_group_policy(chat_id)
             await update.message.reply_text(f"已删除自定义垃圾词: '{keyword}'")
         else:
             await update.message.reply_text(f"未找到自定义垃圾词: '{keyword}'")
@@ -770,8 +594,7 @@ async def spam_help_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     # 验证点击者是否为管理员
     try:
-        chat_member = await context.bot.get_chat_member(chat_id, user_id)
-        if chat_member.status not in ["administrator", "creator"]:
+        if not await is_chat_admin(context.bot, chat_id, user_id):
             await query.answer("只有管理员可以查看此功能", show_alert=True)
             return
     except Exception as e:
@@ -826,43 +649,25 @@ async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if len(message_text) < 2:
         return
     
-    # 提前检查群组是否启用了垃圾信息过滤（性能优化）
-    if not await is_spam_control_enabled(chat_id):
+    # 一次取出群策略快照，后续检查都读它
+    policy = await get_group_policy(chat_id)
+    if not policy.spam_enabled:
         return
     
     user_id = effective_message.from_user.id
     
-    # 添加缓存检查，减少管理员权限检查次数
-    is_admin_cache_key = f"is_admin:{chat_id}:{user_id}"
-    is_admin = context.chat_data.get(is_admin_cache_key, None)
-    
-    if is_admin is None:
-        try:
-            chat_member = await context.bot.get_chat_member(chat_id, user_id)
-            is_admin = chat_member.status in ["administrator", "creator"]
-            # 缓存结果5分钟
-            context.chat_data[is_admin_cache_key] = is_admin
-            context.chat_data[f"{is_admin_cache_key}_expire"] = time.time() + 300
-        except Exception as e:
-            logging.error(f"获取用户权限时出错: {e}")
-            is_admin = False  # 如果出错，假设不是管理员（安全第一）
-    # 检查缓存是否过期
-    elif time.time() > context.chat_data.get(f"{is_admin_cache_key}_expire", 0):
-        try:
-            chat_member = await context.bot.get_chat_member(chat_id, user_id)
-            is_admin = chat_member.status in ["administrator", "creator"]
-            # 更新缓存
-            context.chat_data[is_admin_cache_key] = is_admin
-            context.chat_data[f"{is_admin_cache_key}_expire"] = time.time() + 300
-        except Exception as e:
-            logging.error(f"刷新用户权限缓存时出错: {e}")
-            # 保留旧的缓存值
+    # 管理员名单按群共享缓存，一个群每个 TTL 只查一次
+    try:
+        is_admin = await is_chat_admin(context.bot, chat_id, user_id)
+    except Exception as e:
+        logging.error(f"获取用户权限时出错: {e}")
+        is_admin = False  # 如果出错，假设不是管理员（安全第一）
     
     if is_admin:
         return  # 跳过对管理员消息的检测
     
     # 首先检查链接过滤设置
-    if await is_link_blocking_enabled(chat_id):
+    if policy.block_links:
         has_url, found_url = contains_url(message_text)
         if has_url:
             user_mention = effective_message.from_user.mention_html()
@@ -879,7 +684,7 @@ async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 warning_message = (
                     f"⚠️ 注意: {user_mention} 发送的消息包含链接 <tg-spoiler>{found_url}</tg-spoiler>，已被自动删除。\n"
                     f"本群组禁止发送链接。这是第 {warning_count} 次警告。"
-                )
+                ) + await escalate_warning(context.bot, chat_id, user_id, warning_count)
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=warning_message,
@@ -895,7 +700,7 @@ async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 logging.error(f"处理链接消息时出错: {e}")
     
     # 检查@mention过滤设置
-    if await is_mention_blocking_enabled(chat_id):
+    if policy.block_mentions:
         has_mention, found_mention = contains_mention(message_text)
         if has_mention:
             user_mention = effective_message.from_user.mention_html()
@@ -912,7 +717,7 @@ async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 warning_message = (
                     f"⚠️ 注意: {user_mention} 发送的消息包含@提及 <tg-spoiler>{found_mention}</tg-spoiler>，已被自动删除。\n"
                     f"本群组禁止@提及用户。这是第 {warning_count} 次警告。"
-                )
+                ) + await escalate_warning(context.bot, chat_id, user_id, warning_count)
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=warning_message,
@@ -928,7 +733,7 @@ async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 logging.error(f"处理@mention消息时出错: {e}")
     
     # 继续检查是否为垃圾信息
-    is_spam, trigger_word = await is_spam_message(message_text, chat_id)
+    is_spam, trigger_word = check_spam_text(policy, message_text)
     if is_spam:
         user_mention = effective_message.from_user.mention_html()
         warning_count = update_warning_count(chat_id, user_id)
@@ -944,7 +749,7 @@ async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
             warning_message = (
                 f"⚠️ 注意: {user_mention} 发送的消息包含垃圾内容 <tg-spoiler>{trigger_word}</tg-spoiler>，已被自动删除。\n"
                 f"这是第 {warning_count} 次警告。持续发送垃圾信息可能导致被禁言或移出群组。"
-            )
+            ) + await escalate_warning(context.bot, chat_id, user_id, warning_count)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=warning_message,
@@ -959,8 +764,8 @@ async def process_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def setup_spam_control_handlers(dispatcher):
     """注册垃圾信息过滤处理器，不再尝试创建数据库表"""
-    # 初始化垃圾词列表
-    load_spam_words()
+    # 加载全局垃圾词列表，并在后台监视文件变化
+    setup_spam_list_watcher(dispatcher)
     
     # 添加命令处理器
     dispatcher.add_handler(CommandHandler("spam", toggle_spam_control))
@@ -979,19 +784,5 @@ def setup_spam_control_handlers(dispatcher):
         group=5  # 优先级高于关键词处理
     )
     
-    # 定期清理警告计数器
-    def reset_warning_counters():
-        with rate_limit_lock:
-            warning_rate_limiter.clear()
-            logging.info("已清理垃圾信息警告计数器")
-        # 递归设置下一次清理任务
-        from threading import Timer
-        timer = Timer(WARNING_RESET_INTERVAL, reset_warning_counters)
-        timer.daemon = True
-        timer.start()
-    
-    # 设置定时任务清理警告计数
-    from threading import Timer
-    timer = Timer(WARNING_RESET_INTERVAL, reset_warning_counters)
-    timer.daemon = True
-    timer.start()
+    # 定期清理过期的警告计数（按配置持久化）
+    setup_warning_counter_jobs(dispatcher)
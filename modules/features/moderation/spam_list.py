@@ -0,0 +1,174 @@
+"""全局垃圾词库（resources/spam_words.txt）。
+
+文件在后台监视：装了 watchfiles 时用 inotify 等文件事件，同时定时比对 mtime
+兜底。读文件、解析和编译匹配器都放到线程里做，编好的 GlobalSpamList 整体替换
+模块级引用；消息路径只调 get_global_spam_list()，不碰文件系统。
+"""
+
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from core import safe_regex
+from core.config import BASE_DIR
+from core.keyword_matcher import KeywordMatcher
+
+try:  # pragma: no cover - optional dependency
+    import watchfiles
+except ImportError:  # pragma: no cover - optional dependency
+    watchfiles = None
+
+SPAM_FILE_PATH = BASE_DIR / "resources" / "spam_words.txt"
+SPAM_FILE_POLL_INTERVAL = 30  # mtime 轮询间隔（秒）
+
+DEFAULT_SPAM_FILE_CONTENT = (
+    "# 垃圾词列表，一行一个词语\n"
+    "博彩\n发财\n"
+    "# 使用//开头的行表示正则表达式匹配模式\n"
+    "//\\d+\\s*[元块]\\s*[充值提现]\n"
+)
+
+
+@dataclass(frozen=True)
+class GlobalSpamList:
+    words: KeywordMatcher = field(default_factory=lambda: KeywordMatcher(()))
+    patterns: tuple = ()
+    # 加载时文件的 mtime，轮询据此判断是否需要重新加载
+    mtime: float = 0.0
+
+
+def parse_spam_list(lines, mtime=0.0):
+    """解析垃圾词文件的行：// 开头为正则，# 开头为注释。"""
+    words = []
+    patterns = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.startswith('//'):
+            pattern = line[2:].strip()
+            try:
+                patterns.append(safe_regex.compile_safe(pattern, re.IGNORECASE))
+            except re.error:
+                logging.error(f"无效的正则表达式: {pattern}")
+            except safe_regex.UnsafePatternError as e:
+                logging.error(f"正则表达式过于复杂，已跳过: {pattern} ({e})")
+        else:
+            words.append(line.lower())
+    return GlobalSpamList(words=KeywordMatcher(words), patterns=tuple(patterns), mtime=mtime)
+
+
+def _ensure_spam_file(path):
+    if path.exists():
+        return
+    logging.warning(f"垃圾词列表文件未找到: {path}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(DEFAULT_SPAM_FILE_CONTENT, encoding='utf-8')
+    logging.info(f"已创建默认垃圾词列表文件: {path}")
+
+
+def read_spam_list(path=None):
+    """同步读取并编译垃圾词文件，文件不存在时先写入默认内容。"""
+    path = Path(path or SPAM_FILE_PATH)
+    _ensure_spam_file(path)
+    mtime = os.path.getmtime(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_spam_list(f, mtime=mtime)
+
+
+def _spam_file_mtime():
+    try:
+        return os.path.getmtime(SPAM_FILE_PATH)
+    except OSError:
+        return None
+
+
+_current = GlobalSpamList()
+_watcher_task = None
+
+
+def get_global_spam_list():
+    """当前生效的全局垃圾词库；只读内存，可在消息路径上调用。"""
+    return _current
+
+
+def _publish(spam_list):
+    global _current
+    _current = spam_list
+    logging.info(
+        f"已加载 {len(spam_list.words.words)} 个垃圾词和 {len(spam_list.patterns)} 个正则表达式模式"
+    )
+
+
+def load_spam_list():
+    """启动时同步加载一次（事件循环尚未开始处理消息）。"""
+    try:
+        _publish(read_spam_list())
+    except Exception as e:
+        logging.error(f"加载垃圾词列表时出错: {e}")
+
+
+async def reload_spam_list(force=False):
+    """文件有变化时在线程里重新解析并替换，返回是否替换。
+
+    出错时保留旧词库，下次轮询再试。
+    """
+    try:
+        mtime = await asyncio.to_thread(_spam_file_mtime)
+        if not force and mtime is not None and mtime == _current.mtime:
+            return False
+        spam_list = await asyncio.to_thread(read_spam_list)
+    except Exception as e:
+        logging.error(f"加载垃圾词列表时出错: {e}")
+        return False
+    _publish(spam_list)
+    return True
+
+
+async def _watch_spam_file():
+    path = SPAM_FILE_PATH.resolve()
+
+    def _is_spam_file(_change, changed_path):
+        return Path(changed_path).resolve() == path
+
+    # 监视所在目录：编辑器常用“写临时文件再改名”的方式保存
+    async for _changes in watchfiles.awatch(path.parent, watch_filter=_is_spam_file):
+        await reload_spam_list()
+
+
+def _ensure_watcher(application):
+    global _watcher_task
+    if watchfiles is None or application is None:
+        return
+    if _watcher_task is not None and not _watcher_task.done():
+        return
+    _watcher_task = application.create_task(_watch_spam_file())
+
+
+async def _refresh_spam_list_job(context):
+    _ensure_watcher(getattr(context, "application", None))
+    await reload_spam_list()
+
+
+def setup_spam_list_watcher(application):
+    """加载词库并注册后台刷新任务。"""
+    load_spam_list()
+    application.job_queue.run_repeating(
+        _refresh_spam_list_job,
+        interval=SPAM_FILE_POLL_INTERVAL,
+        first=SPAM_FILE_POLL_INTERVAL,
+    )
+
+
+__all__ = [
+    "GlobalSpamList",
+    "get_global_spam_list",
+    "load_spam_list",
+    "parse_spam_list",
+    "read_spam_list",
+    "reload_spam_list",
+    "setup_spam_list_watcher",
+]
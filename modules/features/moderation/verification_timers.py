@@ -0,0 +1,322 @@
+"""新成员验证的超时队列。
+
+待验证的成员统一挂在一个时间轮上（键为 (chat_id, user_id)），由一个定时任务每隔
+几秒批量处理：
+
+- 到期的成员并发踢出并编辑欢迎消息，并发数有上限，遇到限流按 retry_after 重试；
+- 新增、移除的验证记录先攒在内存里，同一轮用多行 INSERT 和按主键批量 DELETE 写库；
+- 进群突增时多人共用一条验证消息（见 raid_mode），这类消息不逐人编辑，等其中的
+  成员都验证、离开或超时后整条删除。
+
+重启后第一轮从 verification_tasks 表读回全部记录，停机期间已经到期的也会在这一轮
+处理掉。
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from core import mysql_connection, update_routing
+from core.expiry_wheel import ExpiryWheel
+from core.telegram_utils import retry_telegram_send
+
+VERIFY_TIMEOUT_SECONDS = 300  # 验证有效期：5分钟
+VERIFY_TICK_SECONDS = 5  # 批处理间隔
+VERIFY_ACTION_CONCURRENCY = 8  # 同时进行的踢人/编辑请求数
+VERIFY_DB_BATCH_SIZE = 500
+
+logger = logging.getLogger(__name__)
+
+
+class VerificationQueue:
+    def __init__(self, *, clock=time.time):
+        self._clock = clock
+        self._wheel = ExpiryWheel()
+        # {(chat_id, user_id): message_id}
+        self._messages = {}
+        # 待写库：{(chat_id, user_id): (message_id, expire_time)} 与待删除的键
+        self._pending_writes = {}
+        self._pending_deletes = set()
+        # 多人共用的验证消息：{(chat_id, message_id): 仍在等待的人数}
+        self._shared = {}
+        self.restored = False
+
+    def __len__(self):
+        return len(self._messages)
+
+    def get(self, chat_id, user_id):
+        return self._messages.get((chat_id, user_id))
+
+    def is_shared(self, chat_id, message_id):
+        return (chat_id, message_id) in self._shared
+
+    def _release(self, chat_id, message_id):
+        shared_key = (chat_id, message_id)
+        if self._shared.get(shared_key):
+            self._shared[shared_key] -= 1
+
+    def add(self, chat_id, user_id, message_id, timeout=VERIFY_TIMEOUT_SECONDS, *, shared=False):
+        key = (chat_id, user_id)
+        previous = self._messages.get(key)
+        if previous is not None:
+            self._release(chat_id, previous)
+        if shared:
+            shared_key = (chat_id, message_id)
+            self._shared[shared_key] = self._shared.get(shared_key, 0) + 1
+        expires_at = self._clock() + timeout
+        self._wheel.schedule(key, expires_at)
+        self._messages[key] = message_id
+        self._pending_deletes.discard(key)
+        self._pending_writes[key] = (message_id, datetime.fromtimestamp(expires_at))
+        return expires_at
+
+    def attach_message(self, chat_id, user_id, message_id):
+        """把先挂着占位消息 ID 的成员改挂到发出的共用消息上，到期时间不变。
+
+        成员已不在队列（验证、离开或超时）时返回 False。
+        """
+        key = (chat_id, user_id)
+        previous = self._messages.get(key)
+        if previous is None:
+            return False
+        self._release(chat_id, previous)
+        shared_key = (chat_id, message_id)
+        self._shared[shared_key] = self._shared.get(shared_key, 0) + 1
+        self._messages[key] = message_id
+        self._pending_writes[key] = (message_id, datetime.fromtimestamp(self._wheel.get(key)))
+        return True
+
+    def remove(self, chat_id, user_id):
+        """移除待验证成员，返回欢迎消息 ID；不存在时返回 None。"""
+        key = (chat_id, user_id)
+        message_id = self._messages.pop(key, None)
+        if message_id is None:
+            return None
+        self._wheel.discard(key)
+        self._release(chat_id, message_id)
+        self._pending_writes.pop(key, None)
+        self._pending_deletes.add(key)
+        return message_id
+
+    def pop_due(self):
+        """摘下已到期的成员：[(chat_id, user_id, message_id)]。"""
+        due = []
+        for key in self._wheel.pop_due(self._clock()):
+            message_id = self._messages.pop(key)
+            self._release(key[0], message_id)
+            due.append((*key, message_id))
+            self._pending_writes.pop(key, None)
+            self._pending_deletes.add(key)
+        return due
+
+    def drain_finished_shared(self):
+        """取出成员都已处理完的共用消息：[(chat_id, message_id)]。"""
+        finished = [key for key, waiting in self._shared.items() if waiting <= 0]
+        for key in finished:
+            del self._shared[key]
+        return finished
+
+    def restore(self, rows):
+        """载入库里的 (user_id, group_id, message_id, expire_time)，不产生写库。
+
+        库里不记是否共用消息：同一群里多人挂在同一条消息上的就是合并验证消息，
+        按人数重建 _shared，避免第一个人验证或超时时把整条消息改掉。
+        """
+        restored = {}
+        for user_id, chat_id, message_id, expire_time in rows:
+            key = (chat_id, user_id)
+            if key in self._messages or key in self._pending_deletes:
+                continue  # 启动后已有新的进展，以内存为准
+            self._wheel.schedule(key, expire_time.timestamp())
+            self._messages[key] = message_id
+            restored[(chat_id, message_id)] = restored.get((chat_id, message_id), 0) + 1
+        for shared_key, count in restored.items():
+            if count > 1 or shared_key in self._shared:
+                self._shared[shared_key] = self._shared.get(shared_key, 0) + count
+
+    def drain_writes(self):
+        """取出待写库的改动：([(user_id, group_id, message_id, expire_time)], [(user_id, group_id)])。"""
+        upserts = [
+            (user_id, chat_id, message_id, expire_time)
+            for (chat_id, user_id), (message_id, expire_time) in self._pending_writes.items()
+        ]
+        deletes = [(user_id, chat_id) for chat_id, user_id in self._pending_deletes]
+        self._pending_writes = {}
+        self._pending_deletes = set()
+        return upserts, deletes
+
+    def requeue_writes(self, upserts, deletes):
+        """写库失败时放回；这期间同一个键已有新改动的，以新改动为准。"""
+        for user_id, chat_id, message_id, expire_time in upserts:
+            key = (chat_id, user_id)
+            if key not in self._pending_writes and key not in self._pending_deletes:
+                self._pending_writes[key] = (message_id, expire_time)
+        for user_id, chat_id in deletes:
+            key = (chat_id, user_id)
+            if key not in self._pending_writes:
+                self._pending_deletes.add(key)
+
+    def clear(self):
+        self._wheel.clear()
+        self._messages.clear()
+        self._pending_writes.clear()
+        self._pending_deletes.clear()
+        self._shared.clear()
+        self.restored = False
+
+
+verification_queue = VerificationQueue()
+
+
+def _chunks(items, size=VERIFY_DB_BATCH_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def flush_verification_writes():
+    upserts, deletes = verification_queue.drain_writes()
+    if not upserts and not deletes:
+        return
+    try:
+        async with mysql_connection.transaction() as connection:
+            for chunk in _chunks(deletes):
+                placeholders = ", ".join(["(%s, %s)"] * len(chunk))
+                await mysql_connection.execute(
+                    "DELETE FROM verification_tasks WHERE (user_id, group_id) IN "
+                    f"({placeholders})",
+                    [value for row in chunk for value in row],
+                    connection=connection,
+                )
+            for chunk in _chunks(upserts):
+                placeholders = ", ".join(["(%s, %s, %s, %s)"] * len(chunk))
+                await mysql_connection.execute(
+                    "INSERT INTO verification_tasks (user_id, group_id, message_id, expire_time) "
+                    f"VALUES {placeholders} "
+                    "ON DUPLICATE KEY UPDATE message_id = VALUES(message_id), "
+                    "expire_time = VALUES(expire_time)",
+                    [value for row in chunk for value in row],
+                    connection=connection,
+                )
+    except Exception:
+        verification_queue.requeue_writes(upserts, deletes)
+        raise
+
+
+async def restore_verification_tasks():
+    """从数据库读回未完成的验证（含已过期的，下一轮直接处理）。"""
+    rows = await mysql_connection.fetch_all(
+        "SELECT user_id, group_id, message_id, expire_time FROM verification_tasks"
+    )
+    # webhook 多进程时各进程只接管自己负责的群
+    verification_queue.restore(row for row in rows or [] if update_routing.owns_chat(row[1]))
+    verification_queue.restored = True
+
+
+async def _expire_member(bot, chat_id, user_id, message_id, semaphore, *, edit=True):
+    async with semaphore:
+        try:
+            # 封禁后立即解封，相当于踢出且不永久封禁
+            await retry_telegram_send(
+                lambda: bot.ban_chat_member(chat_id, user_id),
+                logger=logger,
+                action="kick unverified member",
+            )
+            await retry_telegram_send(
+                lambda: bot.unban_chat_member(chat_id, user_id),
+                logger=logger,
+                action="unban unverified member",
+            )
+        except Exception as e:
+            logger.warning(f"踢出成员 {user_id} 时出错: {e}")
+        if not edit:
+            return
+        try:
+            await retry_telegram_send(
+                lambda: bot.edit_message_text(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    text="验证超时，您已被移出群组。",
+                ),
+                logger=logger,
+                action="edit verification message",
+            )
+        except Exception as e:
+            logger.warning(f"编辑消息 {message_id} 出错: {e}")
+
+
+async def _delete_shared_message(bot, chat_id, message_id, semaphore):
+    if not message_id:
+        return  # 合并验证消息当初没发出去
+    async with semaphore:
+        try:
+            await retry_telegram_send(
+                lambda: bot.delete_message(chat_id=chat_id, message_id=message_id),
+                logger=logger,
+                action="delete shared verification message",
+            )
+        except Exception as e:
+            logger.warning(f"删除验证消息 {message_id} 出错: {e}")
+
+
+async def process_expired_verifications(bot):
+    """处理所有到期的成员并清掉已用完的共用消息，返回超时的人数。"""
+    due = verification_queue.pop_due()
+    shared = {
+        (chat_id, message_id)
+        for chat_id, _user_id, message_id in due
+        if verification_queue.is_shared(chat_id, message_id)
+    }
+    finished = verification_queue.drain_finished_shared()
+    if due or finished:
+        semaphore = asyncio.Semaphore(VERIFY_ACTION_CONCURRENCY)
+        await asyncio.gather(
+            *(
+                _expire_member(
+                    bot,
+                    chat_id,
+                    user_id,
+                    message_id,
+                    semaphore,
+                    # message_id 为 0 表示验证消息还没发出或没发出去
+                    edit=bool(message_id) and (chat_id, message_id) not in shared,
+                )
+                for chat_id, user_id, message_id in due
+            ),
+            *(
+                _delete_shared_message(bot, chat_id, message_id, semaphore)
+                for chat_id, message_id in finished
+            ),
+        )
+    return len(due)
+
+
+async def _verification_tick_job(context):
+    try:
+        if not verification_queue.restored:
+            await restore_verification_tasks()
+    except Exception as e:
+        logger.error(f"恢复验证任务时出错: {e}")
+    await process_expired_verifications(context.bot)
+    try:
+        await flush_verification_writes()
+    except Exception as e:
+        logger.error(f"写入验证任务时出错: {e}")
+
+
+def setup_verification_jobs(application):
+    application.job_queue.run_repeating(
+        _verification_tick_job,
+        interval=VERIFY_TICK_SECONDS,
+        first=VERIFY_TICK_SECONDS,
+    )
+
+
+__all__ = [
+    "VerificationQueue",
+    "flush_verification_writes",
+    "process_expired_verifications",
+    "restore_verification_tasks",
+    "setup_verification_jobs",
+    "verification_queue",
+]
@@ -0,0 +1,205 @@
+"""垃圾信息警告计数：按群、按用户的滑动窗口。
+
+窗口切成若干个时间桶，每个用户只存窗口内非空桶的 (桶号, 次数)，过期的桶在读写时
+顺手丢掉，计数随时间自然衰减。每个群最多记 max_users_per_chat 个用户，超出时淘汰
+最久没有被警告的；定时任务清掉整个窗口内都没有警告的用户和空群。
+
+所有读写都在事件循环里，不加锁。开启 SPAM_WARNING_PERSIST 时，定时任务把改动过的
+条目写入 spam_warning_counters 表，重启后再读回来。
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+
+from core import config, mysql_connection, update_routing
+
+WARNING_WINDOW_SECONDS = 3600  # 警告计数窗口：1小时
+WARNING_BUCKET_COUNT = 6  # 窗口切成 6 个 10 分钟的桶
+WARNING_MAX_USERS_PER_CHAT = 500
+WARNING_PRUNE_INTERVAL = 300  # 清理/持久化间隔（秒）
+
+
+class WarningCounters:
+    def __init__(
+        self,
+        *,
+        window_seconds=WARNING_WINDOW_SECONDS,
+        bucket_count=WARNING_BUCKET_COUNT,
+        max_users_per_chat=WARNING_MAX_USERS_PER_CHAT,
+        clock=time.time,
+    ):
+        self.bucket_seconds = window_seconds / bucket_count
+        self.bucket_count = bucket_count
+        self.max_users_per_chat = max_users_per_chat
+        self._clock = clock
+        # {chat_id: OrderedDict[user_id, ((bucket, count), ...)]}，按最近警告排序
+        self._chats = {}
+        # 自上次持久化以来改动或删除过的 (chat_id, user_id)
+        self._dirty = set()
+
+    def __len__(self):
+        return sum(len(users) for users in self._chats.values())
+
+    def _current_bucket(self):
+        return int(self._clock() // self.bucket_seconds)
+
+    def _live(self, buckets, current):
+        oldest = current - self.bucket_count
+        return tuple(item for item in buckets if item[0] > oldest)
+
+    def record(self, chat_id, user_id):
+        """记一次警告，返回窗口内的警告次数。"""
+        current = self._current_bucket()
+        users = self._chats.setdefault(chat_id, OrderedDict())
+        buckets = self._live(users.pop(user_id, ()), current)
+        if buckets and buckets[-1][0] == current:
+            buckets = buckets[:-1] + ((current, buckets[-1][1] + 1),)
+        else:
+            buckets = buckets + ((current, 1),)
+        users[user_id] = buckets
+        self._dirty.add((chat_id, user_id))
+        while len(users) > self.max_users_per_chat:
+            evicted, _ = users.popitem(last=False)
+            self._dirty.add((chat_id, evicted))
+        return sum(count for _, count in buckets)
+
+    def count(self, chat_id, user_id):
+        buckets = self._chats.get(chat_id, {}).get(user_id, ())
+        return sum(count for _, count in self._live(buckets, self._current_bucket()))
+
+    def reset(self, chat_id, user_id):
+        users = self._chats.get(chat_id)
+        if users is not None and users.pop(user_id, None) is not None:
+            self._dirty.add((chat_id, user_id))
+            if not users:
+                del self._chats[chat_id]
+
+    def prune(self):
+        """清掉窗口内没有警告的用户和空群，返回清掉的用户数。"""
+        current = self._current_bucket()
+        removed = 0
+        for chat_id in list(self._chats):
+            users = self._chats[chat_id]
+            for user_id in list(users):
+                buckets = self._live(users[user_id], current)
+                if buckets:
+                    users[user_id] = buckets
+                    continue
+                del users[user_id]
+                self._dirty.add((chat_id, user_id))
+                removed += 1
+            if not users:
+                del self._chats[chat_id]
+        return removed
+
+    def drain_changes(self):
+        """取出待持久化的改动：([(chat_id, user_id, buckets)], [(chat_id, user_id)])。"""
+        upserts = []
+        deletes = []
+        for chat_id, user_id in self._dirty:
+            buckets = self._chats.get(chat_id, {}).get(user_id)
+            if buckets:
+                upserts.append((chat_id, user_id, buckets))
+            else:
+                deletes.append((chat_id, user_id))
+        self._dirty.clear()
+        return upserts, deletes
+
+    def mark_dirty(self, keys):
+        self._dirty.update(keys)
+
+    def load(self, rows):
+        """并入持久化的 (chat_id, user_id, buckets)，已过期的桶直接丢弃。"""
+        current = self._current_bucket()
+        for chat_id, user_id, buckets in rows:
+            live = self._live(tuple(tuple(item) for item in buckets), current)
+            if not live:
+                continue
+            users = self._chats.setdefault(chat_id, OrderedDict())
+            merged = dict(live)
+            for bucket, count in users.get(user_id, ()):
+                merged[bucket] = merged.get(bucket, 0) + count
+            users[user_id] = tuple(sorted(merged.items()))
+            while len(users) > self.max_users_per_chat:
+                users.popitem(last=False)
+
+    def clear(self):
+        self._chats.clear()
+        self._dirty.clear()
+
+
+warning_counters = WarningCounters()
+_persisted_loaded = False
+
+
+async def load_warning_counters():
+    rows = await mysql_connection.fetch_all(
+        "SELECT group_id, user_id, buckets FROM spam_warning_counters "
+        "WHERE updated_at >= NOW() - INTERVAL %s SECOND",
+        (WARNING_WINDOW_SECONDS,),
+    )
+    warning_counters.load(
+        (group_id, user_id, json.loads(buckets))
+        for group_id, user_id, buckets in rows or []
+        if update_routing.owns_chat(group_id)
+    )
+
+
+async def flush_warning_counters():
+    """把改动写入数据库；写失败时改动留到下一轮。"""
+    upserts, deletes = warning_counters.drain_changes()
+    if not upserts and not deletes:
+        return
+    try:
+        async with mysql_connection.transaction() as connection:
+            for group_id, user_id, buckets in upserts:
+                await mysql_connection.execute(
+                    "INSERT INTO spam_warning_counters (group_id, user_id, buckets) "
+                    "VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE buckets = VALUES(buckets)",
+                    (group_id, user_id, json.dumps(buckets, separators=(",", ":"))),
+                    connection=connection,
+                )
+            for group_id, user_id in deletes:
+                await mysql_connection.execute(
+                    "DELETE FROM spam_warning_counters WHERE group_id = %s AND user_id = %s",
+                    (group_id, user_id),
+                    connection=connection,
+                )
+    except Exception:
+        warning_counters.mark_dirty((group_id, user_id) for group_id, user_id, _ in upserts)
+        warning_counters.mark_dirty(deletes)
+        raise
+
+
+async def _prune_warning_counters_job(context):
+    global _persisted_loaded
+    warning_counters.prune()
+    if not config.SPAM_WARNING_PERSIST:
+        warning_counters.drain_changes()
+        return
+    try:
+        if not _persisted_loaded:
+            await load_warning_counters()
+            _persisted_loaded = True
+        await flush_warning_counters()
+    except Exception as e:
+        logging.error(f"持久化警告计数时出错: {e}")
+
+
+def setup_warning_counter_jobs(application):
+    application.job_queue.run_repeating(
+        _prune_warning_counters_job,
+        interval=WARNING_PRUNE_INTERVAL,
+        first=WARNING_PRUNE_INTERVAL,
+    )
+
+
+__all__ = [
+    "WarningCounters",
+    "flush_warning_counters",
+    "load_warning_counters",
+    "setup_warning_counter_jobs",
+    "warning_counters",
+]
@@ -1,6 +1,8 @@
 import sys
 from pathlib import Path
 
+import pytest
+
 
 MODULES_DIR = Path(__file__).resolve().parents[1] / "modules"
 if str(MODULES_DIR) not in sys.path:
@@ -11,3 +13,12 @@ if str(MODULES_DIR) not in sys.path:
 from features.conversation.history_hooks import install_history_hooks  # noqa: E402
 
 install_history_hooks()
+from core.user_profile_cache import user_profile_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _clear_user_profile_cache():
+    # 进程级缓存，测试之间不共享读到的用户字段
+    user_profile_cache.invalidate()
+    user_profile_cache.reset_stats()
+    yield
@@ -190,7 +190,7 @@ def test_advisor_busy_response_does_not_consume_user_rate_limit(monkeypatch):
         "status": "busy",
         "error": "The reasoning advisor is busy. Continue without it.",
     }
-    assert advisor_tools._RATE_LIMITS == {}
+    assert len(advisor_tools._RATE_LIMITS) == 0
 
 
 def test_advisor_returns_sanitized_error(monkeypatch):
@@ -0,0 +1,104 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import telegram.error
+
+from core import update_routing
+from features.admin import broadcast
+
+
+class FakeDb:
+    def __init__(self, job_row, pending):
+        self.job_row = job_row
+        self.pending = sorted(pending)
+        self.executed = []
+        self.page_queries = []
+
+    async def fetch_one(self, sql, params=None, **kwargs):
+        return self.job_row
+
+    async def fetch_all(self, sql, params=None, **kwargs):
+        assert "status = 'pending'" in sql
+        job_id, cursor, limit = params
+        self.page_queries.append(cursor)
+        return [(chat_id,) for chat_id in self.pending if chat_id > cursor][:limit]
+
+    async def execute(self, sql, params=None, **kwargs):
+        self.executed.append((sql, tuple(params or ())))
+        return 1
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield None
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.edits = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if chat_id == 3:
+            raise telegram.error.Forbidden("bot was blocked by the user")
+        if chat_id == -5:
+            raise telegram.error.BadRequest("can't parse entities")
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=99)
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.edits.append((chat_id, message_id, text))
+
+
+def _patch_db(monkeypatch, db):
+    for name in ("fetch_one", "fetch_all", "execute", "transaction"):
+        monkeypatch.setattr(broadcast.mysql_connection, name, getattr(db, name))
+
+
+def test_resumed_broadcast_sends_pending_pages_and_marks_unreachable(monkeypatch):
+    db = FakeDb(("hi", "sending", 1000, None, 6, 1, 0, 0), [-5, 2, 3, 4, 6])
+    _patch_db(monkeypatch, db)
+    monkeypatch.setattr(broadcast, "BROADCAST_PAGE_SIZE", 2)
+    bot = FakeBot()
+
+    asyncio.run(broadcast.run_broadcast(bot, 7))
+
+    announcements = [chat_id for chat_id, text in bot.sent if "hi" in text]
+    assert announcements == [2, 4, 6]
+    assert db.page_queries == [broadcast._MIN_CHAT_ID, 2, 4]
+    unreachable = [params for sql, params in db.executed if "broadcast_unreachable_chats" in sql]
+    assert unreachable == [(3, "bot was blocked by the user")]
+    counters = [params for sql, params in db.executed if "sent = sent +" in sql]
+    assert [sum(params[:3]) for params in counters] == [2, 2, 1]
+    assert any("status = 'done'" in sql for sql, _ in db.executed)
+    final_report = bot.edits[-1][2] if bot.edits else bot.sent[-1][1]
+    assert "6/6" in final_report and "不可达 Unreachable: 1" in final_report
+
+
+def test_resume_job_only_restarts_owned_idle_jobs(monkeypatch):
+    async def fake_fetch_all(sql, params=None, **kwargs):
+        return [(1, 10), (2, 11), (3, 12)]
+
+    started = []
+    monkeypatch.setattr(broadcast.mysql_connection, "fetch_all", fake_fetch_all)
+    monkeypatch.setattr(broadcast, "_running", {1: object()})
+    monkeypatch.setattr(
+        broadcast, "start_broadcast", lambda application, job_id: started.append(job_id)
+    )
+    monkeypatch.setattr(update_routing, "WORKER_INDEX", 0)
+    monkeypatch.setattr(update_routing, "WORKER_COUNT", 2)
+
+    asyncio.run(broadcast._resume_broadcasts_job(SimpleNamespace(application=None)))
+
+    assert started == [3]
+
+
+def test_progress_reports_throttled_with_rate():
+    now = [0.0]
+    progress = broadcast.BroadcastProgress(1, 10, sent=2, clock=lambda: now[0])
+    assert progress.report_due() is True
+    now[0] = 4.0
+    progress.add([(1, "sent", None), (2, "failed", "x"), (3, "blocked", "y"), (4, "sent", None)])
+    assert progress.report_due() is False
+    assert "6/10" in progress.render()
+    assert "1.0/s" in progress.render()
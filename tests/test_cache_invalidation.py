@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from core import cache_invalidation
+from features.crypto import chart
+
+
+def test_publish_notifies_local_subscribers_and_bumps_remote_version(monkeypatch):
+    received = []
+    executed = []
+
+    async def fake_execute(sql, params):
+        executed.append(params)
+        return 1
+
+    def callback(key):
+        received.append(key)
+
+    monkeypatch.setattr(cache_invalidation.config, "CACHE_INVALIDATION_POLL_SECONDS", 5.0)
+    monkeypatch.setattr(cache_invalidation, "execute", fake_execute)
+    cache_invalidation.subscribe("test_topic", callback)
+    try:
+        asyncio.run(cache_invalidation.publish("test_topic", -100))
+        asyncio.run(cache_invalidation.publish("test_topic", notify_local=False))
+    finally:
+        cache_invalidation.unsubscribe("test_topic", callback)
+
+    assert received == ["-100"]
+    assert executed == [("test_topic", "-100"), ("test_topic", "")]
+
+
+def test_remote_poll_records_baseline_then_notifies_changed_versions(monkeypatch):
+    received = []
+    rows = [("test_topic", "-100", 1, datetime(2026, 7, 1, 0, 0, 0))]
+    queries = []
+
+    async def fake_fetch_all(sql, params=None):
+        queries.append(params)
+        return list(rows)
+
+    monkeypatch.setattr(cache_invalidation, "fetch_all", fake_fetch_all)
+    cache_invalidation.reset_remote_state()
+    cache_invalidation.subscribe("test_topic", received.append)
+    try:
+        assert asyncio.run(cache_invalidation.poll_remote_invalidations()) == 0
+        assert asyncio.run(cache_invalidation.poll_remote_invalidations()) == 0
+        rows[0] = ("test_topic", "-100", 2, datetime(2026, 7, 1, 0, 0, 1))
+        rows.append(("test_topic", "", 1, datetime(2026, 7, 1, 0, 0, 1)))
+        assert asyncio.run(cache_invalidation.poll_remote_invalidations()) == 2
+    finally:
+        cache_invalidation.unsubscribe("test_topic", received.append)
+        cache_invalidation.reset_remote_state()
+
+    assert received == ["-100", None]
+    assert queries[0] is None
+    assert queries[1] == (
+        datetime(2026, 7, 1, 0, 0, 0)
+        - timedelta(seconds=cache_invalidation.CACHE_INVALIDATION_WATERMARK_MARGIN_SECONDS),
+    )
+
+
+def test_remote_poll_picks_up_rows_committed_behind_the_watermark(monkeypatch):
+    received = []
+    rows = [("test_topic", "a", 1, datetime(2026, 7, 1, 0, 0, 10))]
+
+    async def fake_fetch_all(sql, params=None):
+        since = params[0] if params else None
+        return [row for row in rows if since is None or row[3] >= since]
+
+    monkeypatch.setattr(cache_invalidation, "fetch_all", fake_fetch_all)
+    cache_invalidation.reset_remote_state()
+    cache_invalidation.subscribe("test_topic", received.append)
+    try:
+        assert asyncio.run(cache_invalidation.poll_remote_invalidations()) == 0
+        # 时间戳更早、但在水位推进之后才提交的行
+        rows.append(("test_topic", "b", 1, datetime(2026, 7, 1, 0, 0, 8)))
+        assert asyncio.run(cache_invalidation.poll_remote_invalidations()) == 1
+        # 回读窗口里的行版本号没变，不重复触发
+        assert asyncio.run(cache_invalidation.poll_remote_invalidations()) == 0
+    finally:
+        cache_invalidation.unsubscribe("test_topic", received.append)
+        cache_invalidation.reset_remote_state()
+
+    assert received == ["b"]
+
+
+def test_chart_token_cache_is_kept_until_invalidated(monkeypatch):
+    lookups = []
+
+    async def fake_fetch_one(sql, params):
+        lookups.append(params)
+        return ("sol", "CA")
+
+    monkeypatch.setattr(chart.mysql_connection, "fetch_one", fake_fetch_one)
+    chart.token_cache.clear()
+
+    assert asyncio.run(chart.get_group_token(-100)) == ("sol", "CA")
+    assert asyncio.run(chart.get_group_token(-100)) == ("sol", "CA")
+    cache_invalidation.notify(chart.CHART_TOKEN_TOPIC, -100)
+    assert asyncio.run(chart.get_group_token(-100)) == ("sol", "CA")
+
+    assert lookups == [(-100,), (-100,)]
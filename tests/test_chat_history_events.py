@@ -198,7 +198,8 @@ def test_append_permanent_chat_record_extends_the_clear_archive(monkeypatch):
         "clear-event",
         "reply-event",
     ]
-    assert update_params[1:] == (77, 123)
+    assert update_params[1] == "clear-event\nreply-event"
+    assert update_params[2:] == (77, 123)
 
 
 def _run_history_insert(
@@ -0,0 +1,84 @@
+import asyncio
+
+from core import command_cooldown
+from core.command_cooldown import MemoryCooldownBackend
+
+
+def test_memory_backend_blocks_within_cooldown_and_reports_remaining():
+    now = [100.0]
+    backend = MemoryCooldownBackend(clock=lambda: now[0])
+
+    assert backend.try_acquire("cmd:1:start", 1.0) == 0.0
+    now[0] = 100.25
+    assert backend.try_acquire("cmd:1:start", 1.0) == 0.75
+    assert backend.try_acquire("cmd:2:start", 1.0) == 0.0
+    now[0] = 101.0
+    assert backend.try_acquire("cmd:1:start", 1.0) == 0.0
+
+
+def test_expiry_wheel_only_drops_entries_that_are_due():
+    now = [0.0]
+    backend = MemoryCooldownBackend(clock=lambda: now[0])
+    for user_id in range(100):
+        backend.try_acquire(f"chat:{user_id}", 1.0)
+    now[0] = 0.5
+    backend.try_acquire("cmd:0:start", 5.0)
+
+    now[0] = 2.5
+    assert asyncio.run(backend.prune()) == 100
+    assert len(backend) == 1
+    now[0] = 8.0
+    assert asyncio.run(backend.prune()) == 1
+    assert len(backend) == 0
+
+
+def test_decorator_runs_command_once_per_cooldown(monkeypatch):
+    backend = MemoryCooldownBackend()
+    monkeypatch.setattr(command_cooldown, "_backend", backend)
+    calls = []
+
+    @command_cooldown.cooldown
+    async def ping(update, context):
+        calls.append(update.effective_user.id)
+
+    class Update:
+        effective_user = type("User", (), {"id": 7})
+        message = None
+
+    async def scenario():
+        await asyncio.gather(*(ping(Update(), None) for _ in range(5)))
+
+    asyncio.run(scenario())
+
+    assert calls == [7]
+
+
+def test_backend_errors_let_the_command_through(monkeypatch):
+    class BrokenBackend(command_cooldown.CooldownBackend):
+        async def acquire(self, key, seconds):
+            raise RuntimeError("db down")
+
+    monkeypatch.setattr(command_cooldown, "_backend", BrokenBackend())
+
+    class Update:
+        effective_user = type("User", (), {"id": 7})
+
+    assert asyncio.run(command_cooldown.check_chat_cooldown(Update())) is True
+
+
+def test_shared_prune_job_runs_only_on_primary_worker(monkeypatch):
+    pruned = []
+
+    class FakeBackend:
+        async def prune(self):
+            pruned.append(True)
+            return 0
+
+    monkeypatch.setattr(command_cooldown, "_backend", FakeBackend())
+    monkeypatch.setattr(command_cooldown.update_routing, "WORKER_COUNT", 2)
+    monkeypatch.setattr(command_cooldown.update_routing, "WORKER_INDEX", 1)
+    asyncio.run(command_cooldown._prune_cooldowns_job(None))
+    monkeypatch.setattr(command_cooldown.update_routing, "WORKER_INDEX", 0)
+    asyncio.run(command_cooldown._prune_cooldowns_job(None))
+
+    assert pruned == [True]
@@ -142,6 +142,7 @@ def test_register_handlers_preserves_handler_and_job_registration_order():
         ("CommandHandler", 0, "spam", "toggle_spam_control"),
         ("CallbackQueryHandler", 0, "^spam_help$", "spam_help_callback"),
         ("MessageHandler", 5, "_MergedFilter", "process_message"),
+        ("ChatMemberHandler", -90, "1", "refresh_admin_cache_on_member_update"),
         ("CommandHandler", 0, "omikuji", "omikuji_command"),
         ("CallbackQueryHandler", 0, "^omikuji_", "omikuji_callback"),
         ("CommandHandler", 0, "rps_game", "rps_game_command"),
@@ -168,7 +169,13 @@ def test_register_handlers_preserves_handler_and_job_registration_order():
         ("CommandHandler", 0, "webpassword", "webpassword_command"),
     ]
     assert [_job_signature(job) for job in application.job_queue.jobs] == [
+        ("_resume_broadcasts_job", 60, 10),
         ("cleanup_message_records_job", 3600, 10),
+        ("_verification_tick_job", 5, 5),
+        ("_refresh_stake_aggregates_job", 300, 10),
+        ("_compact_pool_job", 3600, 3600),
+        ("_refresh_spam_list_job", 30, 30),
+        ("_prune_warning_counters_job", 300, 300),
         ("cleanup_expired_games", 300, None),
         ("refresh_cache_job", 1800, 10),
         ("<lambda>", 3600, 1800),
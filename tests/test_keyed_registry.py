@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from core.keyed_registry import KeyedLocks, KeyedState
+
+
+def test_keyed_locks_serialise_per_key_and_drop_idle_keys():
+    locks = KeyedLocks()
+    order = []
+
+    async def worker(key, name, delay):
+        async with locks.hold(key):
+            order.append(f"{name}-start")
+            await asyncio.sleep(delay)
+            order.append(f"{name}-end")
+
+    async def run():
+        tasks = [
+            asyncio.create_task(worker(1, "a", 0.01)),
+            asyncio.create_task(worker(1, "b", 0)),
+            asyncio.create_task(worker(2, "c", 0)),
+        ]
+        await asyncio.sleep(0)
+        assert len(locks) == 2
+        assert locks.locked(1)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert order.index("a-end") < order.index("b-start")
+    assert len(locks) == 0
+    assert not locks.locked(1)
+
+
+def test_keyed_locks_release_reference_when_waiter_is_cancelled():
+    locks = KeyedLocks()
+
+    async def run():
+        async with locks.hold("k"):
+            waiter = asyncio.create_task(locks.hold("k").__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        return len(locks)
+
+    assert asyncio.run(run()) == 0
+
+
+def test_keyed_state_evicts_entries_idle_past_timeout():
+    now = [0.0]
+    state = KeyedState(list, idle_seconds=10, clock=lambda: now[0])
+
+    state.get("a").append(1)
+    now[0] = 5.0
+    state.get("b").append(2)
+    now[0] = 12.0
+    assert state.get("b") == [2]
+    assert "a" not in state
+    assert len(state) == 1
+
+    now[0] = 30.0
+    assert state.evict_idle() == 1
+    assert len(state) == 0
@@ -0,0 +1,79 @@
+import os
+import random
+import time
+
+import pytest
+
+from core.keyword_matcher import KeywordMatcher
+
+
+def _first_configured(words, text):
+    return next((word for word in words if word in text), None)
+
+
+def test_first_configured_word_wins_over_earlier_position():
+    matcher = KeywordMatcher(["hers", "he", "she", "his"])
+
+    assert matcher.search("ushers") == "hers"
+    assert matcher.search("ushe") == "he"
+    assert matcher.search("this") == "his"
+    assert matcher.search("nothing") is None
+
+
+def test_matches_naive_scan_for_mixed_cjk_and_latin_words():
+    rng = random.Random(7)
+    alphabet = "ab加微信免费c"
+    words = [
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4)))
+        for _ in range(60)
+    ]
+    matcher = KeywordMatcher(words)
+
+    for _ in range(300):
+        text = "".join(rng.choice(alphabet + "xyz ") for _ in range(rng.randint(0, 30)))
+        assert matcher.search(text) == _first_configured(matcher.words, text)
+
+
+def test_empty_and_duplicate_words_are_ignored():
+    matcher = KeywordMatcher(["", "spam", "spam"])
+
+    assert matcher.words == ("spam",)
+    assert not KeywordMatcher([])
+    assert KeywordMatcher([]).search("spam") is None
+
+
+@pytest.mark.skipif(
+    os.getenv("RUN_BENCHMARKS", "").strip().lower() not in {"1", "true", "yes", "on"},
+    reason="set RUN_BENCHMARKS=1 to run benchmarks",
+)
+def test_benchmark_10k_words_against_naive_scan():
+    rng = random.Random(42)
+    letters = "abcdefghijklmnopqrstuvwxyz加微信免费领取代理"
+    words = [
+        "".join(rng.choice(letters) for _ in range(rng.randint(4, 10)))
+        for _ in range(10_000)
+    ]
+    messages = [
+        "".join(rng.choice(letters + " ") for _ in range(length))
+        for length in (20, 80, 200, 500) * 25
+    ]
+
+    started = time.perf_counter()
+    matcher = KeywordMatcher(words)
+    build_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    compiled_results = [matcher.search(message) for message in messages]
+    compiled_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    naive_results = [_first_configured(matcher.words, message) for message in messages]
+    naive_seconds = time.perf_counter() - started
+
+    print(
+        f"\nbuild={build_seconds * 1000:.1f}ms "
+        f"matcher={compiled_seconds / len(messages) * 1e6:.1f}us/msg "
+        f"naive={naive_seconds / len(messages) * 1e6:.1f}us/msg"
+    )
+    assert compiled_results == naive_results
+    assert compiled_seconds < naive_seconds
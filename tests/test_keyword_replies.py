@@ -0,0 +1,51 @@
+from features.moderation.keyword_handler import KeywordReplies, is_keyword_match
+
+
+def _naive_first_match(keywords, message):
+    return next(
+        (item for item in keywords if is_keyword_match(item[0], message)),
+        None,
+    )
+
+
+KEYWORDS = [
+    ("b c", "reply-bc"),
+    ("a b", "reply-ab"),
+    ("价格", "reply-price"),
+    ("Help", "reply-help"),
+    ("c++", "reply-cpp"),
+    ("入群", "reply-join"),
+]
+
+
+def test_first_configured_keyword_wins_even_when_matches_overlap():
+    replies = KeywordReplies(KEYWORDS)
+
+    assert replies.match("a b c") == ("b c", "reply-bc")
+    assert replies.match("请问入群价格") == ("价格", "reply-price")
+    assert replies.match("HELP me with c++") == ("Help", "reply-help")
+
+
+def test_combined_matcher_agrees_with_per_keyword_matching():
+    replies = KeywordReplies(KEYWORDS)
+    messages = [
+        "",
+        "ab c",
+        "helpful",
+        "need help!",
+        "learn c++ today",
+        "入群",
+        "这个价格多少",
+        "xa bx",
+        "A B",
+    ]
+
+    for message in messages:
+        assert replies.match(message) == _naive_first_match(KEYWORDS, message)
+
+
+def test_empty_keyword_set_never_matches():
+    replies = KeywordReplies([])
+
+    assert not replies
+    assert replies.match("anything") is None
@@ -0,0 +1,92 @@
+import asyncio
+from types import SimpleNamespace
+
+from features.economy import coins, leaderboard
+
+
+class _Message:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def _update(user_id=7):
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        message=_Message(),
+    )
+
+
+def test_leaderboard_pages_use_index_order_and_are_cached(monkeypatch):
+    leaderboard.clear_cache()
+    queries = []
+
+    async def fake_fetch_all(sql, params=None):
+        queries.append((sql, params))
+        return [(3, "c", 30), (2, "b", 20)]
+
+    monkeypatch.setattr(leaderboard.mysql_connection, "fetch_all", fake_fetch_all)
+    clock = iter([0.0, 10.0, 100.0]).__next__
+
+    first = asyncio.run(leaderboard.get_leaderboard_page(2, clock=clock))
+    again = asyncio.run(leaderboard.get_leaderboard_page(2, clock=clock))
+    asyncio.run(leaderboard.get_leaderboard_page(2, clock=clock))
+
+    assert first == again == [(3, "c", 30), (2, "b", 20)]
+    assert len(queries) == 2
+    sql, params = queries[0]
+    assert "ORDER BY coins_total DESC, id DESC" in sql
+    assert params == (leaderboard.RICH_PAGE_SIZE, leaderboard.RICH_PAGE_SIZE)
+
+
+def test_user_rank_counts_users_ahead_and_caches_per_balance(monkeypatch):
+    leaderboard.clear_cache()
+    calls = []
+    balances = {7: 42, 8: 42, 9: 10}
+
+    async def fake_fetch_one(sql, params=None):
+        calls.append((sql, params))
+        if "COUNT(*)" in sql:
+            return (4,) if params == (42,) else (20,)
+        return (balances[params[0]],)
+
+    monkeypatch.setattr(leaderboard.mysql_connection, "fetch_one", fake_fetch_one)
+    clock = iter([0.0, 10.0, 20.0, 100.0]).__next__
+
+    assert asyncio.run(leaderboard.get_user_rank(7, clock=clock)) == (5, 42)
+    assert asyncio.run(leaderboard.get_user_rank(8, clock=clock)) == (5, 42)
+    assert asyncio.run(leaderboard.get_user_rank(9, clock=clock)) == (21, 10)
+    assert asyncio.run(leaderboard.get_user_rank(7, clock=clock)) == (5, 42)
+
+    counts = [params for sql, params in calls if "COUNT(*)" in sql]
+    assert counts == [(42,), (10,), (42,)]
+    leaderboard.clear_cache()
+
+
+def test_rich_command_shows_page_and_own_rank(monkeypatch):
+    async def fake_page(page):
+        assert page == 2
+        return [(9, "alice", 100), (8, "bob", 90)]
+
+    async def fake_rank(user_id):
+        return 37, 5
+
+    monkeypatch.setattr(leaderboard, "get_leaderboard_page", fake_page)
+    monkeypatch.setattr(leaderboard, "get_user_rank", fake_rank)
+    update = _update()
+
+    asyncio.run(coins.rich_command.__wrapped__(update, SimpleNamespace(args=["2"])))
+
+    reply = update.message.replies[0]
+    assert "11. alice - 100" in reply and "12. bob - 90" in reply
+    assert "第 37 名" in reply
+
+
+def test_rich_command_rejects_out_of_range_page():
+    update = _update()
+
+    asyncio.run(coins.rich_command.__wrapped__(update, SimpleNamespace(args=["999"])))
+
+    assert update.message.replies[0].startswith("用法")
@@ -0,0 +1,107 @@
+import asyncio
+
+from features.moderation import policy, spam_control
+
+
+def _fake_db(monkeypatch, state):
+    calls = []
+
+    async def fake_fetch_one(sql, params):
+        calls.append(sql)
+        await asyncio.sleep(0)
+        return state["flags"]
+
+    async def fake_fetch_all(sql, params):
+        calls.append(sql)
+        await asyncio.sleep(0)
+        if "group_spam_keywords" in sql:
+            return state["spam_keywords"]
+        return state["keywords"]
+
+    monkeypatch.setattr(policy.mysql_connection, "fetch_one", fake_fetch_one)
+    monkeypatch.setattr(policy.mysql_connection, "fetch_all", fake_fetch_all)
+    policy.clear_group_policies()
+    return calls
+
+
+def test_concurrent_readers_share_one_load(monkeypatch):
+    calls = _fake_db(
+        monkeypatch,
+        {
+            "flags": (1, 0, 1),
+            "spam_keywords": [("加微信", 0), (r"\d+元", 1)],
+            "keywords": [("价格", "看置顶")],
+        },
+    )
+
+    async def read_many():
+        return await asyncio.gather(*(policy.get_group_policy(-100) for _ in range(5)))
+
+    snapshots = asyncio.run(read_many())
+
+    assert len(calls) == 3
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    snapshot = snapshots[0]
+    assert (snapshot.spam_enabled, snapshot.block_links, snapshot.block_mentions) == (
+        True,
+        False,
+        True,
+    )
+    assert spam_control.check_spam_text(snapshot, "加微信领取") == (True, "加微信")
+    assert spam_control.check_spam_text(snapshot, "只要100元") == (True, "100元")
+    assert snapshot.keyword_replies.match("请问价格") == ("价格", "看置顶")
+
+
+def test_admin_edit_swaps_snapshot_and_discards_older_load(monkeypatch):
+    state = {"flags": (1, 0, 0), "spam_keywords": [], "keywords": []}
+    _fake_db(monkeypatch, state)
+    release = {}
+
+    async def slow_fetch_one(sql, params):
+        await release["event"].wait()
+        return (1, 0, 0)
+
+    async def scenario():
+        first = await policy.get_group_policy(-100)
+
+        release["event"] = asyncio.Event()
+        monkeypatch.setattr(policy.mysql_connection, "fetch_one", slow_fetch_one)
+        policy.invalidate_group_policy(-100)
+        reader = asyncio.ensure_future(policy.get_group_policy(-100))
+        await asyncio.sleep(0)
+
+        policy._policies[-100] = first
+        updated = await policy.update_group_policy(-100, block_links=True)
+        release["event"].set()
+        await reader
+        return first, updated, await policy.get_group_policy(-100)
+
+    first, updated, current = asyncio.run(scenario())
+
+    assert first.block_links is False
+    assert updated.block_links is True
+    assert current is updated
+
+
+def test_flag_update_without_snapshot_waits_for_next_load(monkeypatch):
+    _fake_db(monkeypatch, {"flags": None, "spam_keywords": [], "keywords": []})
+
+    assert asyncio.run(policy.update_group_policy(-100, spam_enabled=True)) is None
+    snapshot = asyncio.run(policy.get_group_policy(-100))
+    assert snapshot.spam_enabled is False
+    assert not snapshot.has_custom_spam_keywords
+
+
+def test_snapshot_stays_cached_until_invalidated(monkeypatch):
+    state = {"flags": (0, 0, 0), "spam_keywords": [], "keywords": []}
+    calls = _fake_db(monkeypatch, state)
+
+    first = asyncio.run(policy.get_group_policy(-100))
+    assert asyncio.run(policy.get_group_policy(-100)) is first
+    assert len(calls) == 3
+
+    state["flags"] = (1, 0, 0)
+    policy.cache_invalidation.notify(policy.POLICY_TOPIC, "-100")
+
+    assert asyncio.run(policy.get_group_policy(-100)).spam_enabled is True
+    assert len(calls) == 6
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+import telegram.error
+
+from core import outbound_scheduler
+from core.outbound_scheduler import BACKGROUND, OutboundScheduler, background_sends
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+def _scheduler(clock, **kwargs):
+    return OutboundScheduler(clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_private_chat_is_paced_after_short_burst():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+
+    async def run():
+        sent_at = []
+        for _ in range(5):
+            await scheduler.acquire(42)
+            sent_at.append(round(clock.now, 2))
+        return sent_at
+
+    burst = outbound_scheduler.PRIVATE_CHAT_BURST
+    sent_at = asyncio.run(run())
+    assert sent_at[:burst] == [0.0] * burst
+    assert sent_at[burst:] == [1.0, 2.0]
+
+
+def test_group_chat_limited_to_twenty_per_minute():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+
+    async def run():
+        for _ in range(21):
+            await scheduler.acquire(-100)
+        return clock.now
+
+    assert asyncio.run(run()) == pytest.approx(3.0)
+
+
+def test_background_yields_to_waiting_interactive_requests():
+    clock = FakeClock()
+    scheduler = _scheduler(clock, global_rate=5.0)
+    order = []
+
+    async def send(name, priority):
+        await scheduler.acquire(priority=priority)
+        order.append(name)
+
+    async def run():
+        for _ in range(5):
+            await scheduler.acquire()  # 耗尽全局桶
+        await asyncio.gather(
+            send("announce", BACKGROUND),
+            send("reply-1", outbound_scheduler.INTERACTIVE),
+            send("reply-2", outbound_scheduler.INTERACTIVE),
+        )
+
+    asyncio.run(run())
+    assert order == ["reply-1", "reply-2", "announce"]
+
+
+def test_background_does_not_yield_to_reply_waiting_on_throttled_chat():
+    clock = FakeClock()
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        await asyncio.sleep(0)
+
+    scheduler = OutboundScheduler(clock=clock, sleep=sleep)
+
+    async def run():
+        scheduler._chat_bucket(-100).block(60.0)  # 这个群刚吃了 429
+        reply = asyncio.create_task(scheduler.acquire(-100))
+        await asyncio.sleep(0)
+        assert sleeps == [60.0]
+
+        await scheduler.acquire(7, BACKGROUND)
+        assert sleeps == [60.0]  # 公告没有让路
+
+        clock.now = 60.0
+        await reply
+
+    asyncio.run(run())
+    assert scheduler._global_waiting == 0
+
+
+def test_process_request_uses_context_priority_and_blocks_chat_on_retry_after():
+    clock = FakeClock()
+    scheduler = _scheduler(clock)
+    seen = []
+
+    async def fake_acquire(chat_id=None, priority=0):
+        seen.append((chat_id, priority))
+        return await OutboundScheduler.acquire(scheduler, chat_id, priority)
+
+    scheduler.acquire = fake_acquire
+
+    async def flood(*args, **kwargs):
+        raise telegram.error.RetryAfter(5)
+
+    async def ok(*args, **kwargs):
+        return True
+
+    async def run():
+        with background_sends():
+            await scheduler.process_request(ok, (), {}, "sendMessage", {"chat_id": 7}, None)
+        await scheduler.process_request(ok, (), {}, "editMessageText", {"chat_id": 7}, None)
+        with pytest.raises(telegram.error.RetryAfter):
+            await scheduler.process_request(flood, (), {}, "sendMessage", {"chat_id": 8}, None)
+        await scheduler.process_request(ok, (), {}, "sendMessage", {"chat_id": 8}, None)
+        return clock.now
+
+    assert asyncio.run(run()) >= 5.0
+    assert seen[:2] == [(7, BACKGROUND), (None, outbound_scheduler.INTERACTIVE)]
@@ -0,0 +1,215 @@
+import asyncio
+import json
+from datetime import datetime
+from types import SimpleNamespace
+
+from core import archive_utils, chat_records
+
+
+def _fake_permanent_table(monkeypatch, rows):
+    """rows: [(id, created_at, summary, snapshot)]，按键范围模拟裁剪用到的 SQL。"""
+    table = list(rows)
+    executed = []
+
+    def sort_key(row):
+        return (row[1], row[0])
+
+    def older_than(row, created_at, record_id, *, inclusive):
+        if inclusive:
+            return sort_key(row) <= (created_at, record_id)
+        return sort_key(row) < (created_at, record_id)
+
+    class FakeConnection:
+        async def exec_driver_sql(self, sql, params):
+            executed.append((sql, params))
+            _user_id, created_at, _same, record_id = params
+            table[:] = [
+                row for row in table
+                if not older_than(row, created_at, record_id, inclusive=True)
+            ]
+            return SimpleNamespace(lastrowid=None)
+
+    async def fake_fetch_one(sql, params, *, connection):
+        _user_id, offset = params
+        ordered = sorted(table, key=sort_key, reverse=True)
+        if offset >= len(ordered):
+            return None
+        row = ordered[offset]
+        return (row[1], row[0])
+
+    async def fake_fetch_all(sql, params, *, connection):
+        _user_id, created_at, _same, record_id, limit = params
+        ordered = sorted(table, key=sort_key)
+        return [
+            row for row in ordered
+            if older_than(row, created_at, record_id, inclusive=False)
+        ][:limit]
+
+    monkeypatch.setattr(chat_records, "fetch_one", fake_fetch_one)
+    monkeypatch.setattr(chat_records, "fetch_all", fake_fetch_all)
+    return table, executed, FakeConnection()
+
+
+def _archive_records(archive):
+    lines = archive.open_for_read().read().decode("utf-8").splitlines()
+    archive.close()
+    return [json.loads(line) for line in lines]
+
+
+def test_prune_streams_raw_snapshots_oldest_first(monkeypatch):
+    table, _executed, connection = _fake_permanent_table(
+        monkeypatch,
+        [
+            (12, datetime(2026, 7, 3, 8, 0, 0), None, "[]"),
+            (
+                9,
+                datetime(2026, 7, 2, 8, 0, 0),
+                b"newer summary",
+                '[{"role": "user", "content": "newer"}]',
+            ),
+            (4, datetime(2026, 7, 1, 8, 0, 0), None, "not json"),
+        ],
+    )
+
+    archive = asyncio.run(
+        chat_records.prune_permanent_records(123, connection=connection, keep=1)
+    )
+
+    records = _archive_records(archive)
+    assert [record["record_id"] for record in records] == [4, 9]
+    assert records[0]["conversation_snapshot"] == "not json"
+    assert records[1]["conversation_snapshot"] == [{"role": "user", "content": "newer"}]
+    assert records[1]["summary"] == "newer summary"
+    assert records[1]["created_at"] == "2026-07-02 08:00:00"
+    assert [row[0] for row in table] == [12]
+
+
+def test_prune_clears_large_backlog_in_bounded_chunks(monkeypatch):
+    same_time = datetime(2026, 7, 1, 8, 0, 0)
+    table, executed, connection = _fake_permanent_table(
+        monkeypatch,
+        [(record_id, same_time, None, "[]") for record_id in range(1, 12)],
+    )
+
+    archive = asyncio.run(
+        chat_records.prune_permanent_records(
+            123,
+            connection=connection,
+            keep=3,
+            chunk_size=3,
+        )
+    )
+
+    assert [record["record_id"] for record in _archive_records(archive)] == list(
+        range(1, 9)
+    )
+    assert [row[0] for row in table] == [9, 10, 11]
+    assert len(executed) == 3
+    assert all("IN (" not in sql for sql, _params in executed)
+
+
+def test_prune_without_connection_commits_each_chunk_separately(monkeypatch):
+    from contextlib import asynccontextmanager
+
+    same_time = datetime(2026, 7, 1, 8, 0, 0)
+    table, executed, connection = _fake_permanent_table(
+        monkeypatch,
+        [(record_id, same_time, None, "[]") for record_id in range(1, 12)],
+    )
+    transactions = []
+
+    @asynccontextmanager
+    async def fake_transaction():
+        transactions.append(len(executed))
+        before = list(table)
+        yield connection
+        if len(transactions) == 3:
+            table[:] = before  # 提交失败，这一块整体回滚
+            raise RuntimeError("lock wait timeout")
+
+    monkeypatch.setattr(chat_records, "transaction", fake_transaction)
+
+    archive = asyncio.run(
+        chat_records.prune_permanent_records(123, keep=3, chunk_size=3)
+    )
+
+    # 第三块提交失败：只有提交了的前两块进归档，回滚的那块留给下次
+    assert [record["record_id"] for record in _archive_records(archive)] == list(
+        range(1, 7)
+    )
+    assert [row[0] for row in table] == [7, 8, 9, 10, 11]
+    assert transactions == [0, 1, 2]
+
+
+def test_prune_without_overflow_returns_empty_archive(monkeypatch):
+    table, executed, connection = _fake_permanent_table(
+        monkeypatch,
+        [(1, datetime(2026, 7, 1, 8, 0, 0), None, "[]")],
+    )
+
+    archive = asyncio.run(
+        chat_records.prune_permanent_records(123, connection=connection, keep=5)
+    )
+
+    assert not archive
+    assert executed == []
+    assert len(table) == 1
+
+
+def test_archive_is_uploaded_as_file_object_and_closed():
+    sent = {}
+
+    class FakeBot:
+        async def send_document(self, *, chat_id, document, filename, caption):
+            sent.update(chat_id=chat_id, payload=document.read(), filename=filename)
+
+    archive = archive_utils.PermanentRecordsArchive()
+    archive.add_row(1, None, None, "[]")
+
+    assert asyncio.run(
+        archive_utils.send_permanent_records_archive(FakeBot(), 123, archive)
+    )
+    assert sent["chat_id"] == 123
+    assert sent["filename"].endswith(".jsonl")
+    assert json.loads(sent["payload"]) == {
+        "record_id": 1,
+        "created_at": None,
+        "summary": None,
+        "conversation_snapshot": [],
+    }
+    assert archive.open_for_read() is None
+
+
+def test_archive_encodes_broken_snapshots_as_strings():
+    archive = archive_utils.PermanentRecordsArchive()
+    archive.add_row(1, None, "ok", '[{"role": "user"}]')
+    archive.add_row(2, None, "cut", '[{"role": "us')
+
+    lines = archive.open_for_read().read().decode("utf-8").splitlines()
+    archive.close()
+
+    assert json.loads(lines[0])["conversation_snapshot"] == [{"role": "user"}]
+    assert json.loads(lines[1])["conversation_snapshot"] == '[{"role": "us'
+
+
+def test_empty_archive_is_falsy():
+    assert not archive_utils.PermanentRecordsArchive()
+
+
+def test_rows_pruned_in_caller_transaction_are_archived_after_commit(monkeypatch):
+    from core import db
+
+    table, _executed, connection = _fake_permanent_table(
+        monkeypatch,
+        [(record_id, datetime(2026, 7, 1, 8, 0, 0), None, "[]") for record_id in range(1, 4)],
+    )
+    callbacks = []
+    monkeypatch.setitem(db._AFTER_COMMIT, id(connection), callbacks)
+
+    archive = asyncio.run(
+        chat_records.prune_permanent_records(123, connection=connection, keep=1)
+    )
+
+    assert not archive and len(callbacks) == 1
+    callbacks[0]()
+    assert [record["record_id"] for record in _archive_records(archive)] == [1, 2]
@@ -0,0 +1,131 @@
+import json
+from datetime import datetime
+
+from core import chat_records
+from features.ai.tools import memory_tools, summary_tools
+from features.ai.tools.context import (
+    clear_tool_request_context,
+    set_tool_request_context,
+)
+
+
+def test_search_text_keeps_only_user_and_assistant_text():
+    messages = [
+        {
+            "role": "user",
+            "content": (
+                '<metadata type="message" origin="user">'
+                "<message>白鲸项目 &amp; 发布</message></metadata>"
+            ),
+        },
+        {"role": "assistant", "content": "好的，记下了。"},
+        {"role": "tool", "tool_call_id": "call_1", "content": "tool output"},
+        {
+            "role": "user",
+            "content": '<metadata origin="history_state" history_state="new_session"></metadata>',
+        },
+    ]
+
+    assert chat_records.build_permanent_search_text(messages) == (
+        "白鲸项目 & 发布\n好的，记下了。"
+    )
+
+
+def test_boolean_query_quotes_each_keyword_once():
+    assert chat_records.permanent_search_boolean_query('白鲸 "deploy" 白鲸') == (
+        '"白鲸" "deploy"'
+    )
+
+
+def test_keyword_search_loads_only_fulltext_matched_snapshots(monkeypatch):
+    snapshots = {
+        1: [{"role": "user", "content": "白鲸项目今天发布"}],
+        2: [{"role": "user", "content": "天气不错"}],
+        3: [{"role": "assistant", "content": "白鲸项目还要确认回滚"}],
+    }
+    queries = []
+
+    def fake_fetch_one(sql, params):
+        if "COUNT(*)" in sql:
+            return (len(snapshots),)
+        return (100,)
+
+    def fake_fetch_all(sql, params):
+        queries.append((sql, params))
+        if "MATCH(search_text)" in sql:
+            assert params == (123, '"白鲸项目"')
+            return [(1,), (3,)]
+        if "conversation_snapshot" in sql:
+            return [
+                (record_id, json.dumps(snapshots[record_id]), datetime(2026, 7, 1))
+                for record_id in params[1:]
+            ]
+        return [(3,), (2,), (1,)]
+
+    monkeypatch.setattr(memory_tools.config, "PERMANENT_RECORDS_SEARCH_MODE", "fulltext")
+    monkeypatch.setattr(memory_tools.mysql_connection, "fetch_one", fake_fetch_one)
+    monkeypatch.setattr(memory_tools.mysql_connection, "fetch_all", fake_fetch_all)
+    monkeypatch.setattr(memory_tools.mysql_connection, "run_sync", lambda value: value)
+    set_tool_request_context({"user_id": 123})
+    try:
+        result = memory_tools.search_permanent_records_tool("白鲸项目", mode="keyword")
+    finally:
+        clear_tool_request_context()
+
+    snapshot_queries = [params for sql, params in queries if "conversation_snapshot" in sql]
+    assert snapshot_queries == [(123, 3, 1)]
+    assert [item["record_position"] for item in result["results"]] == [1, 3]
+    assert result["results"][0]["match"]["content"] == "白鲸项目还要确认回滚"
+
+
+def test_keyword_search_scans_snapshots_without_fulltext(monkeypatch):
+    def fake_fetch_one(sql, params):
+        return (1,)
+
+    def fake_fetch_all(sql, params):
+        assert "MATCH" not in sql
+        return [
+            (
+                1,
+                json.dumps([{"role": "user", "content": "Deploy the WHALE build"}]),
+                None,
+            )
+        ]
+
+    monkeypatch.setattr(memory_tools.config, "PERMANENT_RECORDS_SEARCH_MODE", "scan")
+    monkeypatch.setattr(memory_tools.mysql_connection, "fetch_one", fake_fetch_one)
+    monkeypatch.setattr(memory_tools.mysql_connection, "fetch_all", fake_fetch_all)
+    monkeypatch.setattr(memory_tools.mysql_connection, "run_sync", lambda value: value)
+    set_tool_request_context({"user_id": 123})
+    try:
+        result = memory_tools.search_permanent_records_tool("whale [", mode="keyword")
+    finally:
+        clear_tool_request_context()
+
+    assert "warning" not in result
+    assert len(result["results"]) == 1
+
+
+def test_prior_context_uses_fulltext_candidates_when_enabled(monkeypatch):
+    captured = []
+
+    def fake_fetch_all(sql, params):
+        captured.append((sql, params))
+        if sql.startswith("SELECT id, created_at"):
+            return [(7, datetime(2026, 5, 1, 12, 0, 0))]
+        return [(7, "白鲸项目确认了发布窗口。")]
+
+    summary_tools.clear_prior_summary_indexes()
+    monkeypatch.setattr(summary_tools.config, "PERMANENT_RECORDS_SEARCH_MODE", "fulltext")
+    monkeypatch.setattr(summary_tools.mysql_connection, "fetch_all", fake_fetch_all)
+    monkeypatch.setattr(summary_tools.mysql_connection, "run_sync", lambda value: value)
+    set_tool_request_context({"user_id": 123, "summary_record_id": 456})
+    try:
+        result = summary_tools.search_prior_context_tool("白鲸项目")
+    finally:
+        clear_tool_request_context()
+
+    assert len(captured) == 2
+    assert "MATCH(search_text)" in captured[0][0]
+    assert captured[0][1][:3] == (123, 456, '"白鲸项目"')
+    assert result["results"][0]["created_at"] == "2026-05-01 12:00:00"
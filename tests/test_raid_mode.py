@@ -0,0 +1,133 @@
+import asyncio
+from types import SimpleNamespace
+
+from features.moderation import member_verify, raid_mode, verification_timers
+from features.moderation.raid_mode import JoinBurstDetector
+from features.moderation.verification_timers import VerificationQueue
+
+
+def test_burst_detector_enters_and_leaves_raid_mode():
+    now = [0.0]
+    detector = JoinBurstDetector(
+        window_seconds=30, threshold=5, mode_seconds=60, clock=lambda: now[0]
+    )
+
+    assert detector.record_joins(-100, 3) is False
+    now[0] = 40.0
+    assert detector.record_joins(-100, 2) is False
+    assert detector.record_joins(-100, 3) is True
+    now[0] = 99.0
+    assert detector.in_raid_mode(-100) is True
+    now[0] = 101.0
+    assert detector.in_raid_mode(-100) is False
+    detector.prune()
+    assert detector._joins == {}
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+        self.deleted = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(message_id=900 + len(self.sent))
+
+    async def delete_message(self, chat_id, message_id):
+        self.deleted.append(message_id)
+
+
+def _member(user_id):
+    return SimpleNamespace(id=user_id, full_name=f"user<{user_id}>")
+
+
+def test_consolidated_captcha_shares_messages_and_deletes_them_when_done(monkeypatch):
+    queue = VerificationQueue(clock=lambda: 1000.0)
+    monkeypatch.setattr(raid_mode, "verification_queue", queue)
+    monkeypatch.setattr(verification_timers, "verification_queue", queue)
+    monkeypatch.setattr(raid_mode, "RAID_MENTIONS_PER_MESSAGE", 2)
+    bot = FakeBot()
+
+    sent = asyncio.run(raid_mode.send_consolidated_captcha(bot, -100, [_member(i) for i in (1, 2, 3)]))
+
+    assert sent == 2
+    assert "user&lt;1&gt;" in bot.sent[0]
+    assert queue.get(-100, 2) == 901 and queue.get(-100, 3) == 902
+    assert queue.is_shared(-100, 901)
+    upserts, _ = queue.drain_writes()
+    assert len(upserts) == 3
+
+    queue.remove(-100, 1)
+    asyncio.run(verification_timers.process_expired_verifications(bot))
+    assert bot.deleted == []
+    queue.remove(-100, 2)
+    asyncio.run(verification_timers.process_expired_verifications(bot))
+    assert bot.deleted == [901]
+
+
+def test_shared_button_verifies_only_pending_members(monkeypatch):
+    queue = VerificationQueue(clock=lambda: 1000.0)
+    queue.add(-100, 7, 901, shared=True)
+    monkeypatch.setattr(member_verify, "verification_queue", queue)
+    answers = []
+    edits = []
+
+    class Query:
+        data = raid_mode.RAID_VERIFY_CALLBACK
+
+        def __init__(self, user_id):
+            self.from_user = SimpleNamespace(id=user_id)
+
+        async def answer(self, text, show_alert=False):
+            answers.append(text)
+
+        async def edit_message_text(self, text):
+            edits.append(text)
+
+        async def delete_message(self):
+            raise AssertionError("shared message must not be deleted by one click")
+
+    class Bot:
+        async def restrict_chat_member(self, *args, **kwargs):
+            return True
+
+    context = SimpleNamespace(bot=Bot())
+    for user_id in (8, 7):
+        update = SimpleNamespace(callback_query=Query(user_id), effective_chat=SimpleNamespace(id=-100))
+        asyncio.run(member_verify.verify_callback(update, context))
+
+    assert answers == ["您不在待验证名单中，或验证已失效。", "验证成功！"]
+    assert edits == []
+    assert queue.get(-100, 7) is None
+
+
+def test_raid_members_are_queued_before_the_captcha_is_sent(monkeypatch):
+    now = [1000.0]
+    queue = VerificationQueue(clock=lambda: now[0])
+    monkeypatch.setattr(raid_mode, "verification_queue", queue)
+    monkeypatch.setattr(raid_mode, "RAID_BATCH_SECONDS", 0)
+    bot = FakeBot()
+
+    async def scenario(cancel):
+        raid_mode.enqueue_raid_member(bot, -100, _member(1))
+        raid_mode.enqueue_raid_member(bot, -100, _member(2))
+        # 刚进批次，消息还没发出，成员已经挂在队列里并待写库
+        assert queue.get(-100, 1) == raid_mode.RAID_PENDING_MESSAGE_ID
+        task = raid_mode._flush_tasks[-100]
+        if cancel:
+            await asyncio.sleep(0)
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(scenario(cancel=True))
+    assert bot.sent == []
+    assert len(queue) == 2  # 停机打断攒批，成员仍会超时移出
+    queue.remove(-100, 2)
+
+    asyncio.run(scenario(cancel=False))
+    assert queue.get(-100, 1) == queue.get(-100, 2) == 901
+    assert queue.is_shared(-100, 901)
+    upserts, _ = queue.drain_writes()
+    assert sorted(row[2] for row in upserts) == [901, 901]
+    assert {row[3] for row in upserts} == {verification_timers.datetime.fromtimestamp(1300.0)}
+    assert queue.drain_finished_shared() == [(-100, raid_mode.RAID_PENDING_MESSAGE_ID)]
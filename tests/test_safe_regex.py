@@ -0,0 +1,51 @@
+import re
+
+import pytest
+
+from core import safe_regex
+from features.moderation import spam_control
+from features.moderation.policy import GroupModerationPolicy
+
+
+def test_nested_quantifiers_and_backreferences_are_rejected():
+    with pytest.raises(safe_regex.UnsafePatternError):
+        safe_regex.compile_safe(r"(a+)+b")
+    with pytest.raises(safe_regex.UnsafePatternError):
+        safe_regex.compile_safe(r"(\w+)\s\1")
+    with pytest.raises(safe_regex.UnsafePatternError):
+        safe_regex.compile_safe(r"a{1,5000}")
+
+
+def test_compiled_patterns_are_cached_and_match_like_re():
+    first = safe_regex.compile_safe(r"buy\s+now", re.IGNORECASE)
+
+    assert safe_regex.compile_safe(r"buy\s+now", re.IGNORECASE) is first
+    assert first.search("please BUY  NOW").group(0) == "BUY  NOW"
+    with pytest.raises(re.error):
+        safe_regex.compile_safe(r"broken[")
+
+
+@pytest.mark.skipif(safe_regex.regex is None, reason="regex module not installed")
+def test_runaway_match_times_out_and_is_reported():
+    pattern = safe_regex.compile_safe(r"(a|aa)+$")
+
+    with pytest.raises(safe_regex.RegexTimeoutError):
+        pattern.search("a" * 40 + "b", timeout=0.01)
+
+    report = {item["pattern"]: item for item in safe_regex.slow_pattern_report()}
+    assert report[r"(a|aa)+$"]["timeout_count"] >= 1
+
+
+def test_spam_check_skips_timed_out_custom_pattern():
+    class TimingOutPattern:
+        pattern = "slow"
+
+        def search(self, text):
+            raise safe_regex.RegexTimeoutError("timed out")
+
+    policy = GroupModerationPolicy(
+        group_id=-100,
+        spam_patterns=(TimingOutPattern(), safe_regex.compile_safe("spam", re.IGNORECASE)),
+    )
+
+    assert spam_control.check_spam_text(policy, "SPAM offer") == (True, "SPAM")
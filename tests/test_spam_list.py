@@ -0,0 +1,58 @@
+import asyncio
+import os
+
+from features.moderation import spam_control, spam_list
+from features.moderation.policy import GroupModerationPolicy
+
+
+def test_parse_keeps_word_order_and_compiles_patterns():
+    parsed = spam_list.parse_spam_list(
+        ["# comment\n", "发财\n", "\n", "Casino\n", "//\\d+\\s*元\\s*充值\n", "//broken[\n"]
+    )
+
+    assert parsed.words.words == ("发财", "casino")
+    assert [pattern.pattern for pattern in parsed.patterns] == ["\\d+\\s*元\\s*充值"]
+
+
+def test_reload_swaps_list_only_when_file_changes(monkeypatch, tmp_path):
+    path = tmp_path / "spam_words.txt"
+    path.write_text("博彩\n", encoding="utf-8")
+    monkeypatch.setattr(spam_list, "SPAM_FILE_PATH", path)
+    monkeypatch.setattr(spam_list, "_current", spam_list.GlobalSpamList())
+
+    assert asyncio.run(spam_list.reload_spam_list()) is True
+    first = spam_list.get_global_spam_list()
+    assert asyncio.run(spam_list.reload_spam_list()) is False
+    assert spam_list.get_global_spam_list() is first
+
+    path.write_text("博彩\n代理\n", encoding="utf-8")
+    os.utime(path, (first.mtime + 5, first.mtime + 5))
+    assert asyncio.run(spam_list.reload_spam_list()) is True
+    assert spam_list.get_global_spam_list().words.words == ("博彩", "代理")
+
+
+def test_missing_file_is_created_with_defaults(monkeypatch, tmp_path):
+    path = tmp_path / "resources" / "spam_words.txt"
+    monkeypatch.setattr(spam_list, "SPAM_FILE_PATH", path)
+
+    loaded = spam_list.read_spam_list()
+
+    assert path.exists()
+    assert "博彩" in loaded.words.words
+
+
+def test_spam_check_reads_published_list_without_touching_files(monkeypatch):
+    monkeypatch.setattr(
+        spam_list, "_current", spam_list.parse_spam_list(["代理\n", "//免费\\s*领取\n"])
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("message path must not touch the filesystem")
+
+    monkeypatch.setattr(spam_list.os.path, "getmtime", fail)
+    monkeypatch.setattr(spam_list, "read_spam_list", fail)
+    policy = GroupModerationPolicy(group_id=-100)
+
+    assert spam_control.check_spam_text(policy, "招代理") == (True, "代理")
+    assert spam_control.check_spam_text(policy, "免费 领取") == (True, "免费 领取")
+    assert spam_control.check_spam_text(policy, "hello") == (False, None)
@@ -0,0 +1,60 @@
+import asyncio
+
+from features.economy import stake_coin
+
+
+def _patch(monkeypatch, aggregate_row):
+    queries = []
+
+    async def fake_fetch_one(sql, params=None):
+        queries.append(sql)
+        if "FROM stake_aggregates" in sql:
+            return aggregate_row
+        if "FROM user_stakes" in sql:
+            return (300,)
+        return (700,)
+
+    async def fake_execute(sql, params=None, *, connection=None):
+        queries.append(sql)
+        return 1
+
+    monkeypatch.setattr(stake_coin.mysql_connection, "fetch_one", fake_fetch_one)
+    monkeypatch.setattr(stake_coin.mysql_connection, "execute", fake_execute)
+    return queries
+
+
+def test_reward_rate_reads_precomputed_totals(monkeypatch):
+    queries = _patch(monkeypatch, (700, 300, 60))
+
+    rate = asyncio.run(stake_coin.calculate_reward_rate())
+
+    assert len(queries) == 1
+    expected = stake_coin.MAX_DAILY_RATE - 0.3 * (
+        stake_coin.MAX_DAILY_RATE - stake_coin.MIN_DAILY_RATE
+    )
+    assert abs(rate - expected) < 1e-9
+
+
+def test_stale_or_missing_totals_are_recomputed(monkeypatch):
+    for row in (None, (1, 1, stake_coin.STAKE_AGGREGATES_MAX_AGE_SECONDS + 1)):
+        queries = _patch(monkeypatch, row)
+
+        assert asyncio.run(stake_coin.get_stake_aggregates()) == (700, 300)
+        assert any("SUM(stake_amount)" in sql for sql in queries)
+        assert queries[-1].startswith("INSERT INTO stake_aggregates")
+
+
+def test_refresh_job_runs_only_on_owning_worker(monkeypatch):
+    refreshed = []
+
+    async def fake_refresh():
+        refreshed.append(True)
+
+    monkeypatch.setattr(stake_coin, "refresh_stake_aggregates", fake_refresh)
+    monkeypatch.setattr(stake_coin.update_routing, "WORKER_COUNT", 2)
+    monkeypatch.setattr(stake_coin.update_routing, "WORKER_INDEX", 1)
+    asyncio.run(stake_coin._refresh_stake_aggregates_job(None))
+    monkeypatch.setattr(stake_coin.update_routing, "WORKER_INDEX", 0)
+    asyncio.run(stake_coin._refresh_stake_aggregates_job(None))
+
+    assert refreshed == [True]
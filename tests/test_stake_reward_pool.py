@@ -0,0 +1,103 @@
+import asyncio
+from contextlib import asynccontextmanager
+from decimal import Decimal
+
+from core import stake_reward_pool
+
+
+class _FakePool:
+    """按 stake_reward_pool 用到的几条语句模拟分片表。"""
+
+    def __init__(self, balances):
+        self.balances = {shard_id: Decimal(value) for shard_id, value in balances.items()}
+        self.statements = []
+
+    async def fetch_all(self, sql, params=None, *, connection=None):
+        self.statements.append(sql)
+        return sorted(self.balances.items())
+
+    async def execute(self, sql, params=None, *, connection=None):
+        self.statements.append(sql)
+        if sql.startswith("INSERT INTO stake_reward_pool"):
+            shard_id, amount = params[0], Decimal(params[1])
+            if shard_id in self.balances and "balance - %s" in sql:
+                self.balances[shard_id] -= Decimal(params[2])
+            else:
+                self.balances[shard_id] = self.balances.get(shard_id, Decimal("0")) + amount
+        elif sql.startswith("UPDATE stake_reward_pool SET balance = IF"):
+            row_id, total = params
+            self.balances = {
+                shard_id: (Decimal(total) if shard_id == row_id else Decimal("0"))
+                for shard_id in self.balances
+            }
+        return 1
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield object()
+
+
+def _install(monkeypatch, balances):
+    pool = _FakePool(balances)
+    monkeypatch.setattr(stake_reward_pool.mysql_connection, "fetch_all", pool.fetch_all)
+    monkeypatch.setattr(stake_reward_pool.mysql_connection, "execute", pool.execute)
+    monkeypatch.setattr(stake_reward_pool.mysql_connection, "transaction", pool.transaction)
+    return pool
+
+
+def test_add_to_pool_touches_only_the_users_shard(monkeypatch):
+    pool = _install(monkeypatch, {1: "0", 2: "0"})
+
+    asyncio.run(stake_reward_pool.add_to_pool(Decimal("1.00"), shard_key=17))
+    asyncio.run(stake_reward_pool.add_to_pool(Decimal("0.40"), shard_key=17))
+
+    shard_id = stake_reward_pool.shard_for(17)
+    assert shard_id == 17 % stake_reward_pool.POOL_SHARDS + 1
+    assert pool.balances[shard_id] == Decimal("1.40")
+    assert len(pool.statements) == 2
+
+
+def test_balance_sums_shards_and_withdrawal_debits_largest_first(monkeypatch):
+    pool = _install(monkeypatch, {1: "1.00", 2: "5.00", 3: "3.00"})
+
+    assert asyncio.run(stake_reward_pool.get_pool_balance()) == Decimal("9.00")
+    pool.statements.clear()
+
+    asyncio.run(stake_reward_pool.subtract_from_pool(7))
+
+    assert pool.balances == {1: Decimal("1.00"), 2: Decimal("0.00"), 3: Decimal("1.00")}
+    assert pool.statements[0].endswith("FOR UPDATE")
+
+
+def test_withdrawal_beyond_balance_lands_on_primary_row():
+    debits = stake_reward_pool._plan_debit(
+        [(1, Decimal("0")), (2, Decimal("2"))],
+        Decimal("5"),
+    )
+
+    assert debits == {2: Decimal("2"), 1: Decimal("3")}
+
+
+def test_compaction_folds_shards_into_primary_row(monkeypatch):
+    pool = _install(monkeypatch, {1: "1.00", 2: "2.50", 3: "0.50"})
+
+    total = asyncio.run(stake_reward_pool.compact_pool())
+
+    assert total == Decimal("4.00")
+    assert pool.balances == {1: Decimal("4.00"), 2: Decimal("0"), 3: Decimal("0")}
+
+
+def test_compaction_job_runs_only_on_primary_worker(monkeypatch):
+    compacted = []
+
+    async def fake_compact():
+        compacted.append(True)
+        return Decimal("0")
+
+    monkeypatch.setattr(stake_reward_pool, "compact_pool", fake_compact)
+    monkeypatch.setattr(stake_reward_pool.update_routing, "WORKER_COUNT", 3)
+    for index in range(3):
+        monkeypatch.setattr(stake_reward_pool.update_routing, "WORKER_INDEX", index)
+        asyncio.run(stake_reward_pool._compact_pool_job(None))
+
+    assert compacted == [True]
@@ -66,18 +66,18 @@ def test_rank_prior_summaries_uses_small_recency_boost_for_equal_matches():
 def test_search_prior_context_is_bounded_to_active_user_and_earlier_summaries(
     monkeypatch,
 ):
-    captured = {}
+    queries = []
 
     def fake_fetch_all(sql, params):
-        captured.update(sql=sql, params=params)
-        return [
-            (
-                datetime(2026, 7, 29, 12, 0, 0),
-                "白鲸项目仍需确认发布窗口。",
-            ),
-            (datetime(2026, 7, 28, 12, 0, 0), "无关摘要。"),
-        ]
-
+        queries.append((sql, params))
+        if sql.startswith("SELECT id, created_at"):
+            return [
+                (11, datetime(2026, 7, 29, 12, 0, 0)),
+                (10, datetime(2026, 7, 28, 12, 0, 0)),
+            ]
+        return [(11, "白鲸项目仍需确认发布窗口。"), (10, "无关摘要。")]
+
+    summary_tools.clear_prior_summary_indexes()
     monkeypatch.setattr(summary_tools.mysql_connection, "fetch_all", fake_fetch_all)
     monkeypatch.setattr(
         summary_tools.mysql_connection,
@@ -90,20 +90,51 @@ def test_search_prior_context_is_bounded_to_active_user_and_earlier_summaries(
     finally:
         clear_tool_request_context()
 
-    assert captured["params"] == (
+    window_sql, window_params = queries[0]
+    assert window_params == (
         123,
         456,
         summary_tools.SUMMARY_BM25_MAX_SUMMARIES,
     )
-    assert "SELECT created_at, summary" in captured["sql"]
-    assert "conversation_snapshot" not in captured["sql"]
-    assert "user_id = %s" in captured["sql"]
-    assert "id < %s" in captured["sql"]
+    assert "conversation_snapshot" not in window_sql
+    assert "user_id = %s" in window_sql
+    assert "id < %s" in window_sql
+    assert queries[1][1] == (123, 11, 10)
+    assert "user_id = %s" in queries[1][0]
     assert result["query"] == "白鲸项目"
     assert len(result["results"]) == 1
     assert result["results"][0]["created_at"] == "2026-07-29 12:00:00"
 
 
+def test_prior_summary_index_is_reused_and_updated_incrementally(monkeypatch):
+    loaded = []
+
+    def fake_fetch_all(sql, params):
+        if sql.startswith("SELECT id, created_at"):
+            return [(11, "newer"), (10, "older")]
+        loaded.append(params)
+        return [(11, "白鲸项目仍需确认发布窗口。"), (10, "无关摘要。")]
+
+    summary_tools.clear_prior_summary_indexes()
+    monkeypatch.setattr(summary_tools.mysql_connection, "fetch_all", fake_fetch_all)
+    monkeypatch.setattr(
+        summary_tools.mysql_connection,
+        "run_sync",
+        lambda value: value,
+    )
+    set_tool_request_context({"user_id": 123, "summary_record_id": 456})
+    try:
+        first = summary_tools.search_prior_context_tool("白鲸项目")
+        summary_tools.update_prior_summary_index(123, 10, "苍蓝计划的部署方案。")
+        second = summary_tools.search_prior_context_tool("苍蓝计划")
+    finally:
+        clear_tool_request_context()
+
+    assert loaded == [(123, 11, 10)]
+    assert first["results"][0]["created_at"] == "newer"
+    assert [item["created_at"] for item in second["results"]] == ["older"]
+
+
 def test_search_result_excerpt_is_bounded():
     content = "前" * 900 + "白鲸项目" + "后" * 900
     documents = [
@@ -10,15 +10,13 @@ from features.conversation import clear as conversation_clear
 
 @pytest.fixture(autouse=True)
 def _clear_pending_history_events():
-    for task in telegram_history._PENDING_FLUSH_TASKS.values():
-        task.cancel()
-    telegram_history._PENDING_FLUSH_TASKS.clear()
+    telegram_history._WRITER_TASK = None
+    telegram_history._PENDING_DUE.clear()
     telegram_history._PENDING_EVENTS.clear()
     telegram_history._PENDING_FLUSH_LOCKS.clear()
     yield
-    for task in telegram_history._PENDING_FLUSH_TASKS.values():
-        task.cancel()
-    telegram_history._PENDING_FLUSH_TASKS.clear()
+    telegram_history._WRITER_TASK = None
+    telegram_history._PENDING_DUE.clear()
     telegram_history._PENDING_EVENTS.clear()
     telegram_history._PENDING_FLUSH_LOCKS.clear()
 
@@ -759,3 +757,178 @@ def test_send_and_record_does_not_record_failed_telegram_send(monkeypatch):
         asyncio.run(bot._send_and_record(failed_operation()))
 
     assert recorded == []
+
+
+def test_background_writer_drains_many_users_in_bounded_batches(monkeypatch):
+    written = []
+    active = 0
+    peak = 0
+
+    async def fake_insert(conversation_id, records):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0)
+        active -= 1
+        written.append(conversation_id)
+        return False, None, []
+
+    monkeypatch.setattr(
+        telegram_history.mysql_connection,
+        "async_insert_chat_records",
+        fake_insert,
+    )
+    monkeypatch.setattr(telegram_history.config, "TELEGRAM_HISTORY_RATE_WINDOW_SECONDS", 0)
+    monkeypatch.setattr(telegram_history, "HISTORY_WRITER_CONCURRENCY", 3)
+
+    async def run_scenario():
+        for user_id in range(10):
+            await telegram_history._persist_event(user_id, "callback", object())
+        await telegram_history._WRITER_TASK
+
+    asyncio.run(run_scenario())
+
+    assert sorted(written) == list(range(10))
+    assert peak == 3
+    assert telegram_history._PENDING_DUE == {}
+
+
+def test_take_pending_events_hands_events_to_the_turn(monkeypatch):
+    calls = []
+
+    async def fake_insert(conversation_id, records):
+        calls.append(records)
+        return False, None, []
+
+    monkeypatch.setattr(
+        telegram_history.mysql_connection,
+        "async_insert_chat_records",
+        fake_insert,
+    )
+
+    async def run_scenario():
+        await telegram_history._persist_event(123, "first", object())
+        await telegram_history._persist_event(123, "second", object())
+        taken = await telegram_history.take_pending_events(123)
+        await telegram_history.flush_pending_events(123)
+        return taken
+
+    assert asyncio.run(run_scenario()) == ["first", "second"]
+    assert calls == []
+    assert 123 not in telegram_history._PENDING_DUE
+
+
+def test_shutdown_flushes_users_in_parallel_within_deadline(monkeypatch):
+    written = []
+
+    async def fake_insert(conversation_id, records):
+        if conversation_id == 3:
+            await asyncio.sleep(60)
+        written.append(conversation_id)
+        return False, None, []
+
+    monkeypatch.setattr(
+        telegram_history.mysql_connection,
+        "async_insert_chat_records",
+        fake_insert,
+    )
+    monkeypatch.setattr(telegram_history.config, "TELEGRAM_HISTORY_RATE_WINDOW_SECONDS", 60)
+
+    async def run_scenario():
+        for user_id in (1, 2, 3):
+            await telegram_history._persist_event(user_id, "event", object())
+        await telegram_history.flush_all_pending_events(timeout=0.05)
+
+    asyncio.run(run_scenario())
+
+    assert sorted(written) == [1, 2]
+
+
+def _patch_ai_turn(monkeypatch, *, spend):
+    from contextlib import asynccontextmanager
+
+    from core import command_cooldown, user_records
+    from features.conversation import handlers
+
+    inserted = []
+
+    async def allow(_update):
+        return True
+
+    @asynccontextmanager
+    async def fake_transaction():
+        yield object()
+
+    async def fake_load(user_id, **kwargs):
+        return user_records.UserTurnContext(
+            user_id=user_id,
+            permission="user",
+            coins_free=10,
+            coins_paid=0,
+            info="",
+            impression="",
+            has_diary=False,
+        )
+
+    async def fake_add_to_pool(*args, **kwargs):
+        return 0
+
+    async def fake_insert(conversation_id, records, **kwargs):
+        inserted.append((records, kwargs))
+        return False, None, []
+
+    monkeypatch.setattr(command_cooldown, "check_chat_cooldown", allow)
+    monkeypatch.setattr(handlers.mysql_connection, "transaction", fake_transaction)
+    monkeypatch.setattr(handlers, "load_user_turn_context", fake_load)
+    monkeypatch.setattr(handlers.process_user, "spend_coins_from_context", spend)
+    monkeypatch.setattr(handlers.stake_reward_pool, "add_to_pool", fake_add_to_pool)
+    monkeypatch.setattr(handlers.mysql_connection, "async_insert_chat_records", fake_insert)
+    monkeypatch.setattr(telegram_history.mysql_connection, "async_insert_chat_records", fake_insert)
+
+    message = _message(text="你好")
+    update = SimpleNamespace(
+        message=message,
+        edited_message=None,
+        effective_message=message,
+        effective_chat=SimpleNamespace(id=123, type="private", title=None),
+        effective_user=SimpleNamespace(id=123, username="kc"),
+        update_id=1,
+    )
+
+    async def run_turn():
+        await telegram_history._persist_event(123, "earlier command", object())
+        with pytest.raises(RuntimeError):
+            await handlers._reply_unlocked(update, SimpleNamespace(bot=object()))
+
+    return handlers, inserted, run_turn
+
+
+def test_failed_charge_leaves_pending_events_buffered(monkeypatch):
+    async def failing_spend(*args, **kwargs):
+        raise RuntimeError("deadlock")
+
+    _handlers, inserted, run_turn = _patch_ai_turn(monkeypatch, spend=failing_spend)
+
+    asyncio.run(run_turn())
+
+    assert inserted == []
+    assert [event.content for event in telegram_history._PENDING_EVENTS[123].values()] == [
+        "earlier command"
+    ]
+
+
+def test_turn_failing_after_charge_still_writes_taken_events(monkeypatch):
+    async def spend(user_context, amount, **kwargs):
+        return user_context.with_coins(user_context.coins_free - amount, 0)
+
+    handlers, inserted, run_turn = _patch_ai_turn(monkeypatch, spend=spend)
+
+    def broken_forward(_message):
+        raise RuntimeError("bad message")
+
+    monkeypatch.setattr(handlers.messages, "_build_forward_format_kwargs", broken_forward)
+
+    asyncio.run(run_turn())
+
+    assert inserted == [([("user", "earlier command")], {"allow_zero_balance": True})]
+    assert 123 not in telegram_history._PENDING_EVENTS
@@ -110,3 +110,81 @@ def test_retry_telegram_send_does_not_retry_bad_request(monkeypatch):
 
     assert attempts == 1
     assert sleeps == []
+
+
+class _FakeAdminBot:
+    def __init__(self, admins):
+        self.admins = admins
+        self.calls = []
+
+    async def get_chat_administrators(self, chat_id):
+        self.calls.append(chat_id)
+        await asyncio.sleep(0)
+        return [
+            type("Member", (), {"status": status, "user": type("User", (), {"id": user_id})})
+            for user_id, status in self.admins.get(chat_id, [])
+        ]
+
+
+def _member_update(chat_id, old_status, new_status):
+    def member(status):
+        return type("Member", (), {"status": status})
+
+    return type(
+        "ChatMemberUpdated",
+        (),
+        {
+            "chat": type("Chat", (), {"id": chat_id}),
+            "old_chat_member": member(old_status),
+            "new_chat_member": member(new_status),
+        },
+    )
+
+
+def test_chat_admin_cache_prefetches_admin_list_once_per_ttl():
+    now = [0.0]
+    cache = telegram_utils.ChatAdminCache(ttl_seconds=60, clock=lambda: now[0])
+    bot = _FakeAdminBot({-100: [(1, "creator"), (2, "administrator")]})
+
+    async def scenario():
+        return await asyncio.gather(
+            *(cache.is_admin(bot, -100, user_id) for user_id in (1, 2, 3, 4))
+        )
+
+    assert asyncio.run(scenario()) == [True, True, False, False]
+    assert bot.calls == [-100]
+
+    now[0] = 61.0
+    assert asyncio.run(cache.is_admin(bot, -100, 3)) is False
+    assert bot.calls == [-100, -100]
+
+
+def test_chat_admin_cache_evicts_least_recently_used_chat():
+    cache = telegram_utils.ChatAdminCache(max_chats=2)
+    bot = _FakeAdminBot({-1: [(1, "creator")], -2: [(2, "creator")], -3: [(3, "creator")]})
+
+    async def scenario():
+        await cache.is_admin(bot, -1, 1)
+        await cache.is_admin(bot, -2, 2)
+        await cache.is_admin(bot, -1, 1)
+        await cache.is_admin(bot, -3, 3)
+        await cache.is_admin(bot, -1, 1)
+        await cache.is_admin(bot, -2, 2)
+
+    asyncio.run(scenario())
+
+    assert len(cache) == 2
+    assert bot.calls == [-1, -2, -3, -2]
+
+
+def test_chat_admin_cache_drops_chat_when_admin_status_changes():
+    cache = telegram_utils.ChatAdminCache()
+    bot = _FakeAdminBot({-100: [(1, "creator")]})
+
+    assert asyncio.run(cache.is_admin(bot, -100, 2)) is False
+    assert cache.apply_member_update(_member_update(-100, "member", "left")) is False
+
+    bot.admins[-100].append((2, "administrator"))
+    assert cache.apply_member_update(_member_update(-100, "member", "administrator")) is True
+    assert asyncio.run(cache.is_admin(bot, -100, 2)) is True
+    assert bot.calls == [-100, -100]
@@ -0,0 +1,85 @@
+import asyncio
+
+from core import process_user, user_records
+from features.ai import user_state
+
+
+class _FakeConnection:
+    def __init__(self):
+        self.statements = []
+
+    async def exec_driver_sql(self, sql, params=None):
+        self.statements.append((sql, params))
+
+
+def _patch_fetch_one(monkeypatch, row):
+    queries = []
+
+    async def fake_fetch_one(sql, params=None, *, connection=None):
+        queries.append((sql, params, connection))
+        return row
+
+    monkeypatch.setattr(user_records, "fetch_one", fake_fetch_one)
+    return queries
+
+
+def test_load_user_turn_context_reads_everything_in_one_query(monkeypatch):
+    queries = _patch_fetch_one(monkeypatch, ("user", 3, 10, "likes cats", "friendly", 1))
+    connection = object()
+
+    context = asyncio.run(
+        user_records.load_user_turn_context(42, connection=connection, for_update=True)
+    )
+
+    assert len(queries) == 1
+    sql, params, used_connection = queries[0]
+    assert "ai_user_affection" in sql and "ai_user_diary_pages" in sql
+    assert sql.endswith("FOR UPDATE OF u")
+    assert params == (42,) and used_connection is connection
+    assert context.total_coins == 13
+    assert context.plan == user_records.USER_PLAN_PAID
+    assert context.impression == "friendly" and context.has_diary is True
+
+
+def test_load_user_turn_context_returns_none_for_unknown_user(monkeypatch):
+    _patch_fetch_one(monkeypatch, None)
+
+    assert asyncio.run(user_records.load_user_turn_context(42)) is None
+
+
+def test_spend_coins_from_context_uses_free_coins_first_without_reselect(monkeypatch):
+    async def unexpected_fetch_one(*args, **kwargs):
+        raise AssertionError("不应再查询余额")
+
+    monkeypatch.setattr(process_user.mysql_connection, "fetch_one", unexpected_fetch_one)
+    context = user_records.UserTurnContext(
+        user_id=42,
+        permission="user",
+        coins_free=2,
+        coins_paid=5,
+        info="",
+        impression="",
+        has_diary=False,
+    )
+    connection = _FakeConnection()
+
+    spent = asyncio.run(process_user.spend_coins_from_context(context, 4, connection=connection))
+
+    assert (spent.coins_free, spent.coins_paid, spent.total_coins) == (0, 3, 3)
+    assert connection.statements == [
+        (
+            "UPDATE user SET coins = %s, coins_paid = %s, user_plan = %s WHERE id = %s",
+            (0, 3, user_records.USER_PLAN_PAID, 42),
+        )
+    ]
+    assert context.coins_free == 2  # 原快照不变
+
+
+def test_build_user_state_prompt_uses_single_query(monkeypatch):
+    queries = _patch_fetch_one(monkeypatch, ("user", 5, 0, "", "line1\nline2", 0))
+
+    prompt = asyncio.run(user_state.build_user_state_prompt(42))
+
+    assert len(queries) == 1
+    assert "line1 line2" in prompt
+    assert "free" in prompt
@@ -0,0 +1,202 @@
+import asyncio
+
+from core import process_user, user_profile_cache as cache_module
+from core.user_profile_cache import FIELD_COINS, UserProfileCache, user_profile_cache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _count_queries(monkeypatch, row):
+    queries = []
+
+    async def fake_fetch_one(sql, params=None, *, connection=None):
+        queries.append((sql, connection))
+        return row
+
+    monkeypatch.setattr(process_user.mysql_connection, "fetch_one", fake_fetch_one)
+    return queries
+
+
+def test_cache_hits_until_ttl_and_evicts_least_recent_user():
+    clock = _Clock()
+    cache = UserProfileCache(ttl_seconds=10, max_users=2, clock=clock)
+    loads = []
+
+    async def load(user_id):
+        loads.append(user_id)
+        return user_id * 10
+
+    async def scenario():
+        for user_id in (1, 1, 2, 1, 3, 2):
+            await cache.get_or_load(user_id, "permission", lambda u=user_id: load(u))
+        clock.now = 11
+        await cache.get_or_load(1, "permission", lambda: load(1))
+
+    asyncio.run(scenario())
+
+    # 3 进来时挤掉最久未用的 2；过期后 1 重新查库
+    assert loads == [1, 2, 3, 2, 1]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 5
+
+
+def test_invalidation_during_load_discards_loaded_value():
+    cache = UserProfileCache(ttl_seconds=10)
+    release = asyncio.Event()
+
+    async def slow_load():
+        await release.wait()
+        return "old"
+
+    async def scenario():
+        task = asyncio.create_task(cache.get_or_load(1, "impression", slow_load))
+        await asyncio.sleep(0)
+        cache.invalidate(1, "impression")
+        release.set()
+        assert await task == "old"
+        return await cache.get_or_load(1, "impression", lambda: asyncio.sleep(0, "new"))
+
+    assert asyncio.run(scenario()) == "new"
+
+
+def test_process_user_reads_are_cached_and_writes_invalidate(monkeypatch):
+    monkeypatch.setattr(cache_module.config, "USER_PROFILE_CACHE_TTL_SECONDS", 300)
+    queries = _count_queries(monkeypatch, (2,))
+    executed = []
+
+    async def fake_execute(sql, params=None, *, connection=None):
+        executed.append(params)
+        return 1
+
+    monkeypatch.setattr(process_user.mysql_connection, "execute", fake_execute)
+
+    async def scenario():
+        first = await process_user.get_user_permission(42)
+        second = await process_user.async_get_user_permission(42)
+        await process_user.set_user_permission(42, 3)
+        third = await process_user.get_user_permission(42)
+        return first, second, third
+
+    assert asyncio.run(scenario()) == (2, 2, 2)
+    assert len(queries) == 2
+    assert executed == [(3, 42)]
+
+
+def test_coin_reads_inside_transactions_bypass_cache(monkeypatch):
+    monkeypatch.setattr(cache_module.config, "USER_PROFILE_CACHE_TTL_SECONDS", 300)
+    queries = _count_queries(monkeypatch, (5, 1))
+    connection = object()
+
+    async def scenario():
+        await process_user.get_user_coins(42)
+        await process_user.get_user_coins(42)
+        return await process_user.get_user_coin_balances(42, connection=connection)
+
+    assert asyncio.run(scenario()) == (5, 1)
+    assert [used for _sql, used in queries] == [None, connection]
+    assert user_profile_cache.stats()["hits"] == 1
+
+
+def test_user_exists_only_caches_registered_users(monkeypatch):
+    monkeypatch.setattr(cache_module.config, "USER_PROFILE_CACHE_TTL_SECONDS", 300)
+    queries = _count_queries(monkeypatch, None)
+
+    async def scenario():
+        return [await process_user.user_exists(7), await process_user.user_exists(7)]
+
+    assert asyncio.run(scenario()) == [False, False]
+    assert len(queries) == 2
+
+
+def test_zero_ttl_disables_cache():
+    cache = UserProfileCache(ttl_seconds=0)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        return 1
+
+    async def scenario():
+        await cache.get_or_load(1, FIELD_COINS, load)
+        await cache.get_or_load(1, FIELD_COINS, load)
+
+    asyncio.run(scenario())
+
+    assert len(loads) == 2 and len(cache) == 0
+
+
+def test_remote_invalidation_drops_the_whole_bucket():
+    cache = cache_module.user_profile_cache
+    buckets = cache_module.USER_PROFILE_PUBLISH_BUCKETS
+    loads = []
+
+    async def load_for(user_id):
+        loads.append(user_id)
+        return user_id
+
+    async def scenario():
+        for user_id in (5, 5 + buckets, 6):
+            await cache.get_or_load(user_id, "impression", lambda u=user_id: load_for(u))
+        cache_module._on_remote_invalidation("5")
+        for user_id in (5, 5 + buckets, 6):
+            await cache.get_or_load(user_id, "impression", lambda u=user_id: load_for(u))
+
+    asyncio.run(scenario())
+
+    assert loads == [5, 5 + buckets, 6, 5, 5 + buckets]
+
+
+def test_invalidation_and_publish_wait_until_commit_returns(monkeypatch):
+    from contextlib import asynccontextmanager
+
+    from core import db
+
+    monkeypatch.setattr(cache_module.config, "USER_PROFILE_CACHE_TTL_SECONDS", 300)
+    monkeypatch.setattr(cache_module.config, "CACHE_INVALIDATION_POLL_SECONDS", 5)
+    published = []
+
+    async def fake_publish(topic, key=None, *, notify_local=True):
+        published.append((topic, key, notify_local))
+
+    class FakeEngine:
+        @asynccontextmanager
+        async def begin(self):
+            yield object()
+            await asyncio.sleep(0)  # 驱动在这里等 COMMIT 返回
+
+    monkeypatch.setattr(cache_module.cache_invalidation, "publish", fake_publish)
+    monkeypatch.setattr(db, "get_engine", FakeEngine)
+    buckets = cache_module.USER_PROFILE_PUBLISH_BUCKETS
+    user_id = buckets + 3
+
+    async def load():
+        return "old"
+
+    async def scenario():
+        async with db.transaction() as connection:
+            await cache_module.invalidate_user_after_write(
+                user_id, "impression", connection=connection
+            )
+            # 提交返回前读到的旧值可以被缓存，但提交后必须被丢掉
+            await user_profile_cache.get_or_load(user_id, "impression", load)
+        assert published == []
+        await asyncio.sleep(0)
+        await cache_module.invalidate_user_after_write(7, FIELD_COINS)
+        with_rollback = False
+        try:
+            async with db.transaction() as connection:
+                await cache_module.invalidate_user_after_write(9, connection=connection)
+                raise RuntimeError("rollback")
+        except RuntimeError:
+            with_rollback = True
+        await asyncio.sleep(0)
+        return with_rollback
+
+    assert asyncio.run(scenario())
+    assert published == [("user_profile", 3, False), ("user_profile", 7, False)]
+    assert user_profile_cache._lookup(user_id, "impression") == (False, None)
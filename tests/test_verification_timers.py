@@ -0,0 +1,131 @@
+import asyncio
+from datetime import datetime
+
+from core.expiry_wheel import ExpiryWheel
+from features.moderation import verification_timers
+from features.moderation.verification_timers import VerificationQueue
+
+
+def test_expiry_wheel_pops_only_due_keys_and_honours_reschedule():
+    wheel = ExpiryWheel(tick_seconds=1.0)
+    wheel.schedule("a", 10.2)
+    wheel.schedule("b", 10.8)
+    wheel.schedule("c", 12.0)
+    wheel.schedule("a", 15.0)
+
+    assert wheel.pop_due(10.5) == []
+    assert wheel.pop_due(10.9) == ["b"]
+    assert wheel.discard("c") is True
+    assert wheel.pop_due(14.0) == []
+    assert wheel.pop_due(15.0) == ["a"]
+    assert len(wheel) == 0
+
+
+def test_queue_coalesces_db_writes_between_flushes():
+    now = [1000.0]
+    queue = VerificationQueue(clock=lambda: now[0])
+
+    queue.add(-100, 1, 11)
+    queue.add(-100, 2, 12)
+    queue.add(-100, 1, 13)
+    assert queue.remove(-100, 2) == 12
+    assert queue.remove(-100, 2) is None
+
+    upserts, deletes = queue.drain_writes()
+    assert upserts == [(1, -100, 13, datetime.fromtimestamp(1300.0))]
+    assert deletes == [(2, -100)]
+    assert queue.drain_writes() == ([], [])
+
+
+def test_restored_rows_expire_in_one_batch_with_bounded_concurrency(monkeypatch):
+    now = [1000.0]
+    queue = VerificationQueue(clock=lambda: now[0])
+    queue.restore(
+        [
+            (user_id, -100, 500 + user_id, datetime.fromtimestamp(900.0 + user_id))
+            for user_id in range(1, 21)
+        ]
+        + [(99, -100, 599, datetime.fromtimestamp(2000.0))]
+    )
+    monkeypatch.setattr(verification_timers, "verification_queue", queue)
+    monkeypatch.setattr(verification_timers, "VERIFY_ACTION_CONCURRENCY", 3)
+
+    class FakeBot:
+        def __init__(self):
+            self.active = 0
+            self.peak = 0
+            self.calls = []
+
+        async def _call(self, name, *args):
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+            await asyncio.sleep(0)
+            self.calls.append((name, *args))
+            self.active -= 1
+
+        async def ban_chat_member(self, chat_id, user_id):
+            await self._call("ban", user_id)
+
+        async def unban_chat_member(self, chat_id, user_id):
+            await self._call("unban", user_id)
+
+        async def edit_message_text(self, chat_id, message_id, text):
+            await self._call("edit", message_id)
+
+    bot = FakeBot()
+
+    assert asyncio.run(verification_timers.process_expired_verifications(bot)) == 20
+    assert bot.peak <= 3
+    assert sum(1 for call in bot.calls if call[0] == "ban") == 20
+    assert queue.get(-100, 99) == 599
+    upserts, deletes = queue.drain_writes()
+    assert upserts == []
+    assert sorted(deletes) == [(user_id, -100) for user_id in range(1, 21)]
+
+
+def test_flush_issues_one_bulk_delete_and_one_bulk_insert(monkeypatch):
+    queue = VerificationQueue(clock=lambda: 1000.0)
+    for user_id in range(3):
+        queue.add(-100, user_id, 10 + user_id)
+    queue.remove(-100, 0)
+    monkeypatch.setattr(verification_timers, "verification_queue", queue)
+    statements = []
+
+    class FakeTransaction:
+        async def __aenter__(self):
+            return "conn"
+
+        async def __aexit__(self, *exc):
+            return False
+
+    async def fake_execute(sql, params, connection=None):
+        statements.append((sql.split()[0], len(params)))
+        return len(params)
+
+    monkeypatch.setattr(verification_timers.mysql_connection, "transaction", FakeTransaction)
+    monkeypatch.setattr(verification_timers.mysql_connection, "execute", fake_execute)
+
+    asyncio.run(verification_timers.flush_verification_writes())
+
+    assert statements == [("DELETE", 2), ("INSERT", 8)]
+
+
+def test_restart_rebuilds_shared_messages_from_restored_rows():
+    now = [1000.0]
+    queue = VerificationQueue(clock=lambda: now[0])
+    expire_time = datetime.fromtimestamp(1300.0)
+    queue.restore(
+        [
+            (1, -100, 77, expire_time),
+            (2, -100, 77, expire_time),
+            (3, -100, 78, expire_time),
+        ]
+    )
+
+    assert queue.is_shared(-100, 77)
+    assert not queue.is_shared(-100, 78)
+
+    queue.remove(-100, 1)
+    assert queue.drain_finished_shared() == []
+    queue.remove(-100, 2)
+    assert queue.drain_finished_shared() == [(-100, 77)]
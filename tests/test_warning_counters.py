@@ -0,0 +1,107 @@
+import asyncio
+
+from features.moderation import spam_control, warning_counters
+from features.moderation.warning_counters import WarningCounters
+
+
+def _counters(now, **kwargs):
+    return WarningCounters(window_seconds=600, bucket_count=6, clock=lambda: now[0], **kwargs)
+
+
+def test_counts_decay_as_buckets_leave_the_window():
+    now = [0.0]
+    counters = _counters(now)
+
+    assert [counters.record(-100, 1) for _ in range(3)] == [1, 2, 3]
+    now[0] = 300.0
+    assert counters.record(-100, 1) == 4
+    now[0] = 650.0
+    assert counters.count(-100, 1) == 1
+    now[0] = 1000.0
+    assert counters.count(-100, 1) == 0
+    assert counters.prune() == 1
+    assert len(counters) == 0
+
+
+def test_per_chat_cap_evicts_least_recently_warned_user():
+    now = [0.0]
+    counters = _counters(now, max_users_per_chat=2)
+
+    counters.record(-100, 1)
+    counters.record(-100, 2)
+    counters.record(-100, 1)
+    counters.record(-100, 3)
+    counters.record(-200, 2)
+
+    assert counters.count(-100, 2) == 0
+    assert counters.count(-100, 1) == 2
+    assert counters.count(-200, 2) == 1
+    assert len(counters) == 3
+
+
+def test_changes_drain_for_persistence_and_load_merges():
+    now = [0.0]
+    counters = _counters(now)
+    counters.record(-100, 1)
+    counters.record(-100, 2)
+    counters.reset(-100, 2)
+
+    upserts, deletes = counters.drain_changes()
+    assert upserts == [(-100, 1, ((0, 1),))]
+    assert deletes == [(-100, 2)]
+    assert counters.drain_changes() == ([], [])
+
+    restored = _counters(now)
+    restored.record(-100, 1)
+    restored.load([(-100, 1, [[0, 1]]), (-100, 3, [[-10, 4]])])
+    assert restored.count(-100, 1) == 2
+    assert restored.count(-100, 3) == 0
+
+
+def test_escalation_restricts_once_at_threshold_and_resets(monkeypatch):
+    class FakeBot:
+        def __init__(self):
+            self.restricted = []
+
+        async def restrict_chat_member(self, chat_id, user_id, **kwargs):
+            self.restricted.append((chat_id, user_id, kwargs["permissions"].can_send_messages))
+
+    bot = FakeBot()
+    monkeypatch.setattr(spam_control.config, "SPAM_WARNING_RESTRICT_THRESHOLD", 3)
+    monkeypatch.setattr(spam_control.config, "SPAM_WARNING_RESTRICT_MINUTES", 10)
+    monkeypatch.setattr(warning_counters, "warning_counters", WarningCounters())
+    monkeypatch.setattr(spam_control, "warning_counters", warning_counters.warning_counters)
+
+    notes = []
+    for _ in range(4):
+        count = spam_control.update_warning_count(-100, 7)
+        notes.append(asyncio.run(spam_control.escalate_warning(bot, -100, 7, count)))
+
+    assert notes[:2] == ["", ""]
+    assert "禁言 10 分钟" in notes[2]
+    assert notes[3] == ""
+    assert bot.restricted == [(-100, 7, False)]
+
+
+def test_failed_escalation_also_resets_the_count(monkeypatch):
+    class FailingBot:
+        def __init__(self):
+            self.attempts = 0
+
+        async def restrict_chat_member(self, chat_id, user_id, **kwargs):
+            self.attempts += 1
+            raise RuntimeError("not enough rights")
+
+    bot = FailingBot()
+    monkeypatch.setattr(spam_control.config, "SPAM_WARNING_RESTRICT_THRESHOLD", 3)
+    monkeypatch.setattr(warning_counters, "warning_counters", WarningCounters())
+    monkeypatch.setattr(spam_control, "warning_counters", warning_counters.warning_counters)
+
+    notes = []
+    for _ in range(5):
+        count = spam_control.update_warning_count(-100, 7)
+        notes.append(asyncio.run(spam_control.escalate_warning(bot, -100, 7, count)))
+
+    assert notes == [""] * 5
+    assert bot.attempts == 1
+    assert warning_counters.warning_counters.count(-100, 7) == 2
@@ -0,0 +1,234 @@
+import asyncio
+import queue
+
+from app.webhook_ingress import SECRET_TOKEN_HEADER, UpdateRouter, serve_updates
+from core import update_routing
+from features.moderation import verification_timers
+
+
+def _message(update_id, chat_id, chat_type, user_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": chat_id, "type": chat_type},
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "text": str(update_id),
+        },
+    }
+
+
+def test_routing_key_uses_user_for_private_and_chat_for_groups():
+    assert update_routing.routing_key(_message(1, 42, "private", 42)) == 42
+    assert update_routing.routing_key(_message(2, -1001, "supergroup", 42)) == -1001
+    callback = {
+        "update_id": 3,
+        "callback_query": {
+            "id": "q",
+            "from": {"id": 7},
+            "message": {"message_id": 5, "chat": {"id": -1001, "type": "group"}},
+        },
+    }
+    assert update_routing.routing_key(callback) == -1001
+    inline = {"update_id": 4, "inline_query": {"id": "q", "from": {"id": 9}, "query": ""}}
+    assert update_routing.routing_key(inline) == 9
+    assert update_routing.routing_key({"update_id": 5, "poll": {"id": "p"}}) == 0
+
+
+def test_router_keeps_each_conversation_on_one_worker_in_order():
+    queues = [queue.Queue() for _ in range(3)]
+    router = UpdateRouter(queues)
+    updates = [
+        _message(1, -1001, "supergroup", 10),
+        _message(2, 11, "private", 11),
+        _message(3, -1001, "supergroup", 11),
+        _message(4, 11, "private", 11),
+    ]
+
+    indexes = [router.dispatch(update) for update in updates]
+
+    assert indexes[0] == indexes[2] == -1001 % 3
+    assert indexes[1] == indexes[3] == 11 % 3 != indexes[0]
+    group_queue = queues[-1001 % 3]
+    assert [group_queue.get_nowait()["update_id"] for _ in range(2)] == [1, 3]
+
+
+def test_router_rejects_bad_secret_and_unavailable_workers():
+    full = queue.Queue(maxsize=1)
+    full.put_nowait({})
+    router = UpdateRouter([queue.Queue(), full], secret_token="s3cret", is_alive=lambda i: i != 0)
+
+    assert router.authorized({SECRET_TOKEN_HEADER: "s3cret"}) is True
+    assert router.authorized({SECRET_TOKEN_HEADER: "wrong"}) is False
+    assert router.authorized({}) is False
+    assert router.dispatch(_message(1, 2, "private", 2)) is None  # 0 号进程不在了
+    assert router.dispatch(_message(2, 3, "private", 3)) is None  # 1 号队列已满
+
+
+def test_worker_filters_restored_verifications_to_owned_chats(monkeypatch):
+    async def fake_fetch_all(sql, params=None):
+        return [(1, -3, 11, None), (2, -4, 12, None)]
+
+    restored = []
+    monkeypatch.setattr(verification_timers.mysql_connection, "fetch_all", fake_fetch_all)
+    monkeypatch.setattr(
+        verification_timers.verification_queue, "restore", lambda rows: restored.extend(rows)
+    )
+    monkeypatch.setattr(update_routing, "WORKER_INDEX", 0)
+    monkeypatch.setattr(update_routing, "WORKER_COUNT", 2)
+    monkeypatch.setattr(verification_timers.verification_queue, "restored", False)
+
+    asyncio.run(verification_timers.restore_verification_tasks())
+
+    assert restored == [(2, -4, 12, None)]
+    assert update_routing.owner_filter_sql("user_id") == (" AND MOD(user_id, %s) = %s", (2, 0))
+
+
+class _FakeApplication:
+    def __init__(self):
+        self.bot = None
+        self.update_queue = asyncio.Queue()
+        self.running = False
+        self.calls = []
+        self.post_init = self._hook("post_init")
+        self.post_stop = self._hook("post_stop")
+        self.post_shutdown = None
+
+    def _hook(self, name):
+        async def hook(application):
+            self.calls.append(name)
+
+        return hook
+
+    async def initialize(self):
+        self.calls.append("initialize")
+
+    async def start(self):
+        self.running = True
+        self.calls.append("start")
+
+    async def stop(self):
+        self.running = False
+        self.calls.append("stop")
+
+    async def shutdown(self):
+        self.calls.append("shutdown")
+
+
+def test_worker_feeds_updates_in_order_and_runs_stop_hooks():
+    application = _FakeApplication()
+    updates = queue.Queue()
+    for update_id in (1, 2, 3):
+        updates.put(_message(update_id, 10, "private", 10))
+    updates.put(None)
+
+    asyncio.run(serve_updates(application, updates))
+
+    received = [application.update_queue.get_nowait().update_id for _ in range(3)]
+    assert received == [1, 2, 3]
+    assert application.calls == [
+        "initialize",
+        "post_init",
+        "start",
+        "stop",
+        "post_stop",
+        "shutdown",
+    ]
+
+
+def test_worker_skips_malformed_updates_and_still_stops():
+    application = _FakeApplication()
+    updates = queue.Queue()
+    updates.put(_message(1, 10, "private", 10))
+    updates.put({"update_id": 2, "message": {"message_id": 2}})
+    updates.put(_message(3, 10, "private", 10))
+    updates.put(None)
+
+    asyncio.run(asyncio.wait_for(serve_updates(application, updates), timeout=5))
+
+    received = [application.update_queue.get_nowait().update_id for _ in range(2)]
+    assert received == [1, 3]
+    assert application.update_queue.empty()
+    assert application.calls[-3:] == ["stop", "post_stop", "shutdown"]
+
+
+def _fake_lock_engine(monkeypatch, statements, grants):
+    from contextlib import asynccontextmanager
+
+    from features.ai import conversation_locks
+
+    class _Result:
+        def __init__(self, value):
+            self._value = value
+
+        def fetchone(self):
+            return (self._value,)
+
+    class _Connection:
+        async def exec_driver_sql(self, sql, params=None):
+            statements.append((sql, params))
+            return _Result(next(grants) if sql.startswith("SELECT GET_LOCK") else 1)
+
+    class _Engine:
+        @asynccontextmanager
+        async def connect(self):
+            yield _Connection()
+
+    monkeypatch.setattr(conversation_locks.db, "get_lock_engine", _Engine)
+    monkeypatch.setattr(conversation_locks, "_db_lock_slots", None)
+    return conversation_locks
+
+
+def test_conversation_lock_takes_named_db_lock_only_with_several_workers(monkeypatch):
+    statements = []
+    conversation_locks = _fake_lock_engine(monkeypatch, statements, iter([0, 1]))
+
+    async def run_turn():
+        async with conversation_locks.get_conversation_lock(42):
+            statements.append("turn")
+
+    asyncio.run(run_turn())
+    assert statements == ["turn"]
+
+    statements.clear()
+    monkeypatch.setattr(update_routing, "WORKER_COUNT", 2)
+    asyncio.run(run_turn())
+
+    name = "fogmoe:conversation:42"
+    assert statements == [
+        ("SELECT GET_LOCK(%s, %s)", (name, conversation_locks.CONVERSATION_DB_LOCK_POLL_SECONDS)),
+        ("SELECT GET_LOCK(%s, %s)", (name, conversation_locks.CONVERSATION_DB_LOCK_POLL_SECONDS)),
+        "turn",
+        ("SELECT RELEASE_LOCK(%s)", (name,)),
+    ]
+    assert len(conversation_locks._CONVERSATION_LOCKS) == 0
+
+
+def test_db_lock_connections_are_bounded_per_worker(monkeypatch):
+    statements = []
+    conversation_locks = _fake_lock_engine(monkeypatch, statements, iter([1] * 10))
+    monkeypatch.setattr(update_routing, "WORKER_COUNT", 2)
+    monkeypatch.setattr(conversation_locks.config, "TELEGRAM_WEBHOOK_LOCK_CONNECTIONS", 1)
+    release_first = None
+
+    async def turn(user_id, hold):
+        async with conversation_locks.get_conversation_lock(user_id):
+            statements.append(("turn", user_id))
+            if hold is not None:
+                await hold.wait()
+
+    async def scenario():
+        nonlocal release_first
+        release_first = asyncio.Event()
+        first = asyncio.create_task(turn(1, release_first))
+        second = asyncio.create_task(turn(2, None))
+        for _ in range(5):
+            await asyncio.sleep(0)
+        assert ("turn", 2) not in statements  # 唯一的锁连接还被第一轮占着
+        release_first.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(scenario())
+    turns = [entry for entry in statements if entry[0] == "turn"]
+    assert turns == [("turn", 1), ("turn", 2)]